@@ -18,13 +18,30 @@ import argparse
 from math import sqrt, pow
 import statistics
 import numpy as np
-from sklearn.decomposition import PCA
-from scipy.spatial.transform import Rotation
 from math import sqrt
 from Bio import Align
-from Bio.Align import substitution_matrices
 import Bio.PDB
 import os
+import zipfile
+try:  # Imported as part of the web app
+    from PDBS.structure import parse_pdb, file_key, read_header, parse_header, open_pdb, pdb_suffix, PDB_ENDINGS, \
+        line_columns
+    from PDBS.selection import Context, select_mask, compile_selection
+    from PDBS.edit_session import EditSession
+    from PDBS import sasa, clash, docking, references, complexes, germline, structure_cache, cif
+except ImportError:  # Ran as a script from within PDBS/
+    from structure import parse_pdb, file_key, read_header, parse_header, open_pdb, pdb_suffix, PDB_ENDINGS, \
+        line_columns
+    from selection import Context, select_mask, compile_selection
+    from edit_session import EditSession
+    import sasa
+    import clash
+    import docking
+    import references
+    import complexes
+    import germline
+    import structure_cache
+    import cif
 
 #################
 #     Global    #
@@ -38,6 +55,10 @@ POSRES = [17, 20]
 POSSEQ = [22, 26]
 POSCHAIN = 21
 ChainID = 11
+# Roles of complexes.find_complexes() written to each component by split_components()
+COMPONENTS = {'TCR': ('ALPHA', 'BETA'), 'MHC': ('MHC', 'MHC2'), 'PEPTIDE': ('PEPTIDE',),
+              'PMHC': ('MHC', 'MHC2', 'PEPTIDE')}
+CDR_LOOPS = ('CDR1', 'CDR2', 'CDR2.5', 'CDR3')  # Slots of each chain returned by pull_cdr()
 
 
 #################
@@ -45,7 +66,7 @@ ChainID = 11
 #################
 class PdbTools3:
     # initialize PdbTools
-    def __init__(self, file="..."):
+    def __init__(self, file="...", store=None, compress=None):
         """
         Initialize PdbTools
 
@@ -53,9 +74,23 @@ class PdbTools3:
         __________
         file : str
             PDB file in use
+        store : AtomStore
+            Optional atom store of the library (see atom_store.py), structures are taken from it instead of parsing
+            the file while the stored copy is current
+        compress : boolean
+            Write PDB files named by PdbTools3 gzip compressed (True) or plain (False). By default they follow the
+            file in use. Names given by the caller are compressed when they end with .gz
         """
         self.file_name = file
+        self.store = store
+        self.compress = compress
         self.test_list = {}
+        self._structure = None
+        self._structure_key = None
+        self._derived = None
+        self._header = None
+        self._header_key = None
+        self._context = None
 
     def set_file_name(self, file_name_in):
         """
@@ -81,17 +116,125 @@ class PdbTools3:
         """
         return self.file_name
 
+    def output_suffix(self):
+        """
+        Returns the ending of PDB files named by PdbTools3, '.pdb' or '.pdb.gz'
+
+        Returns
+        _______
+        suffix : str
+        """
+        if self.compress is None:
+            return pdb_suffix(self.file_name)
+        return '.pdb.gz' if self.compress else '.pdb'
+
+    def get_structure(self):
+        """
+        Returns the atoms of the PDB file in use as a column oriented Structure. The parsed structure is kept until
+        the file changes on disk. Files held by the atom store are mapped from it, others from the structure cache
+        along with their derived values (chain sequences and TCR roles)
+
+        Returns
+        _______
+        structure : Structure
+        """
+        key = file_key(self.file_name)
+        if self._structure_key != key:
+            stored = self.store.current(self.file_name) if self.store is not None else None
+            if stored:
+                self._structure, self._derived = self.store.structure(stored), None
+            else:
+                self._structure, self._derived = structure_cache.load(self.file_name)
+            self._structure_key = key
+        return self._structure
+
+    def selection_context(self):
+        """
+        Returns the chain roles and loops of the file in use for selections (see selection.Context), kept with the
+        parsed structure
+        """
+        structure = self.get_structure()
+        if self._context is None or self._context.structure is not structure:
+            self._context = Context(structure)
+        return self._context
+
+    def select_atoms(self, selection):
+        """
+        Mask of the atoms of get_structure() matched by a selection, ex. 'cdr3b and name CA' or
+        'chain D and resi 1-10'. See selection.compile_selection() for the language
+
+        Parameters
+        ----------
+        selection : str
+
+        Returns
+        -------
+        mask : np.ndarray
+        """
+        return select_mask(self.get_structure(), selection, self.selection_context())
+
+    def select_lines(self, lines, selection, records=('ATOM  ', 'TER   ')):
+        """
+        Mask of the lines of a PDB file matched by a selection, only lines of the given records can be selected
+
+        Parameters
+        ----------
+        lines : list
+        selection : str
+        records : tuple
+            Six character record names, ex. 'DEATOM'
+
+        Returns
+        -------
+        mask : np.ndarray
+        """
+        rows = [pos for pos, line in enumerate(lines) if line[0:6] in records]
+        table = line_columns([lines[pos] for pos in rows])
+        context = self.selection_context() if compile_selection(selection).needs_context else None
+        mask = np.zeros(len(lines), dtype=bool)
+        mask[rows] = select_mask(table, selection, context)
+        return mask
+
+    def edit(self):
+        """
+        Start an edit session of the file in use: mutes, removals, trims, relabels and reorders are kept in memory
+        (with undo) and written with one write when the session is committed. See edit_session.EditSession
+
+        Returns
+        -------
+        session : EditSession
+        """
+        return EditSession(self.file_name, self.selection_context)
+
+    def get_header(self):
+        """
+        Returns the metadata found in the header of the PDB file in use, see structure.parse_header(). Only the lines
+        before the first atom are read and the result is kept until the file changes on disk
+
+        Returns
+        _______
+        header : dict
+        """
+        key = file_key(self.file_name)
+        if self._header_key != key:
+            if self._structure_key == key:
+                self._header = parse_header(self._structure.header)
+            elif self.file_name.lower().endswith(cif.CIF_ENDINGS + cif.BCIF_ENDINGS):  # No PDB header records
+                self._header = parse_header([])
+            else:
+                self._header = parse_header(read_header(self.file_name))
+            self._header_key = key
+        return self._header
+
     def get_pdb_id(self):
         """
         Returns the PDB ID of file
 
         Returns
         _______
-        PDB id based on the text in the header of PDB
+        PDB id based on the text in the header of PDB, the file name when the file has no HEADER record
         """
-        with open(self.file_name, 'r') as file:
-            output = file.readline()
-            return output[62:66].lower()
+        return self.get_header()['pdb'] or os.path.basename(self.file_name).split('.')[0]
 
     # Returns a list of all chains in PDB file
     def get_chains(self):
@@ -104,7 +247,7 @@ class PdbTools3:
             List of chains contained in PDB file
         """
         chains = []
-        with open(self.file_name, 'r') as file:
+        with open_pdb(self.file_name, 'r') as file:
             for line in file:
                 if line[0:6] == 'ATOM  ':
                     if not chains.__contains__(line[21]):
@@ -118,21 +261,9 @@ class PdbTools3:
         Returns
         -------
         output : float
-            Resolution of file if contained in PDB file
+            Resolution of file if contained in PDB file, otherwise None
         """
-        value = ''
-        with open(self.file_name, 'r') as file:
-            flag = False
-            for line in file:
-                if line[0:6] == 'REMARK' and not flag:
-                    temp = line[6:10]
-                    if temp == '   2':
-                        flag = True
-                elif line[0:6] == 'REMARK' and flag:
-                    value += line[26:29]
-                    break
-        output = float(value)
-        return output
+        return self.get_header()['resolution']
 
     def get_amino_acid_on_chain(self, chain):
         """
@@ -150,7 +281,7 @@ class PdbTools3:
         output = ''
         count = 0
         flag = True
-        with open(self.file_name, 'r') as file:
+        with open_pdb(self.file_name, 'r') as file:
             for line in file:
                 if line[0:6] == 'ATOM  ':
                     if line[21] == chain:
@@ -178,7 +309,7 @@ class PdbTools3:
         atom : dict
             Contains elements of the first atom in a chain
         """
-        with open(self.file_name, 'r') as file:
+        with open_pdb(self.file_name, 'r') as file:
             for line in file:
                 if line[0:6] == 'ATOM  ':
                     if line[21] == chain.upper() and len(line) >= 76:
@@ -232,7 +363,7 @@ class PdbTools3:
         atom : dict
             Dictionary containing information for atom from PDB file
         """
-        with open(self.file_name, 'r') as file:
+        with open_pdb(self.file_name, 'r') as file:
             for line in file:
                 if line[0:6] == 'ATOM  ':
                     if int(line[6:11]) == atom_num and len(line) >= 76:
@@ -284,7 +415,7 @@ class PdbTools3:
             List of atoms based on the chain submitted
         """
         atoms = []
-        with open(self.file_name, 'r') as file:
+        with open_pdb(self.file_name, 'r') as file:
             for line in file:
                 if line[0:6] == 'ATOM  ':
                     if line[21] == chain and len(line) >= 76:
@@ -329,50 +460,22 @@ class PdbTools3:
 
     def get_tcr_chains(self):
         """
-        Returns alpha and beta chain IDs based on seq. alignment to 1a07 PDB entry chains. Confirms that it is a
-        partnering TCR chain
+        Returns the alpha and beta chain IDs of the first TCR in the file (ATOM records), see complexes.tcr_chains().
+        Files read through the structure cache reuse the roles stored there (filled by prefetch), only files of the
+        atom store are searched again. Raises ValueError when the file holds no TCR pair
 
         Returns
         -------
-        result : str
+        result : dict
+            'ALPHA' and 'BETA' chain IDs
         """
-        aligner = Align.PairwiseAligner()
-        aligner.mode = 'global'
-        aligner.substitution_matrix = substitution_matrices.load('BLOSUM62')
-        aligner.target_end_gap_score = 0.0
-        aligner.query_end_gap_score = 0.0
-        result = {}
-        # Hard coded peptide chains for alpha and beta elements of the TCR_file
-        alpha_chain = [
-            'KEVEQNSGPLSVPEGAIASLNCTYSDRGSQSFFTYRQYSGKSPELIMSIYSNGDKEDGRFTAQLNKASQYVSLLIRDSQPSDSATYLCAVTTDSTGKLQFGAGT'\
-            'QVVVTPDIQNPDPAVYQLRDSKSSDKSVCLFTDFDSQTNVSQSKDSDVYITDKTVLDMRSMDFKSNSAVATSNKSDFACANAFNNSIIPEDTFFPSPESS',
-            'QKVTQTQTSISVMEKTTVTMDCVYETQDSSYFLFTYKQTASGEIVFLIRQDSYKKENATVGHYSLNFQKPKSSIGLIITATQIEDSAVYFCAMRGDYGGSGNKL'\
-            'IFGTGTLLSVKP']
-        beta_chain = [
-            'NAGVTQTPKFQVLKTGQSMTLQCAQDMNHEYMSTYRQDPGMGLRLIHYSVGAGITDQGEVPNGYNVSRSTTEDFPLRLLSAAPSQTSVYFCASRPGLAGGRPEQ'\
-            'YFGPGTRLTVTEDLKNVFPPEVAVFEPSEAEISHTQKATLVCLATGFYPDHVELSTTVNGKEVHSGVSTDPQPLKEQPALNDSRYALSSRLRVSATFTQNPRNHF'\
-            'RCQVQFYGLSENDETTQDRAKPVTQIVSAEATGRAD',
-            'VTLLEQNPRTRLVPRGQAVNLRCILKNSQYPTMSTYQQDLQKQLQTLFTLRSPGDKEVKSLPGADYLATRVTDTELRLQVANMSQGRTLYCTCSADRVGNTLYFG'\
-            'EGSRLIV']
-        chains = self.get_chains()
-        tmp_alpha = []
-        tmp_beta = []
-        # Assume that alpha and beta chains are next to each other in PDB file
-        for pos in range(0, len(chains)):
-            score_alpha = aligner.align(self.get_amino_acid_on_chain(chains[pos]), alpha_chain[0])[0].score
-            tmp_alpha.append([float(score_alpha), chains[pos]])
-            # Position in front
-            if pos + 1 in range(0, len(chains)):
-                score_beta = aligner.align(self.get_amino_acid_on_chain(chains[pos + 1]), beta_chain[0])[0].score
-                tmp_beta.append([float(score_beta), chains[pos + 1]])
-            # Position behind
-            if pos - 1 in range(0, len(chains)):
-                score_beta = aligner.align(self.get_amino_acid_on_chain(chains[pos - 1]), beta_chain[0])[0].score
-                tmp_beta.append([float(score_beta), chains[pos - 1]])
-        alpha = sorted(tmp_alpha)
-        beta = sorted(tmp_beta)
-        result['ALPHA'] = alpha[-1][1]
-        result['BETA'] = beta[-1][1]
+        structure = self.get_structure()
+        if self._derived is not None:
+            result = dict(self._derived['tcr'])
+        else:
+            result = complexes.tcr_chains(structure.select(structure.record == 'ATOM'))
+        if not result:
+            raise ValueError("No TCR alpha/beta pair found in " + self.file_name)
         return result
 
     def get_tcr_amino_seq(self, tcr_type_in):
@@ -454,19 +557,12 @@ class PdbTools3:
         -------
         mhc chain id
         """
-        aligner = Align.PairwiseAligner()
-        aligner.mode = 'global'
-        aligner.substitution_matrix = substitution_matrices.load('BLOSUM62')
-        aligner.target_end_gap_score = 0.0
-        aligner.query_end_gap_score = 0.0
         # Hard coded mhc chain
-        mhc_chain = 'GSHSMRYFFTSVSRPGRGEPRFIAVGYVDDTQFVRFDSDAASQRMEPRAPWIEQEGPEYWDGETRKVKAHSQTHRVDLGTLRGYYNQSEAGSHTV'\
-                    'QRMYGCDVGSDWRFLRGYHQYAYDGKDYIALKEDLRSWTAADMAAQTTKHKWEAAHVAEQLRAYLEGTCVEWLRRYLENGKETLQRTDAPKTHMT'\
-                    'HHAVSDHEATLRCWALSFYPAEITLTWQRDGEDQTQDTELVETRPAGDGTFQKWAAVVVPSGQEQRYTCHVQHEGLPKPLTLRWE'
+        mhc_chain = references.MHC_CHAIN
         chains = self.get_chains()
         tmp_mhc = []
         for chain in chains:
-            score_mhc = aligner.align(self.get_amino_acid_on_chain(chain), mhc_chain)[0].score
+            score_mhc = references.alignment_score(self.get_amino_acid_on_chain(chain), mhc_chain)
             tmp_mhc.append([float(score_mhc), chain])
         mhc = sorted(tmp_mhc)
         return mhc[-1][1]
@@ -479,17 +575,12 @@ class PdbTools3:
         -------
         b2m chain id
         """
-        aligner = Align.PairwiseAligner()
-        aligner.mode = 'global'
-        aligner.substitution_matrix = substitution_matrices.load('BLOSUM62')
-        aligner.target_end_gap_score = 0.0
-        aligner.query_end_gap_score = 0.0
         # Hard coded b2m chain
-        b2m_chain = 'MIQRTPKIQVYSRHPAENGKSNFLNCYVSGFHPSDIEVDLLKNGERIEKVEHSDLSFSKDWSFYLLYCTEFTPTEKDEYACRVNHVTLSQPCIVKWDRDM'
+        b2m_chain = references.B2M_CHAIN
         chains = self.get_chains()
         tmp_b2m = []
         for chain in sorted(chains):
-            score_b2m = aligner.align(self.get_amino_acid_on_chain(chain), b2m_chain)[0].score
+            score_b2m = references.alignment_score(self.get_amino_acid_on_chain(chain), b2m_chain)
             tmp_b2m.append([float(score_b2m), chain])
         b2m = sorted(tmp_b2m, reverse=True)
         high_score = b2m[0][0]  # highest align score
@@ -518,10 +609,10 @@ class PdbTools3:
         previous_chain = ""
         flag_start_res = False
         file_save = ""
-        with open(self.file_name, "r") as f:  # Reads in PDB
+        with open_pdb(self.file_name, "r") as f:  # Reads in PDB
             for line in f:
                 file_save += line
-        with open(tcr, "w") as f1:  # Writes renumbered PDB
+        with open_pdb(tcr, "w") as f1:  # Writes renumbered PDB
             for line in file_save.split("\n"):
                 if line[0:6] == 'HEADER':
                     f1.write(line + "\n")
@@ -554,14 +645,14 @@ class PdbTools3:
             Choose what directory to save PDB
         """
         if dir_start != '****':
-            tcr = dir_start + '%s_tcr.pdb' % (self.get_pdb_id())
+            tcr = dir_start + '%s_tcr%s' % (self.get_pdb_id(), self.output_suffix())
         else:
-            tcr = '%s.pdb' % (self.get_pdb_id())
+            tcr = self.get_pdb_id() + self.output_suffix()
         tcr_list = self.get_tcr_chains()
         atom_count = 0
         flag = False
         output = []
-        with open(self.file_name) as f:
+        with open_pdb(self.file_name) as f:
             for line in f:
                 if line[0:6] == 'HEADER':
                     output.append(line)
@@ -581,7 +672,7 @@ class PdbTools3:
                             if line[16] == 'A':
                                 line = line[:16] + ' ' + line[17:]
                             output.append(line.replace(num, str(atom_count).rjust(5), 1))
-        with open(tcr, 'w+') as f1:
+        with open_pdb(tcr, 'w+') as f1:
             for line in output:
                 f1.write(line)
 
@@ -597,9 +688,9 @@ class PdbTools3:
             Choose what directory to save PDB
         """
         if dir_start != '****':
-            tcr = dir_start + '%s_tcr.pdb' % (self.get_pdb_id())
+            tcr = dir_start + '%s_tcr%s' % (self.get_pdb_id(), self.output_suffix())
         else:
-            tcr = self.get_pdb_id() + ".pdb"
+            tcr = self.get_pdb_id() + self.output_suffix()
         tcr_list = self.get_tcr_chains()
         atom_count = 0
         flag = False
@@ -613,7 +704,7 @@ class PdbTools3:
         previous_count_b = -1
         res_count = 0
         output = []
-        with open(self.file_name) as f:
+        with open_pdb(self.file_name) as f:
             for line in f:
                 if line[0:6] == 'HEADER':
                     output.append(line)
@@ -654,111 +745,158 @@ class PdbTools3:
                                     line = line[:16] + ' ' + line[17:]
                                 if res_beta_count <= beta_cut:
                                     output.append(line.replace(num, str(atom_count).rjust(5), 1))
-        with open(tcr, 'w+') as f1:
+        with open_pdb(tcr, 'w+') as f1:
             for line in output:
                 f1.write(line)
 
+    def component_chains(self, components=tuple(COMPONENTS)):
+        """
+        Returns the chain IDs of each component (see COMPONENTS) in the first TCR-pMHC assembly of the file in use.
+        Chain roles are detected once and kept with the parsed structure
+
+        Parameters
+        ----------
+        components : tuple
+            Ex. ('TCR', 'PMHC')
+
+        Returns
+        -------
+        chains : dict
+            Component -> chain IDs, ex. {'TCR': 'DE', 'PMHC': 'AC'}. ValueError when a component is not found
+        """
+        assembly = (self.selection_context().assemblies() or [{}])[0]
+        chains = {component: ''.join(assembly[role] for role in COMPONENTS[component] if assembly.get(role))
+                  for component in components}
+        missing = [component for component in components if not chains[component]]
+        if missing:
+            raise ValueError("No " + ", ".join(missing) + " chains found in " + self.file_name)
+        return chains
+
+    def split_lines(self, chains, renumber=True):
+        """
+        Partition the lines of the file in use between outputs in one pass. Atom, HETATM and TER records go to the
+        outputs holding their chain, HELIX and SHEET records by their (first) chain, CONECT records to the outputs
+        holding their first atom and other lines (except MASTER) to every output
+
+        Parameters
+        ----------
+        chains : dict
+            Output name -> chain IDs, ex. {'TCR': 'DE'}
+        renumber : boolean
+            Number atoms, helices and sheets of each output from 1, CONECT records follow the new atom numbers
+
+        Returns
+        -------
+        outputs : dict
+            Output name -> list of lines
+        """
+        outputs = {name: [] for name in chains}
+        serials = {name: {} for name in chains}  # Old atom serial -> new atom serial
+        counts = {name: {'ATOM  ': 0, 'HELIX ': 0, 'SHEET ': 0} for name in chains}
+        last_chain = None
+        with open_pdb(self.file_name) as file:
+            for line in file:
+                record = line[0:6].rstrip('\n').ljust(6)  # Bare TER lines are short
+                if record in ('ATOM  ', 'HETATM', 'TER   '):
+                    chain = line[21] if len(line) > 22 else last_chain  # Bare TER ends the chain before it
+                    last_chain = chain
+                    old = line[6:11].strip()
+                    for name, wanted in chains.items():
+                        if chain is None or chain not in wanted:
+                            continue
+                        if old and renumber:
+                            counts[name]['ATOM  '] += 1
+                            serials[name][old] = counts[name]['ATOM  ']
+                            outputs[name].append(line[:6] + str(counts[name]['ATOM  ']).rjust(5) + line[11:])
+                        else:
+                            if old:  # Bare TER lines have no serial
+                                serials[name][old] = old
+                            outputs[name].append(line)
+                elif record in ('HELIX ', 'SHEET '):
+                    chain = line[19] if record == 'HELIX ' else line[21]
+                    for name, wanted in chains.items():
+                        if chain in wanted:
+                            counts[name][record] += 1
+                            outputs[name].append(line[:6] + str(counts[name][record]).rjust(4) + line[10:]
+                                                 if renumber else line)
+                elif record == 'CONECT':
+                    atoms = [line[pos:pos + 5].strip() for pos in range(6, 31, 5)]
+                    atoms = [atom for atom in atoms if atom]  # Unused bond fields are blank
+                    for name in chains:
+                        if atoms and atoms[0] in serials[name]:
+                            bonded = [str(serials[name][atom]).rjust(5) for atom in atoms if atom in serials[name]]
+                            outputs[name].append('CONECT' + ''.join(bonded) + '\n')
+                elif record != 'MASTER':
+                    for name in chains:
+                        outputs[name].append(line)
+        return outputs
+
+    def split_components(self, components=tuple(COMPONENTS), names=None, renumber=True, chains=None):
+        """
+        Write the TCR, MHC, peptide and/or pMHC of the file in use into separate PDB files, reading the file and
+        detecting chain roles once for every output
+
+        Parameters
+        ----------
+        components : tuple
+            Components to write, see COMPONENTS
+        names : dict
+            Optional component -> file name, defaults to <pdb id>_<component>.pdb next to the file in use
+        renumber : boolean
+            See split_lines()
+        chains : dict
+            Optional component -> chain IDs, skips detection
+
+        Returns
+        -------
+        names : dict
+            Component -> file written
+        """
+        chains = chains or self.component_chains(components)
+        names = dict(names or {})
+        for component in components:
+            names.setdefault(component, os.path.join(os.path.dirname(self.file_name), self.get_pdb_id() + "_"
+                                                     + component.lower() + self.output_suffix()))
+        outputs = self.split_lines({component: chains[component] for component in components}, renumber)
+        for component, lines in outputs.items():
+            with open_pdb(names[component], 'w') as file:
+                file.write(''.join(lines))
+        return {component: names[component] for component in components}
+
+    def split_archive(self, zip_name="...", components=tuple(COMPONENTS), renumber=True):
+        """
+        Split the file in use like split_components() straight into one ZIP archive, no PDB files are written
+
+        Parameters
+        ----------
+        zip_name : str
+            Optional archive name, defaults to <pdb id>_split.zip next to the file in use
+        components : tuple
+        renumber : boolean
+
+        Returns
+        -------
+        zip_name : str
+        """
+        if zip_name == "...":
+            zip_name = os.path.join(os.path.dirname(self.file_name), self.get_pdb_id() + "_split.zip")
+        outputs = self.split_lines(self.component_chains(components), renumber)
+        with zipfile.ZipFile(zip_name, "w", zipfile.ZIP_DEFLATED) as archive:
+            for component in components:
+                archive.writestr(self.get_pdb_id() + "_" + component.lower() + ".pdb", ''.join(outputs[component]))
+        return zip_name
+
     def split_mhc(self):
         """
         Creates a new PDB file with information for only the MHC of the original PDB file
         """
-        tcr = self.get_pdb_id() + ".pdb"
-        mhc = self.get_mhc_chain()
-        helix_count = 0
-        sheet_count = 0
-        atom_count = 0
-        compare_conect = {}
-        output = []
-        with open(self.file_name) as f:
-            for line in f:
-                left_conect = 6
-                right_conect = 11
-                if line[0:6] == 'ATOM  ' or line[0:6] == 'TER   ':
-                    if line[21] == mhc:
-                        num = line[6:11]
-                        atom_count += 1
-                        output.append(line.replace(num, str(atom_count).rjust(5), 1))
-                        compare_conect[num] = atom_count
-                elif line[0:6] == 'HELIX ':
-                    if line[19] == mhc:
-                        num = line[6:10]
-                        helix_count += 1
-                        output.append(line.replace(num, str(helix_count).rjust(4), 1))
-                elif line[0:6] == 'SHEET ':
-                    if line[21] == mhc:
-                        num = line[6:10]
-                        sheet_count += 1
-                        output.append(line.replace(num, str(sheet_count).rjust(4), 1))
-                elif line[0:6] == 'HETATM':
-                    if line[21] == mhc:
-                        num = line[6:11]
-                        atom_count += 1
-                        output.append(line.replace(num, str(atom_count).rjust(5), 1))
-                elif line[0:6] == 'CONECT':
-                    if compare_conect.__contains__(line[left_conect:right_conect]):
-                        while compare_conect.__contains__(line[left_conect:right_conect]):
-                            line_update = line.replace(line[left_conect:right_conect],
-                                                        str(compare_conect[line[left_conect:right_conect]]).rjust(5), 1)
-                            left_conect += 5
-                            right_conect += 5
-                        output.append(line_update)
-                else:
-                    if line[0:6] != 'MASTER':
-                        output.append(line)
-        with open(tcr, 'w+') as f1:
-            for line in output:
-                f1.write(line)
+        self.split_components(('MHC',), {'MHC': self.get_pdb_id() + self.output_suffix()})
 
     def split_p(self):
         """
         Creates a new PDB file with information for only the peptide of the original PDB file
         """
-        tcr = '%s.pdb' % (self.get_pdb_id())
-        peptide = self.get_peptide_chain()
-        helix_count = 0
-        sheet_count = 0
-        atom_count = 0
-        compare_conect = {}
-        output = []
-        with open(self.file_name) as f:
-            for line in f:
-                left_conect = 6
-                right_conect = 11
-                if line[0:6] == 'ATOM  ' or line[0:6] == 'TER   ':
-                    if line[21] == peptide:
-                        num = line[6:11]
-                        atom_count += 1
-                        output.append(line.replace(num, str(atom_count).rjust(5), 1))
-                        compare_conect[num] = atom_count
-                elif line[0:6] == 'HELIX ':
-                    if line[19] == peptide:
-                        num = line[6:10]
-                        helix_count += 1
-                        output.append(line.replace(num, str(helix_count).rjust(4), 1))
-                elif line[0:6] == 'SHEET ':
-                    if line[21] == peptide:
-                        num = line[6:10]
-                        sheet_count += 1
-                        output.append(line.replace(num, str(sheet_count).rjust(4), 1))
-                elif line[0:6] == 'HETATM':
-                    if line[21] == peptide:
-                        num = line[6:11]
-                        atom_count += 1
-                        output.append(line.replace(num, str(atom_count).rjust(5), 1))
-                elif line[0:6] == 'CONECT':
-                    if compare_conect.__contains__(line[left_conect:right_conect]):
-                        while compare_conect.__contains__(line[left_conect:right_conect]):
-                            line_update = line.replace(line[left_conect:right_conect],
-                                                       str(compare_conect[line[left_conect:right_conect]]).rjust(5), 1)
-                            left_conect += 5
-                            right_conect += 5
-                        output.append(line_update)
-                else:
-                    if line[0:6] != 'MASTER':
-                        output.append(line)
-        with open(tcr, 'w+') as f1:
-            for line in output:
-                f1.write(line)
+        self.split_components(('PEPTIDE',), {'PEPTIDE': self.get_pdb_id() + self.output_suffix()})
 
     def split_pmhc(self, update_name="..."):
         """
@@ -771,31 +909,15 @@ class PdbTools3:
             Optional naming for created PDB file
         """
         if update_name == "...":
-            pmhc = 'pmhc.pdb'  # name of resulting file
+            pmhc = 'pmhc' + self.output_suffix()  # name of resulting file
         else:
             pmhc = update_name
-        #peptide = self.get_peptide_chain()
-        peptide = "C"
-        #mhc = self.get_mhc_chain()
-        mhc = "A"
-        output = []
-        with open(self.file_name) as f:
-            for line in f:
-                if line[0:6] == 'ATOM  ' or line[0:6] == 'TER   ':
-                    if line[21] == peptide or line[21] == mhc:
-                        output.append(line)
-                else:
-                    if line[0:6] != 'MASTER':
-                        output.append(line)
-        with open(pmhc, 'w+') as f1:
-            for line in output:
-                f1.write(line)
+        self.split_components(('PMHC',), {'PMHC': pmhc}, renumber=False)
 
     def split_tcr(self, update_name="...", assume_rename=False):
         """"
-        Creates a new PDB file with information for only the peptide of the original PDB file
+        Creates a new PDB file with information for only the TCR of the original PDB file
         Doesn't update numbering
-        Assumes Alpha and Beta are D & E
 
         Parameters
         __________
@@ -805,27 +927,11 @@ class PdbTools3:
             Assume that the TCR chains are labeled D and E
         """
         if update_name == "...":
-            tcr = 'tcr.pdb'  # name of resulting file
+            tcr = 'tcr' + self.output_suffix()  # name of resulting file
         else:
             tcr = update_name
-        if assume_rename:  # If trimmed and renamed
-            alpha = "D"
-            beta = "E"
-        else:
-            alpha = self.get_tcr_chains()["ALPHA"]
-            beta = self.get_tcr_chains()["BETA"]
-        output = []
-        with open(self.file_name) as f:
-            for line in f:
-                if line[0:6] == 'ATOM  ' or line[0:6] == 'TER   ':
-                    if line[21] == alpha or line[21] == beta:
-                        output.append(line)
-                else:
-                    if line[0:6] != 'MASTER':
-                        output.append(line)
-        with open(tcr, 'w+') as f1:
-            for line in output:
-                f1.write(line)
+        chains = {'TCR': 'DE'} if assume_rename else None  # If trimmed and renamed
+        self.split_components(('TCR',), {'TCR': tcr}, renumber=False, chains=chains)
 
     def clean_docking_count(self, rename='****'):
         """
@@ -849,8 +955,8 @@ class PdbTools3:
         res_count = 0  # Keeps track of residue number
         chains = []  # Chains to keep track of previous
         header = False  # Marks down header
-        with open(self.file_name, "r") as i:
-            with open(pdb_1, 'w+') as o:
+        with open_pdb(self.file_name, "r") as i:
+            with open_pdb(pdb_1, 'w+') as o:
                 for line in i:
                     if line[0:6] != "MODEL " or line[0:6] != "ENDMDL":
                         if line[0:6] == 'HEADER':
@@ -895,14 +1001,14 @@ class PdbTools3:
         if rename != '****':
             renum_name = rename
         else:
-            renum_name = self.file_name[:-4] + "_renum.pdb"  # Default naming if no input
+            renum_name = self.file_name.split(".pdb")[0] + "_renum" + self.output_suffix()  # Default naming if no input
         atom_count = 1  # Keeps track of atom number
         old_res_count = -10000
         res_count = 0  # Keeps track of residue number
         chains = []  # Chains to keep track of previous
         header = False  # Marks down header
-        with open(self.file_name, "r") as i:
-            with open(renum_name, 'w+') as o:
+        with open_pdb(self.file_name, "r") as i:
+            with open_pdb(renum_name, 'w+') as o:
                 for line in i:
                     if line[0:6] == 'HEADER':
                         o.write(line)
@@ -946,7 +1052,7 @@ class PdbTools3:
         mhc = self.get_mhc_chain()
         b2m = self.get_b2m_chain()
         pep = self.get_peptide_chain()
-        with open(self.file_name) as f:
+        with open_pdb(self.file_name) as f:
             for line in f:
                 if line[0:6] != 'ANISOU':  # Skip ANISOU id
                     if line[0:6] == 'HEADER':
@@ -988,7 +1094,7 @@ class PdbTools3:
                             output.append(temp_line.replace(num, str(atom_count).rjust(5), 1))
                         output.append("END\n")
                         break
-        with open(self.file_name, 'w+') as f1:
+        with open_pdb(self.file_name, 'w+') as f1:
             for line in output:
                 f1.write(line)
 
@@ -1002,12 +1108,13 @@ class PdbTools3:
         file_name : str
             Optinal naming of fasta file output
         """
-        tcr_alpha_chain = self.get_amino_acid_on_chain(self.get_tcr_chains()['ALPHA'])
-        tcr_beta_chain = self.get_amino_acid_on_chain(self.get_tcr_chains()['BETA'])
+        tcr_dict = self.get_tcr_chains()
+        tcr_alpha_chain = self.get_amino_acid_on_chain(tcr_dict['ALPHA'])
+        tcr_beta_chain = self.get_amino_acid_on_chain(tcr_dict['BETA'])
         total_chain = tcr_alpha_chain + tcr_beta_chain
         pdb_id = self.get_pdb_id()
         count_1 = 1
-        with open(file_name, 'a+') as f:
+        with open_pdb(file_name, 'a+') as f:
             if tcr_alpha_chain != '' or tcr_beta_chain != '':
                 f.write('>' + pdb_id + '\n')
                 for aa in total_chain:
@@ -1019,7 +1126,7 @@ class PdbTools3:
                         count_1 = 2
                 f.write('\n')
 
-    def unmute_aa(self, left_aa, right_aa, chain):
+    def unmute_aa(self, left_aa, right_aa, chain, selection=None):
         """
         Unmutes atoms of amino acid positions to untrim tcr based on left, right, and chain_id
         Assign left_aa = 0 and right_aa = 1000 for universal chain unmute
@@ -1031,26 +1138,15 @@ class PdbTools3:
         right_aa : int
             Right side of chain to mute
         chain : str
+        selection : str
+            Optional selection of atoms to unmute in place of left_aa, right_aa and chain, ex. 'cdr3b'
         """
-        range_aa = range(left_aa, right_aa + 1)
-        with open(self.file_name, 'r') as r:
-            data = r.readlines()
-        with open(self.file_name, 'w+') as w:
-            for line in data:
-                if line[0:6] == 'DEATOM':
-                    if line[21] == chain:
-                        num_aa = int(line[22:26])
-                        if num_aa in range_aa:
-                            result = line.replace('DEATOM', 'ATOM  ', 1)
-                            w.write(result)
-                        else:
-                            w.write(line)
-                    else:
-                        w.write(line)
-                else:
-                    w.write(line)
+        if selection is None:
+            selection = "chain '%s' and resi %d:%d" % (chain, left_aa, right_aa)
+        with self.edit() as session:
+            session.unmute(selection)
 
-    def mute_aa(self, left_aa, right_aa, chain_id):
+    def mute_aa(self, left_aa, right_aa, chain_id, selection=None):
         """
         Mutes atoms of amino acid positions to trim tcr based on left, right, and chain_id
         Assign left_aa = 0 and right_aa = 1000 for universal chain mute
@@ -1062,64 +1158,54 @@ class PdbTools3:
         right_aa : int
             Right side of chain to mute
         chain_id : str
+        selection : str
+            Optional selection of atoms to mute in place of left_aa, right_aa and chain_id, ex. 'beta and resi 120-'
         """
-        range_aa = range(left_aa + 1, right_aa + 1)
-        with open(self.file_name, 'r') as r:
-            data = r.readlines()
-        with open(self.file_name, 'w+') as w:
-            for line in data:
-                if line[0:6] == 'ATOM  ' or line[0:6] == 'TER   ':
-                    if line[21] == chain_id:
-                        num_aa = int(line[22:26])
-                        if num_aa in range_aa:
-                            result = line.replace('ATOM  ', 'DEATOM', 1)
-                            w.write(result)
-                        else:
-                            w.write(line)
-                    else:
-                        w.write(line)
-                else:
-                    w.write(line)
+        if selection is None:
+            selection = "chain '%s' and resi %d:%d" % (chain_id, left_aa + 1, right_aa)
+        with self.edit() as session:
+            session.mute(selection)
 
-    def remove_chain(self, chain_id):
+    def remove_chain(self, chain_id, selection=None):
         """
-         Remove chain provided based on ID
+        Remove chain provided based on ID, only atom and TER lines are kept
+
         Parameters
         ----------
         chain_id : str
+        selection : str
+            Optional selection of atoms to remove in place of chain_id
         """
-        with open(self.file_name, 'r') as r:
+        if selection is None:
+            selection = "chain '%s'" % chain_id.upper()
+        with open_pdb(self.file_name, 'r') as r:
             data = r.readlines()
-        with open(self.file_name, 'w+') as w:
-            for line in data:
-                if line[0:6] == 'ATOM  ' or line[0:6] == 'TER   ':
-                    if line[21] != chain_id.upper():
-                        w.write(line)
+        mask = self.select_lines(data, selection)
+        with open_pdb(self.file_name, 'w+') as w:
+            for line, selected in zip(data, mask):
+                if line[0:6] in ('ATOM  ', 'TER   ') and not selected:
+                    w.write(line)
 
-    def trim_chain(self, chain_id, cutoff):
+    def trim_chain(self, chain_id, cutoff, selection=None):
         """
-        Trims chain submitted with cutoff provided of AA count
+        Trims chain submitted with cutoff provided of AA count, secondary atoms (alternate location B and insertion
+        codes) are removed as well
 
         Parameters
         ----------
         chain_id : str
         cutoff : int
             Position in chain to cut
+        selection : str
+            Optional selection of atoms to trim in place of chain_id and cutoff, other lines are kept
         """
-        output = []
-        with open(self.file_name, "r") as i:
-            for line in i:
-                if line[0:6] == 'ATOM  ' or line[0:6] == 'TER   ':  # Only write over atoms
-                    if line[16] != 'B' and line[26] == ' ':  # Don't allow secondary atoms
-                        if line[21] == chain_id.upper() and int(line[22:26]) <= cutoff or line[21] != chain_id.upper():
-                            output.append(line)
-                else:
-                    output.append(line)
-        with open(self.file_name, "w") as o:
-            for line in output:
-                o.write(line)
+        with self.edit() as session:
+            if selection is None:
+                session.trim(chain_id, cutoff)
+            else:
+                session.remove("record ATOM,TER and (" + selection + ")")
 
-    def split_chains(self, chains_in, suffix, dir_location='****'):
+    def split_chains(self, chains_in, suffix, dir_location='****', selection=None):
         """
         Splits chains given and renames with given suffix
 
@@ -1130,25 +1216,24 @@ class PdbTools3:
             Suffix of created file
         dir_location : str
             Optional submission of location of PDB file
+        selection : str
+            Optional selection of atoms to keep in place of chains_in, ex. 'tcr and not resi 120-'
         """
         if dir_location == '****':
             new_pdb = self.get_file_name()
         else:
-            new_pdb = dir_location + self.get_pdb_id() + suffix + ".pdb"
-        output = []
-        with open(self.file_name) as f:
-            for line in f:
-                if line[0:6] == 'ATOM  ' or line[0:6] == 'TER   ':
-                    if line[21] in chains_in.upper():
-                        output.append(line)
-                else:
-                    if line[0:6] != 'MASTER':
-                        output.append(line)
-        with open(new_pdb, 'w+') as f1:
-            for line in output:
-                f1.write(line)
-
-    def superimpose(self, ref_pdb, target_order, ref_order, new_name_in="..."):
+            new_pdb = dir_location + self.get_pdb_id() + suffix + self.output_suffix()
+        if selection is None:
+            selection = "chain " + ",".join("'%s'" % chain for chain in chains_in.upper()) if chains_in else "none"
+        with open_pdb(self.file_name) as f:
+            data = f.readlines()
+        mask = self.select_lines(data, selection)
+        with open_pdb(new_pdb, 'w+') as f1:
+            for line, selected in zip(data, mask):
+                if selected or line[0:6] not in ('ATOM  ', 'TER   ', 'MASTER'):
+                    f1.write(line)
+
+    def superimpose(self, ref_pdb, target_order, ref_order, new_name_in="...", check_clash=False):
         """
         Superimpose two PDBs
         Read in target and reference structure, superimpose target to reference, save superimposed target structure
@@ -1163,6 +1248,8 @@ class PdbTools3:
             Order of chains to compare in superimposing structures for reference
         new_name_in : str
             Optional name in for resulting superimposed positioning of target structure
+        check_clash : boolean
+            Warn if the superimposed target clashes with reference chains not in ref_order
 
         Returns
         -------
@@ -1211,15 +1298,18 @@ class PdbTools3:
             # print("Target Chain: " + target_pos[chain_pos])
             # print("Reference Chain: " + ref_pos[chain_pos])
             # print(temp_align[0])
-            start_pos['target'][target_pos[chain_pos]] = [temp_align[0].path[0][0], temp_align[0].path[1][0]]
-            start_pos['reference'][ref_pos[chain_pos]] = [temp_align[0].path[0][1], temp_align[0].path[1][1]]
+            ends = temp_align[0].coordinates  # Row per sequence, first and last column are the aligned start and end
+            start_pos['target'][target_pos[chain_pos]] = [ends[0][0], ends[0][-1]]
+            start_pos['reference'][ref_pos[chain_pos]] = [ends[1][0], ends[1][-1]]
 
         # Initialize parser
         parser = Bio.PDB.PDBParser(QUIET=True)
 
         # Gather Structures
-        ref_structure = parser.get_structure("reference", ref_pdb)
-        target_structure = parser.get_structure("target", self.file_name)
+        with open_pdb(ref_pdb) as file:
+            ref_structure = parser.get_structure("reference", file)
+        with open_pdb(self.file_name) as file:
+            target_structure = parser.get_structure("target", file)
 
         # Collect structures
         ref_model = ref_structure[0]
@@ -1296,11 +1386,20 @@ class PdbTools3:
         if new_name_in != "...":
             new_name = new_name_in
         else:
-            new_name = self.get_file_name().split(".")[0] + "_aligned.pdb"
-        io.save(new_name)
+            new_name = self.get_file_name().split(".")[0] + "_aligned" + self.output_suffix()
+        with open_pdb(new_name, 'w') as file:
+            io.save(file)
+        if check_clash:
+            reference = parse_pdb(ref_pdb)
+            reference = reference.select(reference.primary_mask() & ~reference.chain_mask(ref_order))
+            moved = parse_pdb(new_name)
+            found = clash.find_clashes(moved.select(moved.primary_mask()), reference)
+            if found['pairs']:
+                print("Warning: " + str(len(found['pairs'])) + " clashing atom pairs between " + new_name + " and "
+                      + ref_pdb)
         return super_imposer.rms
 
-    def rmsd(self, ref_pdb, target_order, ref_order, ca=False, mute=False):
+    def rmsd(self, ref_pdb, target_order, ref_order, ca=False, mute=False, selection=None):
         """
         Calculate RMSD values between two PDBs - based on aligned aa's. Optional Carbon Alpha RMSD as well.
 
@@ -1316,6 +1415,9 @@ class PdbTools3:
             True - only Alpha Carbon RMSD ; False - all-atom RMSD
         mute : boolean
             Don't print text, only return when called
+        selection : str
+            Optional selection of the atoms to compare in both structures, ex. 'cdr3a or cdr3b'. Chains are still
+            aligned in full
 
         Returns
         -------
@@ -1326,7 +1428,13 @@ class PdbTools3:
         target_aa = {}  # chain: aa's
         ref_aa = {}  # chain: aa's
         rmsd_array = {"target": [], "ref": []}  # List of cords in order
+        selected = {"target": None, "ref": None}  # (chain, atom number) of selected atoms
+        rmsd_keys = {"target": [], "ref": []}  # (chain pair, aligned residue, atom name) of each cord
         current_pdb = self.get_file_name()
+        if selection is not None:
+            mask = self.select_atoms(selection)
+            structure = self.get_structure()
+            selected["target"] = set(zip(structure.chain_id[mask].tolist(), structure.atom_num[mask].tolist()))
         # Collect target atoms
         for chain in target_order:
             # Collect atoms - contains xyz and aa
@@ -1335,6 +1443,10 @@ class PdbTools3:
             target_aa[chain] = self.get_amino_acid_on_chain(chain)
         # Collect reference atoms
         self.set_file_name(ref_pdb)
+        if selection is not None:
+            mask = self.select_atoms(selection)
+            structure = self.get_structure()
+            selected["ref"] = set(zip(structure.chain_id[mask].tolist(), structure.atom_num[mask].tolist()))
         for chain in ref_order:
             # Collect atoms - contains xyz and aa
             ref_atoms[chain] = self.get_atoms_on_chain(chain)
@@ -1353,8 +1465,9 @@ class PdbTools3:
             # run alignment
             temp_align = aligner.align(target_aa[target_order[position]], ref_aa[ref_order[position]])
             # Collect info needed - start and end positions of alignments ex. [0, 101]
-            target_chain_info = [temp_align[0].path[0][0], temp_align[0].path[1][0]]
-            ref_chain_info = [temp_align[0].path[0][1], temp_align[0].path[1][1]]
+            ends = temp_align[0].coordinates
+            target_chain_info = [ends[0][0], ends[0][-1]]
+            ref_chain_info = [ends[1][0], ends[1][-1]]
             # Collect XYZ cords. for target
             last_pos = 0
             count = -1
@@ -1366,8 +1479,11 @@ class PdbTools3:
                             count = 0
                         if atom["comp_num"] != last_pos:
                             count += 1
-                        if count in range(target_chain_info[0], target_chain_info[1]):
+                            last_pos = atom["comp_num"]
+                        keep = selected["target"] is None or (atom["chain_id"], atom["atom_num"]) in selected["target"]
+                        if count in range(target_chain_info[0], target_chain_info[1]) and keep:
                             rmsd_array["target"].append([atom["X"], atom["Y"], atom["Z"]])
+                            rmsd_keys["target"].append((position, count - target_chain_info[0], atom["atom_id"]))
             # Collect XYZ cords. for ref
             count = -1
             for atom in ref_atoms[ref_order[position]]:
@@ -1378,8 +1494,23 @@ class PdbTools3:
                             count = 0
                         if atom["comp_num"] != last_pos:
                             count += 1
-                        if count in range(ref_chain_info[0], ref_chain_info[1]):
+                            last_pos = atom["comp_num"]
+                        keep = selected["ref"] is None or (atom["chain_id"], atom["atom_num"]) in selected["ref"]
+                        if count in range(ref_chain_info[0], ref_chain_info[1]) and keep:
                             rmsd_array["ref"].append([atom["X"], atom["Y"], atom["Z"]])
+                            rmsd_keys["ref"].append((position, count - ref_chain_info[0], atom["atom_id"]))
+        # Atoms may differ between the structures (selections, missing side chains), pair by aligned residue and name
+        for side in rmsd_keys:  # Number repeated atom names (alternate locations) in order of appearance
+            seen = {}
+            for pos, key in enumerate(rmsd_keys[side]):
+                seen[key] = seen.get(key, 0) + 1
+                rmsd_keys[side][pos] = key + (seen[key],)
+        ref_cords = dict(zip(rmsd_keys["ref"], rmsd_array["ref"]))
+        pairs = [(cords, ref_cords[key]) for key, cords in zip(rmsd_keys["target"], rmsd_array["target"])
+                 if key in ref_cords]
+        if not pairs:
+            raise ValueError("No atoms are aligned in both structures")
+        rmsd_array = {"target": [pair[0] for pair in pairs], "ref": [pair[1] for pair in pairs]}
         # print(rmsd_array)
         # print(len(rmsd_array["target"]))
         # print(len(rmsd_array["ref"]))
@@ -1429,37 +1560,9 @@ class PdbTools3:
                 atoms.append([atom['X'], atom['Y'], atom['Z']])
         # Convert to array
         atom_array = np.array(atoms)
-        # Calculate avg for each axis
-        current_avg = np.mean(atom_array, axis=0)
-        # Center the coordinates
-        new_array = []
-        for set_pos in atom_array:
-            x = set_pos - current_avg
-            new_array.append(x)
-        # Calculate PCA
-        pca = PCA(n_components=3)
-        pca.fit(new_array)
-        transpose = np.transpose(pca.components_)
-        # Determinate of components matrix - Corrects if determinate is negative
-        determinate = np.linalg.det(transpose)
-        if determinate < 0:
-            for position in transpose:
-                position[0] = position[0] * -1
-        # Rotate x-axis
-        # Always have N-terminus in positive coordinates (Fixes flips on x-axis)
-        test_x = np.matmul(new_array[-1], transpose)
-        if test_x[1] < 0:
-            r = Rotation.from_euler('x', 180, degrees=True)
-            transpose = r.apply(transpose)
-        # Rotate y-axis
-        # Always have first chain on left side | alpha on left side (Fixes flips on y-axis)
-        # Determines by looking at last atom which should be on the Beta chain
-        test_y = np.matmul(new_array[-1], transpose)
-        if test_y[0] < 0:
-            r = Rotation.from_euler('y', 180, degrees=True)
-            transpose = r.apply(transpose)
-        # Multiply by EV
-        new_cords = np.matmul(new_array, transpose)
+        # Center and align principal axes of inertia along X, Y and Z
+        current_avg, transpose = docking.canonical_frame(atom_array)
+        new_cords = np.matmul(atom_array - current_avg, transpose)
         # Replace XYZ coordinates
         axis = ['X', 'Y', 'Z']
         for num in range(0, len(full_atom)):
@@ -1469,12 +1572,12 @@ class PdbTools3:
         if new_name_in != "...":
             new_name = new_name_in
         else:
-            new_name = self.get_file_name().split("/")[-1].split(".")[0] + "_center.pdb"
-        with open(new_name, "w") as f:
+            new_name = self.get_file_name().split("/")[-1].split(".")[0] + "_center" + self.output_suffix()
+        with open_pdb(new_name, "w") as f:
             # Send to reconstruct atom lines
             f.write(self.rebuild_atom_line(full_atom))
 
-    def join(self, pdb_1, pdb_2, new_name):
+    def join(self, pdb_1, pdb_2, new_name, check_clash=False):
         """
         Joins together two PDB files by appending first PDBs atoms to second PDBs atoms
 
@@ -1486,17 +1589,25 @@ class PdbTools3:
             Location and name of PDB 2
         new_name : str
             Name of new file
+        check_clash : boolean
+            Warn if atoms of PDB 1 clash with atoms of PDB 2
         """
         atoms_lines = []
         pdbs = [pdb_1, pdb_2]
         for pdb in pdbs:
-            with open(pdb, "r") as f1:
+            with open_pdb(pdb, "r") as f1:
                 for line in f1:
                     if line[0:6] == "ATOM  " or line[0:6] == "TER   ":
                         atoms_lines.append(line)
-        with open(new_name, "w") as f2:
+        with open_pdb(new_name, "w") as f2:
             for line in atoms_lines:
                 f2.write(line)
+        if check_clash:
+            partners = [parse_pdb(pdb, hetatm=False) for pdb in pdbs]
+            found = clash.find_clashes(*[partner.select(partner.primary_mask()) for partner in partners])
+            if found['pairs']:
+                print("Warning: " + str(len(found['pairs'])) + " clashing atom pairs between " + pdb_1 + " and "
+                      + pdb_2)
         return new_name
 
     def reorder_chains(self, chain_order):
@@ -1516,7 +1627,7 @@ class PdbTools3:
         for chain in list(chain_order):
             for atom in chain_info[chain]:
                 new_order.append(atom)
-        with open(self.file_name, "w") as f1:
+        with open_pdb(self.file_name, "w") as f1:
             f1.write(self.rebuild_atom_line(new_order))
 
     def update_label(self, label_dic):
@@ -1538,151 +1649,226 @@ class PdbTools3:
             for atom in chain_info[chain]:
                 atom['chain_id'] = label_dic[chain]
                 new_order.append(atom)
-        with open(self.file_name, 'w') as f1:
+        with open_pdb(self.file_name, 'w') as f1:
             f1.write(self.rebuild_atom_line(new_order))
 
-    # Below CDR methods are adapted from Ryan Ehrlich's code
-    def pull_cdr(self):
+    def sasa(self, n_points=100):
         """
-        Primary method
-        Returns CDR1a, CDR2a, CDR2.5a, CDR3, CDR1b, CDR2b, CDR2.5b, CDR3b
+        Shrake-Rupley solvent accessible surface area of every residue in the PDB file
+
+        Parameters
+        ----------
+        n_points : int
+            Sphere points per atom
 
         Returns
         -------
-        alpInds
-        betInds
+        result : dict
+            'RES_NUM_CHAIN' label -> SASA in square angstroms
         """
-        from getCDRs import cdr_loops
-        trav, trbv = cdr_loops()  # get germline dictionary
-        # loops = CdrLoopInfo(self.get_file_name())
-        tcrDict = self.getLines()  # return residues identity and positions
-        aseq, bseq, apos, bpos = self.getSeqs(tcrDict)  # return pdb seqs and positions
-        # CDR loop identity and residue numbering
-        alpInds, betInds = self.loopPositions(aseq, apos, trav), self.loopPositions(bseq, bpos, trbv)
-        return alpInds, betInds
+        structure = self.get_structure()
+        return sasa.structure_sasa(structure.select(structure.primary_mask()), n_points)
+
+    def buried_surface_area(self, tcr_chains="...", pmhc_chains="...", n_points=100):
+        """
+        Calculate per-residue change in SASA (delta SASA) and the total buried surface area between the TCR and the
+        pMHC. Partners are the same chains split_tcr() and split_pmhc() keep, no files are written
+
+        Parameters
+        ----------
+        tcr_chains : str
+            Optional alpha and beta chain IDs, ex. 'DE' - skips chain detection when scoring many decoys
+        pmhc_chains : str
+            Optional MHC and peptide chain IDs, ex. 'AC'
+        n_points : int
+            Sphere points per atom
+
+        Returns
+        -------
+        result : dict
+            'complex', 'separated' and 'delta' per-residue SASA along with the total buried surface area 'bsa'
+        """
+        if tcr_chains == "...":
+            tcr_dict = self.get_tcr_chains()
+            tcr_chains = tcr_dict['ALPHA'] + tcr_dict['BETA']
+        if pmhc_chains == "...":
+            pmhc_chains = self.get_mhc_chain() + self.get_peptide_chain()
+        structure = self.get_structure()
+        return sasa.interface_sasa(structure.select(structure.primary_mask()), tcr_chains, pmhc_chains, n_points)
+
+    def check_clashes(self, chains_1, chains_2, cutoff=clash.CLASH_CUTOFF, any_only=False):
+        """
+        Find steric clashes between two sets of chains in the PDB file, ex. the TCR and pMHC of a join() output.
+        Hydrogens and secondary atom positions are ignored
+
+        Parameters
+        ----------
+        chains_1 : str
+            Chains of first partner, ex. 'DE'
+        chains_2 : str
+            Chains of second partner, ex. 'AC'
+        cutoff : float
+            Distance in angstroms under which two atoms clash
+        any_only : boolean
+            Only return if there is any clash, stops at the first clash found
+
+        Returns
+        -------
+        result : dict or boolean
+            'pairs' list of (atom_num_1, atom_num_2, distance) and 'residues' clash count per 'RES_NUM_CHAIN' label.
+            True/False when any_only
+        """
+        structure = self.get_structure()
+        structure = structure.select(structure.primary_mask())
+        partner_1 = structure.select(structure.chain_mask(chains_1))
+        partner_2 = structure.select(structure.chain_mask(chains_2))
+        if any_only:
+            return clash.any_clash(partner_1, partner_2, cutoff)
+        return clash.find_clashes(partner_1, partner_2, cutoff)
+
+    def docking_starts(self, pmhc_pdb, n_starts=5000, new_name_in="...", grid=False, max_angle=docking.MAX_ANGLE,
+                       max_shift=docking.MAX_SHIFT, seed=None, cutoff=clash.CLASH_CUTOFF):
+        """
+        Generate docking start positions for the TCR in use against a pMHC. Both are put in the frame center() would
+        give their join(), then the TCR is moved by rigid body perturbations in batches. Starts where the TCR clashes
+        with the pMHC are dropped
 
-    def getLines(self):
+        Parameters
+        ----------
+        pmhc_pdb : str
+            Location of pMHC PDB
+        n_starts : int
+            Number of perturbations to try
+        new_name_in : str
+            Optional name of output, .npz saves a compact array of moves instead of a multi-model PDB
+        grid : boolean
+            Evenly spaced perturbations instead of random
+        max_angle : float
+            Largest rotation in degrees, 180 samples all orientations
+        max_shift : float
+            Largest translation in angstroms
+        seed : int
+            Optional seed for repeatable random starts
+        cutoff : float
+            Clash distance in angstroms
+
+        Returns
+        -------
+        count : int
+            Number of starts written
+        """
+        tcr = self.get_structure()
+        tcr = tcr.select(tcr.record == 'ATOM')
+        pmhc = parse_pdb(pmhc_pdb, hetatm=False)
+        frame = docking.canonical_frame(np.concatenate((tcr.coords, pmhc.coords)))
+        tcr.coords = np.matmul(tcr.coords - frame[0], frame[1])
+        pmhc.coords = np.matmul(pmhc.coords - frame[0], frame[1])
+        if grid:
+            rotations, translations = docking.grid_perturbations(n_starts, max_angle, max_shift)
+        else:
+            rotations, translations = docking.random_perturbations(n_starts, max_angle, max_shift, seed)
+        if new_name_in != "...":
+            new_name = new_name_in
+        else:
+            new_name = self.get_file_name().split("/")[-1].split(".")[0] + "_starts" + self.output_suffix()
+        if new_name.endswith(".npz"):
+            starts = docking.iter_starts(tcr, pmhc, rotations, translations, cutoff, with_coords=False)
+            return docking.write_array(new_name, tcr, pmhc, rotations, translations, starts, frame)
+        starts = docking.iter_starts(tcr, pmhc, rotations, translations, cutoff)
+        return docking.write_models(new_name, tcr, pmhc, starts)
+
+    def get_complexes(self):
         """
-        Helper method to pull_cdr()
+        Returns every complete TCR-pMHC assembly in the PDB file. Chains are classified once by sequence and paired by
+        residue contacts, so files with more than one copy of the complex in the asymmetric unit give one assembly
+        per copy
 
         Returns
         -------
-        seq_dict
-        """
-        alpha = ['D']
-        beta = ['E']
-        data = open(self.get_file_name(), 'r')
-        seq_dict = {'alpha': [], 'beta': []}
-        for line in data:
-            if line[:4] == "ATOM":
-                if line[21] in alpha:
-                    resID = line[POSRES[0]:POSRES[1]] + "_" + line[POSSEQ[0]:POSSEQ[1]] + "_" + line[POSCHAIN]
-                    resID = resID.replace(" ", "")
-                    if resID not in seq_dict['alpha']:
-                        seq_dict['alpha'].append(resID)
-                if line[21] in beta:
-                    resID = line[POSRES[0]:POSRES[1]] + "_" + line[POSSEQ[0]:POSSEQ[1]] + "_" + line[POSCHAIN]
-                    resID = resID.replace(" ", "")
-                    if resID not in seq_dict['beta']:
-                        seq_dict['beta'].append(resID)
-        return seq_dict
-
-    def getSeqs(self, dict):
-        """
-        Helper method to pull_cdr()
-        return seq of pdb chains (tcr) as well as pos_chain
+        assemblies : list
+            Dictionaries with 'ALPHA', 'BETA', 'MHC', 'PEPTIDE' and, when found, 'B2M' or 'MHC2' (second class II
+            MHC chain) chain IDs
+        """
+        return complexes.find_complexes(self.get_structure())
+
+    def split_complexes(self, dir_location="."):
+        """
+        Write each TCR-pMHC assembly into its own directory, ex. 1d9k/1/1d9k.pdb and 1d9k/2/1d9k.pdb. Files keep the
+        PDB ID so every action can be run on each copy unchanged
 
         Parameters
         ----------
-        dict : dict
-        """
-        # triple letter abbreviation for amino acids
-        aa_names = [
-            "ALA", "CYS", "ASP", "GLU", "PHE", "GLY", "HIS", "ILE", "LYS", "LEU",
-            "MET", "ASN", "PRO", "GLN", "ARG", "SER", "THR", "VAL", "TRP", "TYR",
-        ]
-
-        # single letter abbreviation for amino acids
-        aa_singleletter = "ACDEFGHIKLMNPQRSTVWY"
-        aa_tripleletter = aa_names
-        keys = dict.keys()
-        alp, bet, alp_inds, bet_inds = [], [], [], []
-        for key in keys:
-            seq = dict.get(key)
-            for r in range(len(seq)):
-                res = seq[r][:3]
-                ind = aa_tripleletter.index(res)
-                res_ = aa_singleletter[ind]
-                if key == 'alpha':
-                    alp.append(res_)
-                    alp_inds.append(seq[r][4:-2])
-                if key == 'beta':
-                    bet.append(res_)
-                    bet_inds.append(seq[r][4:-2])
-        return ''.join(alp), ''.join(bet), alp_inds, bet_inds
-
-    def getCDR3(self, seq, germline):
-        """
-        Helper method to pull_cdr()
+        dir_location : str
+            Directory the copies are created in
+
+        Returns
+        -------
+        copies : list
+            Location of the PDB file of each assembly, same order as get_complexes()
+        """
+        copies = []
+        for count, assembly in enumerate(self.get_complexes(), start=1):
+            copy_dir = os.path.join(dir_location, self.get_pdb_id(), str(count))
+            os.makedirs(copy_dir, exist_ok=True)
+            self.split_chains(''.join(assembly.values()), "", copy_dir + "/")
+            copies.append(os.path.join(copy_dir, self.get_pdb_id() + self.output_suffix()))
+        return copies
+
+    # Below CDR methods are adapted from Ryan Ehrlich's code
+    def pull_cdr(self, alpha="...", beta="..."):
+        """
+        Primary method
+        Returns CDR1a, CDR2a, CDR2.5a, CDR3, CDR1b, CDR2b, CDR2.5b, CDR3b using the germline index shipped with
+        germline.py (only the CDR3s, found by motif, when it is missing)
 
         Parameters
         ----------
-        seq : str
-        germline : str
+        alpha : str
+            Optional alpha chain ID, found by sequence when not given
+        beta : str
+            Optional beta chain ID
 
         Returns
         -------
-        cdr3 : str
-        """
-        start = germline.rfind('C')  # get ind of C from CDR dict
-        check = germline.find(seq[5:10])  # reference start point in germline
-        diff = check - 5  # difference between seq and germline start
-        seq_ = seq[start - diff:]  # adjusted seq to match gerline
-        rev = []
-        for s in reversed(seq_):  # make reverse seq_
-            rev.append(s)
-        rev = ''.join(rev)
-        end = 0
-        for i in range(len(rev) - 2):  # find end of CDR3 using G*G pattern starting from the end of seq_ (rev)
-            if rev[i] == 'G':
-                if rev[i + 2] == 'G':
-                    end = i
-                    break
-        if end != 0:  # if end does not equal 0, trim using G*G pattern
-            end2 = len(seq_) - end  # end of G*G patter with CDR3
-            cdr3 = seq_[:end2 - 3]  # trim G*G pattern
-        if rev[0] == 'F' or end == 0:  # if end = 0, end of seq_ is the end of CDR3
-            cdr3 = seq_
-        return (cdr3)
-
-    def loopPositions(self, seq, resNums, trv):
-        """
-        Helper method to pull_cdr()
+        alpInds
+            [CDR1, CDR2, CDR2.5, CDR3] of the alpha chain, each [loop, start, end] with residue numbers or None when
+            the loop was not found
+        betInds
+            Same for the beta chain
+        """
+        result = self.annotate_germline(alpha, beta)
+        alpInds, betInds = [[result[chain_type][loop] if result[chain_type].get(loop, [''])[0] else None
+                             for loop in CDR_LOOPS] for chain_type in ('ALPHA', 'BETA')]
+        return alpInds, betInds
+
+    def annotate_germline(self, alpha="...", beta="..."):
+        """
+        Call the V gene of the alpha and beta chain and locate their CDRs using the precompiled germline index. Only
+        the CDR3s are located when the index has not been built
 
         Parameters
         ----------
-        seq
-        resNums
-        trv
+        alpha : str
+            Optional alpha chain ID, found by sequence when not given
+        beta : str
+            Optional beta chain ID
 
         Returns
         -------
-        loopInfo
-        """
-        cdrList = []
-        for key in trv:
-            loops = trv.get(key)
-            check = [''.join(loops[0]), ''.join(loops[1]), ''.join(loops[2])]
-            if all(x in seq for x in check):  # if all germline CDRs in seq, continue
-                cdr3 = self.getCDR3(seq, ''.join(loops[4]))  # get CDR3
-                cdrList = [''.join(loops[0]), ''.join(loops[1]), ''.join(loops[2]), cdr3]
-                break
-        loopInfo = []  # cdr loop with res number range (corresponds to pdb)
-        for loop in cdrList:  # get loops and loop res number ranges
-            ind = seq.find(loop)
-            start, end, = resNums[ind], resNums[ind + len(loop) - 1]
-            loopInfo.append([loop, int(start), int(end)])
-        return (loopInfo)
+        result : dict
+            'ALPHA' and 'BETA' each with 'gene', 'species' and [loop, start, end] for 'CDR1', 'CDR2', 'CDR2.5' and
+            'CDR3', start and end are residue numbers
+        """
+        structure = self.get_structure()
+        if alpha == "..." or beta == "...":
+            try:
+                tcr_dict = self.get_tcr_chains()
+            except ValueError:
+                tcr_dict = {}
+            alpha = tcr_dict.get('ALPHA') if alpha == "..." else alpha
+            beta = tcr_dict.get('BETA') if beta == "..." else beta
+        return {'ALPHA': germline.annotate_chain(structure, alpha, germline.GENE_TYPES['ALPHA']) if alpha else {},
+                'BETA': germline.annotate_chain(structure, beta, germline.GENE_TYPES['BETA']) if beta else {}}
 
 
 def parse_args():
@@ -1702,6 +1888,10 @@ def parse_args():
     parser.add_argument("--tcr_split_default", help="Only provides TCR chains, assumes DE", default=False,
                         action="store_true")
     parser.add_argument("--pmhc_split", help="Only provides pMHC chains", default=False, action="store_true")
+    parser.add_argument("--split_all", help="Write TCR, MHC, peptide and pMHC files in one pass", default=False,
+                        action="store_true")
+    parser.add_argument("--archive", help="(split_all) Write the components into one ZIP archive instead",
+                        default=False, action="store_true")
     parser.add_argument("--peptide", help="Get peptide chain", default=False, action="store_true")
     parser.add_argument("--mhc", help="Get mhc chain", default=False, action="store_true")
     parser.add_argument("--pmhc", help="Get pmhc chains", default=False, action="store_true")
@@ -1719,6 +1909,40 @@ def parse_args():
     parser.add_argument("--center", help="Center TCR to cord. 0,0,0", action="store_true", default=False)
     parser.add_argument("--reorder", help="Reorder chains based on string provided (case sensitive)", type=str)
     parser.add_argument("--pull_cdr", help="Pull CDRs", action="store_true", default=False)
+    parser.add_argument("--sasa", help="Per-residue solvent accessible surface area", action="store_true",
+                        default=False)
+    parser.add_argument("--bsa", help="Buried surface area between TCR and pMHC (file or directory of decoys)",
+                        action="store_true", default=False)
+    parser.add_argument("--tcr_chains", help="(bsa) TCR chains, skips detection. Ex. DE", type=str, default="...")
+    parser.add_argument("--pmhc_chains", help="(bsa) pMHC chains, skips detection. Ex. AC", type=str, default="...")
+    parser.add_argument("--clash", help="Report clashes between chains. Ex. DE:AC", type=str)
+    parser.add_argument("--any_clash", help="(clash) Only print True/False, stops at first clash (file or directory)",
+                        action="store_true", default=False)
+    parser.add_argument("--dock_starts", help="Docking starts of this TCR against the pMHC PDB given", type=str)
+    parser.add_argument("--n_starts", help="(dock_starts) Perturbations to try", type=int, default=5000)
+    parser.add_argument("--grid", help="(dock_starts) Evenly spaced perturbations", action="store_true", default=False)
+    parser.add_argument("--max_angle", help="(dock_starts) Largest rotation in degrees", type=float,
+                        default=docking.MAX_ANGLE)
+    parser.add_argument("--max_shift", help="(dock_starts) Largest translation in angstroms", type=float,
+                        default=docking.MAX_SHIFT)
+    parser.add_argument("--seed", help="(dock_starts) Random seed", type=int)
+    parser.add_argument("--output", help="(dock_starts) Output file, .pdb or .npz", type=str, default="...")
+    parser.add_argument("--clash_cutoff", help="(clash) Clash distance in angstroms", type=float,
+                        default=clash.CLASH_CUTOFF)
+    parser.add_argument("--complexes", help="Print every TCR-pMHC assembly in file", action="store_true",
+                        default=False)
+    parser.add_argument("--split_complexes", help="Write each TCR-pMHC assembly into its own directory",
+                        action="store_true", default=False)
+    parser.add_argument("--select", help="Atoms to act on, prints the selected residues when no action is given. "
+                                         "Ex. 'chain E and resi 95-110', 'cdr3b and name CA'", type=str)
+    parser.add_argument("--mute", help="(select) Mute selected atoms (ATOM -> DEATOM)", action="store_true",
+                        default=False)
+    parser.add_argument("--unmute", help="(select) Unmute selected atoms (DEATOM -> ATOM)", action="store_true",
+                        default=False)
+    parser.add_argument("--remove", help="(select) Remove selected atoms, other lines are kept", action="store_true",
+                        default=False)
+    parser.add_argument("--extract", help="(select) Write selected atoms to <pdb id><suffix>.pdb. Ex. _cdr3",
+                        type=str)
     return parser.parse_args()
 
 
@@ -1746,6 +1970,12 @@ def main():
         pdb.split_tcr("...", True)
     if args.pmhc_split:
         pdb.split_pmhc()
+    if args.split_all:
+        if args.archive:
+            print(pdb.split_archive())
+        else:
+            for component, name in pdb.split_components().items():
+                print(component + "\t" + name)
     if args.renum:
         pdb.clean_docking_count()
     if args.renum2:
@@ -1765,22 +1995,79 @@ def main():
     if args.align:
         pdb.superimpose(args.align, args.tar_chains, args.ref_chains)
     if args.rmsd:
-        pdb.rmsd(args.rmsd, args.tar_chains, args.ref_chains, args.carbon)
+        pdb.rmsd(args.rmsd, args.tar_chains, args.ref_chains, args.carbon, selection=args.select)
     if args.center:
         if os.path.isdir(args.pdb):
             os.mkdir("Results")
             for each in os.listdir(args.pdb):
-                if each.endswith(".pdb"):
+                if each.endswith(PDB_ENDINGS):
                     print(each.split(".")[0])
                     pdb.set_file_name(args.pdb + "/" + each)
-                    pdb.center("Results/" + each.split(".")[0] + "_center.pdb")
+                    pdb.center("Results/" + each.split(".")[0] + "_center" + pdb_suffix(each))
         else:
             pdb.center()
     if args.reorder:
         pdb.reorder_chains(args.reorder)
     if args.pull_cdr:
-        # from getCDRs import cdr_loops
         print(pdb.pull_cdr())
+    if args.sasa:
+        for label, value in pdb.sasa().items():
+            print(label + "\t" + str(round(value, 2)))
+    if args.bsa:
+        if os.path.isdir(args.pdb):
+            for each in sorted(os.listdir(args.pdb)):
+                if each.endswith(PDB_ENDINGS):
+                    pdb.set_file_name(args.pdb + "/" + each)
+                    result = pdb.buried_surface_area(args.tcr_chains, args.pmhc_chains)
+                    print(each.split(".")[0] + "\t" + str(round(result['bsa'], 2)))
+        else:
+            result = pdb.buried_surface_area(args.tcr_chains, args.pmhc_chains)
+            for label, value in result['delta'].items():
+                if value > 0:
+                    print(label + "\t" + str(round(value, 2)))
+            print("BSA: " + str(round(result['bsa'], 2)))
+    if args.clash:
+        chains_1, chains_2 = args.clash.split(":")
+        if args.any_clash and os.path.isdir(args.pdb):
+            for each in sorted(os.listdir(args.pdb)):
+                if each.endswith(PDB_ENDINGS):
+                    pdb.set_file_name(args.pdb + "/" + each)
+                    found = pdb.check_clashes(chains_1, chains_2, args.clash_cutoff, True)
+                    print(each.split(".")[0] + "\t" + str(found))
+        elif args.any_clash:
+            print(pdb.check_clashes(chains_1, chains_2, args.clash_cutoff, True))
+        else:
+            result = pdb.check_clashes(chains_1, chains_2, args.clash_cutoff)
+            for atom_1, atom_2, distance in result['pairs']:
+                print(str(atom_1) + "\t" + str(atom_2) + "\t" + str(round(distance, 3)))
+            for label, count in result['residues'].items():
+                print(label + "\t" + str(count))
+    if args.dock_starts:
+        count = pdb.docking_starts(args.dock_starts, args.n_starts, args.output, args.grid, args.max_angle,
+                                   args.max_shift, args.seed, args.clash_cutoff)
+        print("Starts: " + str(count) + " of " + str(args.n_starts))
+    if args.complexes:
+        for assembly in pdb.get_complexes():
+            print(assembly)
+    if args.split_complexes:
+        for copy in pdb.split_complexes():
+            print(copy)
+    if args.select:
+        if args.mute:
+            pdb.mute_aa(None, None, None, args.select)
+        if args.unmute:
+            pdb.unmute_aa(None, None, None, args.select)
+        if args.remove:
+            pdb.trim_chain(None, None, args.select)
+        if args.extract:
+            pdb.split_chains(None, args.extract, os.path.join(os.path.dirname(args.pdb), ''), args.select)
+        if not (args.mute or args.unmute or args.remove or args.extract or args.rmsd):
+            structure = pdb.get_structure()
+            mask = pdb.select_atoms(args.select)
+            residues, labels = structure.residue_index()
+            for pos in np.unique(residues[mask]):
+                print(labels[pos])
+            print("Atoms: " + str(int(mask.sum())))
 
 
 if __name__ == '__main__':
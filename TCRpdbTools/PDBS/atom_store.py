@@ -0,0 +1,293 @@
+#!/usr/bin/python3
+
+######################################################################
+# atom_store.py -- A component of TRain                              #
+# Copyright: Austin Seamann, Dario Ghersi, and Ryan Ehrlich          #
+# Goal: Columnar store of every atom in the structure library. Each  #
+#       field is one contiguous array on disk with per-structure     #
+#       offsets, memory-mapped for reads, so scans across the whole  #
+#       library never parse PDB text.                                #
+######################################################################
+
+
+import argparse
+import json
+import os
+import shutil
+import numpy as np
+try:  # Imported as part of the web app
+    from PDBS.structure import Structure, parse_pdb, structure_from_lines, file_key
+    from PDBS import library
+except ImportError:  # Ran as a script from within PDBS/
+    from structure import Structure, parse_pdb, structure_from_lines, file_key
+    import library
+
+#################
+#     Global    #
+#################
+STORE_DIR = "atom_store"  # Store kept in the library directory
+STORE_VERSION = 1
+META_FILE = "meta.json"
+
+
+#################
+#    Methods    #
+#################
+def _parse_worker(file_name):
+    # File -> (fields, header lines, file key) or the error message
+    try:
+        structure = parse_pdb(file_name)
+        return {name: getattr(structure, name) for name in Structure.FIELDS}, structure.header, \
+            list(file_key(file_name)[1:])
+    except (ValueError, IndexError, OSError) as error:
+        return str(error)
+
+
+def build_store(location, out_dir=None, workers=None, id_file=None):
+    """
+    Parse every library file once and write the atoms as one raw array per field plus the offset of each structure.
+    Files are parsed in parallel and streamed to disk in library order, the previous store is only replaced once the
+    new one is complete
+
+    Parameters
+    ----------
+    location : str
+        Library directory
+    out_dir : str
+        Optional store directory, defaults to STORE_DIR in the library
+    workers : int
+    id_file : str
+        Optional STCRDat summary TSV or ID list, see library.library_files()
+
+    Returns
+    -------
+    counts : dict
+        'structures', 'atoms' and 'errors' list of (pdb, message)
+    """
+    out_dir = out_dir or os.path.join(location, STORE_DIR)
+    building = out_dir + ".tmp"
+    shutil.rmtree(building, ignore_errors=True)
+    os.makedirs(building)
+    files = library.library_files(location, id_file)
+    outputs = {name: open(os.path.join(building, name + ".bin"), 'wb') for name in Structure.FIELDS}
+    # Every structure is written with the types parse_pdb() gives an empty file, so columns line up
+    empty = structure_from_lines([])
+    names, keys, headers, offsets, errors = [], [], [], [0], []
+    try:
+        for file_name, result in zip(files, library.parallel_imap(_parse_worker, files, workers)):
+            if isinstance(result, str):
+                errors.append((library.pdb_name(file_name), result))
+                continue
+            fields, header, key = result
+            for name in Structure.FIELDS:
+                column = np.ascontiguousarray(fields[name], dtype=getattr(empty, name).dtype)
+                outputs[name].write(column.tobytes())
+            names.append(library.pdb_name(file_name))
+            keys.append([os.path.basename(file_name)] + key)
+            headers.append(header)
+            offsets.append(offsets[-1] + len(fields['atom_num']))
+    finally:
+        for output in outputs.values():
+            output.close()
+    np.save(os.path.join(building, "offsets.npy"), np.array(offsets, dtype=np.int64))
+    with open(os.path.join(building, META_FILE), 'w') as file:
+        json.dump({'version': STORE_VERSION, 'names': names, 'files': keys, 'headers': headers,
+                   'fields': {name: {'dtype': getattr(empty, name).dtype.str,
+                                     'shape': list(getattr(empty, name).shape[1:])} for name in Structure.FIELDS}},
+                  file)
+    old = out_dir + ".old"
+    shutil.rmtree(old, ignore_errors=True)
+    if os.path.exists(out_dir):
+        os.replace(out_dir, old)
+    os.replace(building, out_dir)
+    shutil.rmtree(old, ignore_errors=True)
+    return {'structures': len(names), 'atoms': offsets[-1], 'errors': errors}
+
+
+class AtomStore:
+    """
+    Read only view of a store written by build_store(). Fields are memory-mapped, so opening the store costs
+    nothing and a scan only touches the columns it uses
+    """
+    def __init__(self, location):
+        """
+        Initialize AtomStore
+
+        Parameters
+        ----------
+        location : str
+            Store directory, or a library directory holding STORE_DIR
+        """
+        if not os.path.exists(os.path.join(location, META_FILE)):
+            location = os.path.join(location, STORE_DIR)
+        if not os.path.exists(os.path.join(location, META_FILE)):
+            raise FileNotFoundError("Atom store not found in %s, build it with: python atom_store.py <library> "
+                                    "--build" % location)
+        with open(os.path.join(location, META_FILE), 'r') as file:
+            meta = json.load(file)
+        if meta['version'] != STORE_VERSION:
+            raise ValueError("Atom store %s is version %d, rebuild it for version %d"
+                             % (location, meta['version'], STORE_VERSION))
+        self.location = location
+        self.names = meta['names']
+        self.files = meta['files']
+        self.headers = meta['headers']
+        self.offsets = np.load(os.path.join(location, "offsets.npy"))
+        self.index = {name: pos for pos, name in enumerate(self.names)}
+        self.file_index = {entry[0]: pos for pos, entry in enumerate(self.files)}
+        self.fields = {}
+        for name, spec in meta['fields'].items():
+            shape = (int(self.offsets[-1]),) + tuple(spec['shape'])
+            if shape[0] == 0:
+                self.fields[name] = np.zeros(shape, dtype=np.dtype(spec['dtype']))
+            else:
+                self.fields[name] = np.memmap(os.path.join(location, name + ".bin"), dtype=np.dtype(spec['dtype']),
+                                              mode='r', shape=shape)
+        self._owners = None
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def structure(self, name):
+        """
+        Returns one structure of the store, every field is a view of the mapped arrays (nothing is copied)
+
+        Parameters
+        ----------
+        name : str
+            PDB name, ex. '1ao7'
+
+        Returns
+        -------
+        structure : Structure
+        """
+        pos = self.index[name]
+        start, end = self.offsets[pos], self.offsets[pos + 1]
+        return Structure({field: column[start:end] for field, column in self.fields.items()},
+                         list(self.headers[pos]))
+
+    def current(self, file_name):
+        """
+        Returns the name a file is stored under when the stored copy is of the file as it is on disk, otherwise None
+
+        Parameters
+        ----------
+        file_name : str
+        """
+        pos = self.file_index.get(os.path.basename(file_name))
+        if pos is None or not os.path.exists(file_name):
+            return None
+        return self.names[pos] if self.files[pos][1:] == list(file_key(file_name)[1:]) else None
+
+    def owners(self):
+        """
+        Returns the position of the structure holding each atom of the store
+        """
+        if self._owners is None:
+            self._owners = np.repeat(np.arange(len(self.names)), np.diff(self.offsets))
+        return self._owners
+
+    def per_structure(self, values, default=''):
+        """
+        Spread one value per structure to every atom of that structure
+
+        Parameters
+        ----------
+        values : dict
+            Structure name -> value, structures left out get default
+
+        Returns
+        -------
+        column : np.ndarray
+        """
+        return np.array([values.get(name, default) for name in self.names])[self.owners()]
+
+    def chain_mask(self, chains):
+        """
+        Mask of the atoms on the given chains of each structure, ex. the beta chain of every TCR
+
+        Parameters
+        ----------
+        chains : dict
+            Structure name -> chain IDs, ex. {'1ao7': 'E'}
+
+        Returns
+        -------
+        mask : np.ndarray
+        """
+        width = max([len(value) for value in chains.values()] + [0])
+        mask = np.zeros(len(self.owners()), dtype=bool)
+        for pos in range(width):
+            mask |= self.fields['chain_id'] == self.per_structure({name: value[pos] for name, value in chains.items()
+                                                                  if pos < len(value)})
+        return mask
+
+    def range_mask(self, ranges):
+        """
+        Mask of the atoms in one residue range of each structure, ex. the CDR3 beta loop of every TCR
+
+        Parameters
+        ----------
+        ranges : dict
+            Structure name -> (chain, first residue number, last residue number)
+
+        Returns
+        -------
+        mask : np.ndarray
+        """
+        chains = self.per_structure({name: value[0] for name, value in ranges.items()})
+        first = self.per_structure({name: value[1] for name, value in ranges.items()}, 0).astype(np.int64)
+        last = self.per_structure({name: value[2] for name, value in ranges.items()}, -1).astype(np.int64)
+        comp_num = self.fields['comp_num']
+        return (self.fields['chain_id'] == chains) & (comp_num >= first) & (comp_num <= last)
+
+    def select(self, mask, field='coords'):
+        """
+        Values of one field for the atoms of a mask, grouped by structure
+
+        Parameters
+        ----------
+        mask : np.ndarray
+            One entry per atom of the store, ex. range_mask(loops) & (store.fields['atom_id'] == 'CA')
+        field : str
+
+        Returns
+        -------
+        selected : dict
+            Structure name -> values, structures without selected atoms are left out
+        """
+        positions = np.flatnonzero(mask)
+        owners = self.owners()[positions]
+        values = self.fields[field][positions]
+        splits = np.flatnonzero(np.diff(owners)) + 1
+        return {self.names[group[0]]: part for group, part in zip(np.split(owners, splits), np.split(values, splits))
+                if len(group)}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("library", help="Directory of PDB files", type=str)
+    parser.add_argument("--build", help="Write the atom store of the library", action="store_true", default=False)
+    parser.add_argument("--store", help="Location of store, defaults to the library directory", type=str)
+    parser.add_argument("--ids", help="(build) STCRDat summary TSV or ID list", type=str)
+    parser.add_argument("--workers", help="(build) Processes", type=int)
+    return parser.parse_args()
+
+
+####################
+#     Controls     #
+####################
+def main():
+    args = parse_args()
+    if args.build:
+        counts = build_store(args.library, args.store, args.workers, args.ids)
+        for pdb, error in counts['errors']:
+            print(pdb + "\terror\t" + error)
+        print("Structures: %d\tAtoms: %d" % (counts['structures'], counts['atoms']))
+
+
+if __name__ == '__main__':
+    main()
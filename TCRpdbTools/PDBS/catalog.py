@@ -0,0 +1,317 @@
+#!/usr/bin/python3
+
+######################################################################
+# catalog.py -- A component of TRain                                 #
+# Copyright: Austin Seamann, Dario Ghersi, and Ryan Ehrlich          #
+# Goal: SQLite catalog of a local PDB mirror. The header of each     #
+#       file gives the ID, resolution, method and chains, the TCR    #
+#       pair comes from the structure cache. Files are read in       #
+#       parallel and only changed files are read again, so questions #
+#       about the library become one query.                          #
+######################################################################
+
+
+import argparse
+import hashlib
+import os
+import sqlite3
+import time
+try:  # Imported as part of the web app
+    from PDBS.structure import parse_pdb, parse_header, open_pdb, file_key, HEADER_END
+    from PDBS import complexes, library, structure_cache
+except ImportError:  # Ran as a script from within PDBS/
+    from structure import parse_pdb, parse_header, open_pdb, file_key, HEADER_END
+    import complexes
+    import library
+    import structure_cache
+
+#################
+#     Global    #
+#################
+CATALOG_FILE = "catalog.sqlite"  # Catalog kept in the library directory
+CATALOG_VERSION = 2  # Bumped when the parsing changes, every file is then read again
+HASH_BLOCK = 1 << 20  # Bytes hashed at once after the header
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (file TEXT PRIMARY KEY, pdb TEXT NOT NULL, mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL, hash TEXT NOT NULL, resolution REAL, method TEXT, source TEXT, indexed REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS chains (file TEXT NOT NULL, chain TEXT NOT NULL, length INTEGER NOT NULL, role TEXT,
+    score REAL, molecule TEXT, PRIMARY KEY (file, chain));
+CREATE TABLE IF NOT EXISTS settings (name TEXT PRIMARY KEY, value TEXT);
+CREATE INDEX IF NOT EXISTS entries_pdb ON entries (pdb);
+CREATE INDEX IF NOT EXISTS entries_resolution ON entries (resolution);
+CREATE INDEX IF NOT EXISTS chains_role ON chains (role);
+"""
+
+
+#################
+#    Methods    #
+#################
+def scan_file(file_name):
+    """
+    Read the header lines of a PDB file and hash the whole file in the same pass. Lines after the header are only
+    hashed, never decoded. Compressed files are hashed by their decompressed contents
+
+    Parameters
+    ----------
+    file_name : str
+
+    Returns
+    -------
+    header : list
+    digest : str
+        SHA1 of the file contents
+    """
+    header = []
+    digest = hashlib.sha1()
+    end = tuple(record.encode() for record in HEADER_END)
+    with open_pdb(file_name, 'rb') as file:
+        for line in file:
+            digest.update(line)
+            if line[0:6] in end:
+                break
+            header.append(line.decode('latin-1'))
+        for block in iter(lambda: file.read(HASH_BLOCK), b''):
+            digest.update(block)
+    return header, digest.hexdigest()
+
+
+def chain_roles(sequences, tcr=None):
+    """
+    Role of every chain: ALPHA, BETA, MHC, B2M or PEPTIDE. The TCR pair is the one of complexes.tcr_chains() (as in
+    PdbTools3.get_tcr_chains()), other TCR chains take the role their sequence scores best on
+
+    Parameters
+    ----------
+    sequences : dict
+        chain -> sequence
+    tcr : dict
+        Optional {'ALPHA': chain, 'BETA': chain} of the file
+
+    Returns
+    -------
+    roles : dict
+        chain -> (role, normalized score to the reference of that role)
+    """
+    scores = complexes.role_scores(sequences)
+    classes = complexes.classify_chains(sequences, scores)
+    for role, chain in (tcr or {}).items():
+        if chain in classes:
+            classes[chain] = role
+    roles = {}
+    for chain, kind in classes.items():
+        if kind == 'TCR':  # Unpaired TCR chain
+            kind = 'ALPHA' if scores[chain]['ALPHA'] >= scores[chain]['BETA'] else 'BETA'
+        roles[chain] = (kind, scores[chain][kind] if kind in scores[chain] else None)
+    return roles
+
+
+def catalog_entry(file_name, known_hash=None):
+    """
+    Catalog record of one PDB file. Chains come from the SEQRES records, files without them (ex. cleaned files)
+    fall back on the sequence of their ATOM records
+
+    Parameters
+    ----------
+    file_name : str
+    known_hash : str
+        Hash already in the catalog, the header is not parsed when the contents did not change
+
+    Returns
+    -------
+    entry : dict
+        'file', 'key' (mtime_ns, size), 'hash', plus when changed 'pdb', 'resolution', 'method', 'source' and
+        'chains' list of (chain, length, role, score, molecule). 'error' holds the message when the file can not be read
+    """
+    name = os.path.basename(file_name)
+    try:
+        key = list(file_key(file_name)[1:])
+        header, digest = scan_file(file_name)
+        entry = {'file': name, 'key': key, 'hash': digest}
+        if digest == known_hash:
+            return entry
+        metadata = parse_header(header)
+        sequences, source = metadata['seqres'], 'SEQRES'
+        if not sequences:
+            sequences, source = parse_pdb(file_name, hetatm=False).chain_sequences(), 'ATOM'
+        roles = chain_roles(sequences, structure_cache.load(file_name)[1]['tcr'])
+        entry.update({'pdb': metadata['pdb'] or library.pdb_name(file_name), 'resolution': metadata['resolution'],
+                      'method': metadata['method'], 'source': source})
+        entry['chains'] = [(chain, len(seq)) + roles.get(chain, (None, None)) + (metadata['molecules'].get(chain, ''),)
+                           for chain, seq in sequences.items()]
+        return entry
+    except (ValueError, KeyError, IndexError, OSError) as error:
+        return {'file': name, 'error': str(error)}
+
+
+def _entry_worker(job):
+    # (file, hash in the catalog or None) -> catalog_entry()
+    return catalog_entry(*job)
+
+
+def connect(location, file_name=None):
+    """
+    Open (and create) the catalog of a library directory
+
+    Parameters
+    ----------
+    location : str
+        Library directory
+    file_name : str
+        Optional catalog file, defaults to CATALOG_FILE in the library
+
+    Returns
+    -------
+    connection : sqlite3.Connection
+    """
+    connection = sqlite3.connect(file_name or os.path.join(location, CATALOG_FILE))
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.executescript(SCHEMA)
+    version = connection.execute("SELECT value FROM settings WHERE name = 'version'").fetchone()
+    if version is None or int(version[0]) != CATALOG_VERSION:
+        with connection:
+            connection.execute("DELETE FROM entries")
+            connection.execute("DELETE FROM chains")
+            connection.execute("INSERT OR REPLACE INTO settings VALUES ('version', ?)", (str(CATALOG_VERSION),))
+    return connection
+
+
+def update_catalog(location, file_name=None, workers=None):
+    """
+    Bring the catalog of a library up to date. Files whose modification time and size are unchanged are skipped
+    without being opened, touched files are hashed and only re-parsed when their contents changed, removed files
+    are dropped
+
+    Parameters
+    ----------
+    location : str
+        Library directory
+    file_name : str
+        Optional catalog file
+    workers : int
+
+    Returns
+    -------
+    counts : dict
+        'indexed', 'unchanged', 'removed' and 'errors' list of (file, message)
+    """
+    connection = connect(location, file_name)
+    known = {row[0]: (row[1], row[2], row[3]) for row in
+             connection.execute("SELECT file, mtime_ns, size, hash FROM entries")}
+    files = library.library_files(location)
+    jobs = []
+    for each in files:
+        name = os.path.basename(each)
+        stored = known.get(name)
+        if stored is None or list(stored[:2]) != list(file_key(each)[1:]):
+            jobs.append((each, stored[2] if stored else None))
+    present = set(os.path.basename(each) for each in files)
+    removed = [name for name in known if name not in present]
+    counts = {'indexed': 0, 'unchanged': len(files) - len(jobs), 'removed': len(removed), 'errors': []}
+    now = time.time()
+    with connection:
+        for name in removed:
+            connection.execute("DELETE FROM entries WHERE file = ?", (name,))
+            connection.execute("DELETE FROM chains WHERE file = ?", (name,))
+        for entry in library.parallel_imap(_entry_worker, jobs, workers):
+            if 'error' in entry:
+                counts['errors'].append((entry['file'], entry['error']))
+            elif 'chains' not in entry:  # Touched but same contents
+                connection.execute("UPDATE entries SET mtime_ns = ?, size = ? WHERE file = ?",
+                                   tuple(entry['key']) + (entry['file'],))
+                counts['unchanged'] += 1
+            else:
+                connection.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                   (entry['file'], entry['pdb'], entry['key'][0], entry['key'][1], entry['hash'],
+                                    entry['resolution'], entry['method'], entry['source'], now))
+                connection.execute("DELETE FROM chains WHERE file = ?", (entry['file'],))
+                connection.executemany("INSERT INTO chains VALUES (?, ?, ?, ?, ?, ?)",
+                                       [(entry['file'],) + tuple(chain) for chain in entry['chains']])
+                counts['indexed'] += 1
+    connection.close()
+    return counts
+
+
+def query(location, max_resolution=None, roles=None, molecule=None, method=None, file_name=None):
+    """
+    Entries of the catalog matching every filter given, ex. TCRs under 2.5 angstroms with HLA-A2:
+    query(library, 2.5, ['ALPHA', 'BETA'], 'A-2')
+
+    Parameters
+    ----------
+    location : str
+        Library directory
+    max_resolution : float
+        Highest resolution value (angstroms) kept, entries without a resolution are left out
+    roles : list
+        Chain roles every entry must hold, ex. ['ALPHA', 'BETA', 'MHC']
+    molecule : str
+        Text found in the COMPND molecule name of one of the chains (case insensitive)
+    method : str
+        Text found in the experimental method
+    file_name : str
+        Optional catalog file
+
+    Returns
+    -------
+    entries : list
+        Dictionaries with 'pdb', 'file', 'resolution', 'method' and 'chains' chain -> role, best resolution first
+    """
+    where, values = [], []
+    if max_resolution is not None:
+        where.append("e.resolution <= ?")
+        values.append(max_resolution)
+    for role in roles or []:
+        where.append("EXISTS (SELECT 1 FROM chains c WHERE c.file = e.file AND c.role = ?)")
+        values.append(role)
+    if molecule:
+        where.append("EXISTS (SELECT 1 FROM chains c WHERE c.file = e.file AND c.molecule LIKE ?)")
+        values.append('%' + molecule + '%')
+    if method:
+        where.append("e.method LIKE ?")
+        values.append('%' + method + '%')
+    connection = connect(location, file_name)
+    rows = connection.execute("SELECT e.file, e.pdb, e.resolution, e.method FROM entries e"
+                              + (" WHERE " + " AND ".join(where) if where else "")
+                              + " ORDER BY e.resolution IS NULL, e.resolution, e.pdb", values).fetchall()
+    chains = {}
+    for name, chain, role in connection.execute("SELECT file, chain, role FROM chains ORDER BY file, chain"):
+        chains.setdefault(name, {})[chain] = role
+    connection.close()
+    return [{'pdb': pdb, 'file': name, 'resolution': resolution, 'method': method, 'chains': chains.get(name, {})}
+            for name, pdb, resolution, method in rows]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("library", help="Directory of PDB files", type=str)
+    parser.add_argument("--update", help="Index new and changed files of the library", action="store_true",
+                        default=False)
+    parser.add_argument("--catalog", help="Location of catalog, defaults to the library directory", type=str)
+    parser.add_argument("--workers", help="(update) Processes", type=int)
+    parser.add_argument("--query", help="List the entries matching the filters below", action="store_true",
+                        default=False)
+    parser.add_argument("--max_resolution", help="(query) Highest resolution", type=float)
+    parser.add_argument("--roles", help="(query) Chain roles required, ex. ALPHA BETA MHC", type=str, nargs="+")
+    parser.add_argument("--molecule", help="(query) Text in a chain's molecule name, ex. A-2", type=str)
+    parser.add_argument("--method", help="(query) Text in the experimental method", type=str)
+    return parser.parse_args()
+
+
+####################
+#     Controls     #
+####################
+def main():
+    args = parse_args()
+    if args.update:
+        counts = update_catalog(args.library, args.catalog, args.workers)
+        for name, error in counts['errors']:
+            print(name + "\terror\t" + error)
+        print("Indexed: %d\tUnchanged: %d\tRemoved: %d" % (counts['indexed'], counts['unchanged'], counts['removed']))
+    if args.query:
+        for entry in query(args.library, args.max_resolution, args.roles, args.molecule, args.method, args.catalog):
+            print("\t".join([entry['pdb'], str(entry['resolution']), entry['method'],
+                             ",".join(chain + ":" + str(role) for chain, role in entry['chains'].items())]))
+
+
+if __name__ == '__main__':
+    main()
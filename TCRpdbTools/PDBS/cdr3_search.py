@@ -0,0 +1,253 @@
+#!/usr/bin/python3
+
+######################################################################
+# cdr3_search.py -- A component of TRain                             #
+# Copyright: Austin Seamann, Dario Ghersi, and Ryan Ehrlich          #
+# Goal: Find the solved structures whose CDR3 is closest to a query  #
+#       sequence. CDR3 alpha/beta of the whole library are put in a  #
+#       k-mer inverted index once; a query only scores the entries   #
+#       sharing the most k-mers with it (or all of them, exactly).   #
+######################################################################
+
+
+import argparse
+import os
+from functools import lru_cache
+import numpy as np
+from Bio import Align
+from Bio.Align import substitution_matrices
+try:  # Imported as part of the web app
+    from PDBS import germline, library
+except ImportError:  # Ran as a script from within PDBS/
+    import germline
+    import library
+
+#################
+#     Global    #
+#################
+INDEX_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cdr3_index.npz")
+INDEX_VERSION = 1
+K = 3  # k-mer length, CDR3s are short
+CANDIDATES = 100  # Entries with the most shared k-mers that get a full distance
+METRICS = ('edit', 'blosum')
+
+
+#################
+#    Methods    #
+#################
+def build_index(location, file_name=INDEX_FILE, workers=None, k=K, id_file=None):
+    """
+    Extract the CDR3 alpha and beta of every library file and save the k-mer inverted index
+
+    Parameters
+    ----------
+    location : str
+        Library directory
+    file_name : str
+        Output .npz
+    workers : int
+        Processes used to read the library
+    k : int
+    id_file : str
+        Optional STCRDat summary TSV or ID list, see library.library_files()
+
+    Returns
+    -------
+    count : int
+        Number of CDR3s indexed
+    """
+    pdbs, chain_types, chains, cdr3s = [], [], [], []
+    for result in library.library_sequences(location, id_file, workers):
+        for chain_type in ('ALPHA', 'BETA'):
+            if chain_type not in result:
+                continue
+            cdr3 = germline.motif_cdr3(result[chain_type][1])[0]
+            if cdr3:
+                pdbs.append(result['pdb'])
+                chain_types.append(chain_type)
+                chains.append(result[chain_type][0])
+                cdr3s.append(cdr3)
+    codes, entries = [], []
+    for entry, cdr3 in enumerate(cdr3s):
+        found = np.unique(germline.encode_kmers(cdr3, k))
+        codes.append(found)
+        entries.append(np.full(len(found), entry, dtype=np.int32))
+    codes = np.concatenate(codes) if codes else np.zeros(0, dtype=np.int64)
+    entries = np.concatenate(entries) if entries else np.zeros(0, dtype=np.int32)
+    order = np.argsort(codes, kind='stable')
+    np.savez(file_name, version=INDEX_VERSION, k=k, pdbs=np.array(pdbs, dtype=str),
+             chain_types=np.array(chain_types, dtype=str), chains=np.array(chains, dtype=str),
+             cdr3s=np.array(cdr3s, dtype=str), kmers=codes[order], kmer_entries=entries[order])
+    return len(cdr3s)
+
+
+def load_index(file_name=INDEX_FILE):
+    """
+    Load the CDR3 index, reloaded only when the file on disk changes
+
+    Parameters
+    ----------
+    file_name : str
+
+    Returns
+    -------
+    index : dict
+    """
+    if not os.path.exists(file_name):
+        raise FileNotFoundError("CDR3 index %s not found, build it with: python cdr3_search.py <library> --build"
+                                % file_name)
+    return _load_index(file_name, os.stat(file_name).st_mtime_ns)
+
+
+@lru_cache(maxsize=2)
+def _load_index(file_name, mtime):
+    with np.load(file_name) as data:
+        index = {name: data[name] for name in data.files}
+    if int(index['version']) != INDEX_VERSION:
+        raise ValueError("CDR3 index %s is version %d, rebuild it for version %d"
+                         % (file_name, int(index['version']), INDEX_VERSION))
+    index['cdr3_list'] = index['cdr3s'].tolist()
+    return index
+
+
+def edit_distance(seq_1, seq_2):
+    """
+    Levenshtein distance between two sequences
+
+    Returns
+    -------
+    distance : int
+    """
+    previous = list(range(len(seq_2) + 1))
+    for pos_1, amino_1 in enumerate(seq_1, start=1):
+        current = [pos_1]
+        for pos_2, amino_2 in enumerate(seq_2, start=1):
+            current.append(min(previous[pos_2] + 1, current[pos_2 - 1] + 1,
+                               previous[pos_2 - 1] + (amino_1 != amino_2)))
+        previous = current
+    return previous[-1]
+
+
+@lru_cache(maxsize=1)
+def blosum_aligner():
+    """
+    Returns the global BLOSUM62 aligner used by blosum_distance()
+    """
+    aligner = Align.PairwiseAligner()
+    aligner.mode = 'global'
+    aligner.substitution_matrix = substitution_matrices.load('BLOSUM62')
+    aligner.open_gap_score = -6
+    aligner.extend_gap_score = -1
+    return aligner
+
+
+def blosum_distance(seq_1, seq_2):
+    """
+    Distance from BLOSUM62 alignment scores: s(1, 1) + s(2, 2) - 2 s(1, 2), 0 for identical sequences
+
+    Returns
+    -------
+    distance : float
+    """
+    aligner = blosum_aligner()
+    return float(aligner.score(seq_1, seq_1) + aligner.score(seq_2, seq_2) - 2 * aligner.score(seq_1, seq_2))
+
+
+def search(seq, top=10, chain_type=None, metric='edit', index=None, candidates=CANDIDATES):
+    """
+    Top k library CDR3s closest to a query. Shared k-mers with every entry are counted in one lookup and only the
+    candidates entries sharing the most are scored with the full distance. The search is therefore approximate: a
+    close CDR3 sharing few k-mers with the query (ex. short or heavily substituted ones) can be missed. Pass
+    candidates=None to score every entry for exact results
+
+    Parameters
+    ----------
+    seq : str
+        Query CDR3
+    top : int
+        Number of hits returned, at least 1
+    chain_type : str
+        Optional 'ALPHA' or 'BETA'
+    metric : str
+        'edit' or 'blosum'
+    index : dict
+        Optional output of load_index()
+    candidates : int
+        Entries given a full distance, None scores all of them
+
+    Returns
+    -------
+    hits : list
+        Dictionaries with 'pdb', 'chain_type', 'chain', 'cdr3' and 'distance', closest first
+    """
+    if metric not in METRICS:
+        raise ValueError("Unknown metric %s, use one of %s" % (metric, ", ".join(METRICS)))
+    if top < 1:
+        raise ValueError("top must be at least 1, got %d" % top)
+    index = load_index() if index is None else index
+    seq = seq.strip().upper()
+    n_entries = len(index['cdr3s'])
+    shared = np.zeros(n_entries, dtype=np.int64)
+    codes = np.unique(germline.encode_kmers(seq, int(index['k'])))
+    if len(codes):
+        left = np.searchsorted(index['kmers'], codes, side='left')
+        right = np.searchsorted(index['kmers'], codes, side='right')
+        counts = right - left
+        hits = np.repeat(left, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        shared = np.bincount(index['kmer_entries'][hits], minlength=n_entries)
+    allowed = np.ones(n_entries, dtype=bool) if chain_type is None else index['chain_types'] == chain_type
+    # Most shared k-mers first, closest length breaks ties so short queries still reach similar entries
+    lengths = np.char.str_len(index['cdr3s']) if n_entries else np.zeros(0, dtype=np.int64)
+    order = np.lexsort((np.abs(lengths - len(seq)), -shared))
+    order = order[allowed[order]]
+    if candidates is not None:
+        order = order[:max(candidates, top)]
+    distance = edit_distance if metric == 'edit' else blosum_distance
+    scored = []
+    for entry in order:
+        target = index['cdr3_list'][entry]
+        # Edit distance is at least the length difference, skip entries that can't enter the top k
+        if metric == 'edit' and len(scored) >= top and abs(len(target) - len(seq)) >= scored[top - 1][0]:
+            continue
+        scored.append((distance(seq, target), int(entry)))
+        scored.sort()
+    return [{'pdb': str(index['pdbs'][entry]), 'chain_type': str(index['chain_types'][entry]),
+             'chain': str(index['chains'][entry]), 'cdr3': index['cdr3_list'][entry], 'distance': dist}
+            for dist, entry in scored[:top]]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("library", help="Directory of PDB files (--build)", type=str, nargs="?")
+    parser.add_argument("--build", help="Build the CDR3 index from the library", action="store_true",
+                        default=False)
+    parser.add_argument("--search", help="CDR3 sequence to search for", type=str)
+    parser.add_argument("--top", help="(search) Number of hits", type=int, default=10)
+    parser.add_argument("--chain_type", help="(search) ALPHA or BETA", type=str)
+    parser.add_argument("--metric", help="(search) edit or blosum", type=str, default="edit")
+    parser.add_argument("--candidates", help="(search) Entries sharing the most k-mers that are scored, the search "
+                        "is approximate and may miss close CDR3s outside them", type=int, default=CANDIDATES)
+    parser.add_argument("--exact", help="(search) Score every entry, exact but slower", action="store_true",
+                        default=False)
+    parser.add_argument("--index", help="Location of CDR3 index", type=str, default=INDEX_FILE)
+    parser.add_argument("--workers", help="(build) Processes", type=int)
+    parser.add_argument("--ids", help="(build) STCRDat summary TSV or ID list", type=str)
+    return parser.parse_args()
+
+
+####################
+#     Controls     #
+####################
+def main():
+    args = parse_args()
+    if args.build:
+        count = build_index(args.library, args.index, args.workers, id_file=args.ids)
+        print("CDR3s indexed: " + str(count))
+    if args.search:
+        candidates = None if args.exact else args.candidates
+        for hit in search(args.search, args.top, args.chain_type, args.metric, load_index(args.index), candidates):
+            print("\t".join([hit['pdb'], hit['chain_type'], hit['chain'], hit['cdr3'], str(hit['distance'])]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,305 @@
+#!/usr/bin/python3
+
+######################################################################
+# cif.py -- A component of TRain                                     #
+# Copyright: Austin Seamann, Dario Ghersi, and Ryan Ehrlich          #
+# Goal: Read mmCIF and BinaryCIF files into the same column oriented #
+#       Structure as PDB files. The _atom_site loop is tokenized as  #
+#       a stream straight into columns, so large assemblies without  #
+#       a PDB format file (over 99,999 atoms, long chain IDs) load   #
+#       as fast as PDB files.                                        #
+######################################################################
+
+
+import re
+import numpy as np
+try:  # Imported as part of the web app
+    from PDBS.structure import Structure, parse_pdb, structure_from_lines, open_pdb
+except ImportError:  # Ran as a script from within PDBS/
+    from structure import Structure, parse_pdb, structure_from_lines, open_pdb
+
+#################
+#     Global    #
+#################
+CIF_ENDINGS = ('.cif', '.cif.gz', '.mmcif', '.mmcif.gz')
+BCIF_ENDINGS = ('.bcif', '.bcif.gz')
+# Token of a CIF data line: quoted value or bare word
+TOKEN = re.compile(r"'(.*?)'(?=\s|$)|\"(.*?)\"(?=\s|$)|(\S+)")
+# BinaryCIF ByteArray type codes
+BYTE_TYPES = {1: '<i1', 2: '<i2', 3: '<i4', 4: '<u1', 5: '<u2', 6: '<u4', 32: '<f4', 33: '<f8'}
+# CIF item(s) read into each Structure field, first one found is used
+ATOM_SITE = {
+    'record': ('group_PDB',),
+    'atom_num': ('id',),
+    'atom_id': ('auth_atom_id', 'label_atom_id'),
+    'alt_loc': ('label_alt_id',),
+    'atom_comp_id': ('auth_comp_id', 'label_comp_id'),
+    'chain_id': ('auth_asym_id', 'label_asym_id'),
+    'comp_num': ('auth_seq_id', 'label_seq_id'),
+    'icode': ('pdbx_PDB_ins_code',),
+    'x': ('Cartn_x',),
+    'y': ('Cartn_y',),
+    'z': ('Cartn_z',),
+    'occupancy': ('occupancy',),
+    'B_iso_or_equiv': ('B_iso_or_equiv',),
+    'atom_type': ('type_symbol',),
+    'model': ('pdbx_PDB_model_num',),
+}
+WANTED = set(name for names in ATOM_SITE.values() for name in names)
+MISSING = ('.', '?')  # CIF values for inapplicable and unknown
+CHUNK_ROWS = 50000  # Rows of text tokens held before they are moved into NumPy columns
+
+
+#################
+#    Methods    #
+#################
+def tokenize(line):
+    """
+    Returns the values of one CIF data line, quotes removed
+    """
+    if "'" not in line and '"' not in line:
+        return line.split()
+    return [next(group for group in match.groups() if group is not None) for match in TOKEN.finditer(line)]
+
+
+def read_atom_site(file):
+    """
+    Stream a CIF file and collect the _atom_site loop column by column. Lines of other categories are skipped
+    without being tokenized and values are moved into NumPy columns every CHUNK_ROWS rows, only for the items
+    listed in ATOM_SITE
+
+    Parameters
+    ----------
+    file : file object
+        Text mode
+
+    Returns
+    -------
+    columns : dict
+        Item name (ex. 'Cartn_x') -> np.ndarray of str
+    """
+    names, tokens, in_loop, reading = [], [], False, False
+    chunks = {}
+
+    def flush(final=False):
+        # Move every complete row gathered so far into the column chunks
+        rows = len(tokens) // len(names)
+        if final and len(tokens) % len(names):
+            raise ValueError("_atom_site loop has %d values for %d columns" % (len(tokens), len(names)))
+        table = np.array(tokens[:rows * len(names)], dtype=str).reshape(rows, len(names))
+        for pos, name in enumerate(names):
+            if name in WANTED:
+                chunks.setdefault(name, []).append(table[:, pos])
+        del tokens[:rows * len(names)]
+
+    for line in file:
+        if reading:
+            if line.startswith(('_', 'loop_', '#', 'data_')):
+                break
+            if line.startswith(';'):  # Text fields are not used by _atom_site
+                continue
+            tokens.extend(tokenize(line))
+            if len(tokens) >= CHUNK_ROWS * len(names):
+                flush()
+        elif line.startswith('loop_'):
+            in_loop, names = True, []
+        elif in_loop and line.startswith('_atom_site.'):
+            names.append(line.split()[0][len('_atom_site.'):])
+        elif in_loop and names:
+            if line.startswith('_'):  # Loop of another category
+                in_loop, names = False, []
+            else:
+                reading = True
+                tokens.extend(tokenize(line))
+        elif in_loop and not line.startswith('_'):
+            in_loop = False
+    if not names:
+        return {}
+    flush(final=True)
+    return {name: np.concatenate(parts) for name, parts in chunks.items()}
+
+
+def structure_from_columns(columns, hetatm=True):
+    """
+    Build a Structure from _atom_site columns (text or decoded BinaryCIF). Only the first model is kept
+
+    Parameters
+    ----------
+    columns : dict
+        Item name -> np.ndarray
+    hetatm : boolean
+        Include HETATM records
+
+    Returns
+    -------
+    structure : Structure
+    """
+    def column(field, default=''):
+        for name in ATOM_SITE[field]:
+            if name in columns:
+                return np.asarray(columns[name])
+        return np.full(length, default)
+
+    def text(field, default=''):
+        values = column(field, default).astype(str)
+        values = np.where(np.isin(values, MISSING), default, values)
+        # Same string type as parse_pdb() unless values are longer (ex. chain IDs over one character)
+        width = max(int(np.char.str_len(values).max()) if len(values) else 0, pdb_types[field].itemsize // 4)
+        return values.astype('U%d' % width)
+
+    def number(field, dtype):
+        values = column(field, '0')
+        if values.dtype.kind in 'iuf':
+            return values.astype(dtype)
+        return np.where(np.isin(values, MISSING), '0', values).astype(dtype)
+
+    pdb_types = {name: getattr(structure_from_lines([]), name).dtype for name in Structure.FIELDS}
+    length = len(next(iter(columns.values()))) if columns else 0
+    keep = np.isin(text('record', 'ATOM'), ('ATOM', 'HETATM') if hetatm else ('ATOM',))
+    models = column('model', '1')
+    if length and np.any(models != models[0]):
+        keep &= models == models[0]
+    fields = {
+        'record': text('record', 'ATOM'),
+        'atom_num': number('atom_num', np.int64),
+        'atom_id': text('atom_id'),
+        'alt_loc': text('alt_loc', ' '),
+        'atom_comp_id': text('atom_comp_id'),
+        'chain_id': text('chain_id'),
+        'comp_num': number('comp_num', np.int64),
+        'icode': text('icode', ' '),
+        'coords': np.column_stack((number('x', np.float64), number('y', np.float64), number('z', np.float64)))
+        .reshape(-1, 3),
+        'occupancy': number('occupancy', np.float64),
+        'B_iso_or_equiv': number('B_iso_or_equiv', np.float64),
+        'atom_type': np.char.upper(text('atom_type')),
+    }
+    return Structure({name: values[keep] for name, values in fields.items()})
+
+
+def parse_cif(file_name, hetatm=True):
+    """
+    Read the atoms of an mmCIF file (plain or compressed) into a Structure
+
+    Parameters
+    ----------
+    file_name : str
+    hetatm : boolean
+        Include HETATM records
+
+    Returns
+    -------
+    structure : Structure
+    """
+    with open_pdb(file_name) as file:
+        return structure_from_columns(read_atom_site(file), hetatm)
+
+
+def decode(data, encodings):
+    """
+    Undo a list of BinaryCIF encodings, last applied first
+
+    Parameters
+    ----------
+    data : bytes or np.ndarray
+    encodings : list
+        Encoding dictionaries of a BinaryCIF column
+
+    Returns
+    -------
+    values : np.ndarray
+    """
+    for encoding in reversed(encodings):
+        kind = encoding['kind']
+        if kind == 'ByteArray':
+            data = np.frombuffer(data, dtype=BYTE_TYPES[encoding['type']])
+        elif kind == 'FixedPoint':
+            data = np.asarray(data, dtype=np.float64) / encoding['factor']
+        elif kind == 'IntervalQuantization':
+            step = (encoding['max'] - encoding['min']) / max(encoding['numSteps'] - 1, 1)
+            data = encoding['min'] + step * np.asarray(data, dtype=np.float64)
+        elif kind == 'RunLength':
+            data = np.repeat(data[0::2], data[1::2])
+        elif kind == 'Delta':
+            data = np.asarray(data, dtype=np.int64).copy()
+            if len(data):
+                data[0] += encoding['origin']
+            data = np.cumsum(data)
+        elif kind == 'IntegerPacking':
+            data = unpack_integers(data, encoding['byteCount'], encoding['isUnsigned'])
+        elif kind == 'StringArray':
+            offsets = decode(encoding['offsets'], encoding['offsetEncoding'])
+            strings = encoding['stringData']
+            table = np.array([strings[start:end] for start, end in zip(offsets[:-1], offsets[1:])] + [''], dtype=str)
+            data = table[decode(data, encoding['dataEncoding'])]  # Index -1 (no value) maps to ''
+        else:
+            raise ValueError("Unknown BinaryCIF encoding %s" % kind)
+    return np.asarray(data)
+
+
+def unpack_integers(data, byte_count, unsigned):
+    """
+    Undo BinaryCIF IntegerPacking: values at the limit of the packed type continue into the next value
+    """
+    data = np.asarray(data, dtype=np.int64)
+    upper = (1 << (8 * byte_count)) - 1 if unsigned else (1 << (8 * byte_count - 1)) - 1
+    limit = data == upper
+    if not unsigned:
+        limit |= data == -upper - 1
+    ends = np.flatnonzero(~limit)
+    totals = np.cumsum(data)[ends]
+    return np.diff(totals, prepend=0)
+
+
+def parse_bcif(file_name, hetatm=True):
+    """
+    Read the atoms of a BinaryCIF file (plain or compressed) into a Structure. Needs the optional msgpack package
+
+    Parameters
+    ----------
+    file_name : str
+    hetatm : boolean
+        Include HETATM records
+
+    Returns
+    -------
+    structure : Structure
+    """
+    try:
+        import msgpack
+    except ImportError:
+        raise ImportError("Reading BinaryCIF needs msgpack: pip install msgpack")
+    with open_pdb(file_name, 'rb') as file:
+        content = msgpack.unpackb(file.read(), raw=False)
+    columns = {}
+    for category in content['dataBlocks'][0]['categories']:
+        if category['name'] != '_atom_site':
+            continue
+        for item in category['columns']:
+            values = decode(item['data']['data'], item['data']['encoding'])
+            if item.get('mask'):
+                mask = decode(item['mask']['data'], item['mask']['encoding'])
+                values = np.where(mask == 0, values.astype(str), '.')
+            columns[item['name']] = values
+    return structure_from_columns(columns, hetatm)
+
+
+def read_structure(file_name, hetatm=True):
+    """
+    Read a structure file of any supported format, decided by its name: mmCIF, BinaryCIF or PDB
+
+    Parameters
+    ----------
+    file_name : str
+    hetatm : boolean
+        Include HETATM records
+
+    Returns
+    -------
+    structure : Structure
+    """
+    if file_name.lower().endswith(BCIF_ENDINGS):
+        return parse_bcif(file_name, hetatm)
+    if file_name.lower().endswith(CIF_ENDINGS):
+        return parse_cif(file_name, hetatm)
+    return parse_pdb(file_name, hetatm)
@@ -0,0 +1,220 @@
+#!/usr/bin/python3
+
+######################################################################
+# clash.py -- A component of TRain                                   #
+# Copyright: Austin Seamann, Dario Ghersi, and Ryan Ehrlich          #
+# Goal: Steric clash detection between two sets of atoms (ex. a TCR  #
+#       and a pMHC) using a cell-list neighbour search.              #
+######################################################################
+
+
+import numpy as np
+
+#################
+#     Global    #
+#################
+CLASH_CUTOFF = 2.5  # Heavy atoms closer than this (angstroms) are clashing
+QUERY_CHUNK = 4096  # Query atoms tested at once in any_clash()
+# The 27 cells surrounding (and including) a cell
+NEIGHBOUR_CELLS = np.array([[x, y, z] for x in (-1, 0, 1) for y in (-1, 0, 1) for z in (-1, 0, 1)], dtype=np.int64)
+
+
+#################
+#    Methods    #
+#################
+class CellList:
+    """
+    Cell list over a fixed set of atoms. Space is cut into cubes the size of the search cutoff so only the 27 cells
+    around a query atom need to be searched
+    """
+    def __init__(self, coords, cutoff=CLASH_CUTOFF):
+        """
+        Initialize CellList
+
+        Parameters
+        ----------
+        coords : np.ndarray
+            (N, 3) coordinates of the atoms being searched
+        cutoff : float
+            Largest distance that will be queried, used as the cell size
+        """
+        self.coords = np.asarray(coords, dtype=np.float64)
+        self.cutoff = cutoff
+        # Occupied cells are kept two cells off the edge of the grid so any query cell next to an occupied cell
+        # still has all 27 of its neighbours in the grid
+        self.origin = self.coords.min(axis=0) - 2.5 * cutoff if len(self.coords) else np.zeros(3)
+        cells = self._cells(self.coords)
+        self.dims = cells.max(axis=0) + 3 if len(cells) else np.ones(3, dtype=np.int64)
+        keys = self._keys(cells)
+        # Atoms sorted by cell with a dense start/count table over every cell of the grid
+        self.order = np.argsort(keys, kind='stable')
+        self.counts = np.bincount(keys, minlength=int(np.prod(self.dims)))
+        self.starts = np.cumsum(self.counts) - self.counts
+        # Cells with an atom in or next to them, lets most query atoms be skipped with one lookup
+        occupied = np.pad((self.counts > 0).reshape(self.dims), 1)
+        self.near = np.zeros(tuple(self.dims), dtype=bool)
+        for x, y, z in NEIGHBOUR_CELLS + 1:
+            self.near |= occupied[x:x + self.dims[0], y:y + self.dims[1], z:z + self.dims[2]]
+        self.near = self.near.reshape(-1)
+
+    def _cells(self, coords):
+        return np.floor((coords - self.origin) / self.cutoff).astype(np.int64)
+
+    def _keys(self, cells):
+        return (cells[:, 0] * self.dims[1] + cells[:, 1]) * self.dims[2] + cells[:, 2]
+
+    def candidates(self, coords):
+        """
+        Returns every (query atom, cell list atom) pair sharing a neighbouring cell
+
+        Parameters
+        ----------
+        coords : np.ndarray
+            (M, 3) query coordinates
+
+        Returns
+        -------
+        query : np.ndarray
+        found : np.ndarray
+            Indices into coords and into the cell list atoms
+        """
+        empty = np.zeros(0, dtype=np.int64)
+        if len(coords) == 0 or len(self.coords) == 0:
+            return empty, empty
+        cells = self._cells(np.asarray(coords, dtype=np.float64))
+        query = np.flatnonzero(np.all((cells >= 1) & (cells < self.dims - 1), axis=1))
+        query = query[self.near[self._keys(cells[query])]]
+        cells = cells[query]
+        query_ids, found_ids = [], []
+        for offset in NEIGHBOUR_CELLS:
+            keys = self._keys(cells + offset)
+            counts = self.counts[keys]
+            hit = np.flatnonzero(counts)
+            if len(hit) == 0:
+                continue
+            # Expand each (query, cell) hit into one row per atom in the cell
+            counts = counts[hit]
+            rows = np.repeat(hit, counts)
+            within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            query_ids.append(query[rows])
+            found_ids.append(self.order[np.repeat(self.starts[keys[hit]], counts) + within])
+        if not query_ids:
+            return empty, empty
+        return np.concatenate(query_ids), np.concatenate(found_ids)
+
+    def pairs_within(self, coords, cutoff=None):
+        """
+        Returns every pair of query atom and cell list atom closer than cutoff
+
+        Parameters
+        ----------
+        coords : np.ndarray
+            (M, 3) query coordinates
+        cutoff : float
+            Optional distance, can not be larger than the cell size
+
+        Returns
+        -------
+        pairs : np.ndarray
+            (P, 2) array of [query index, cell list index]
+        distances : np.ndarray
+        """
+        cutoff = self.cutoff if cutoff is None else min(cutoff, self.cutoff)
+        coords = np.asarray(coords, dtype=np.float64)
+        query, found = self.candidates(coords)
+        diff = coords[query] - self.coords[found]
+        dist = np.sqrt(np.einsum('ij,ij->i', diff, diff))
+        keep = dist < cutoff
+        pairs = np.column_stack((query[keep], found[keep]))
+        order = np.lexsort((pairs[:, 1], pairs[:, 0]))
+        return pairs[order], dist[keep][order]
+
+    def within_mask(self, coords, cutoff=None):
+        """
+        Returns which query atoms are closer than cutoff to any cell list atom
+
+        Parameters
+        ----------
+        coords : np.ndarray
+        cutoff : float
+
+        Returns
+        -------
+        mask : np.ndarray
+        """
+        cutoff = self.cutoff if cutoff is None else min(cutoff, self.cutoff)
+        coords = np.asarray(coords, dtype=np.float64)
+        query, found = self.candidates(coords)
+        diff = coords[query] - self.coords[found]
+        mask = np.zeros(len(coords), dtype=bool)
+        mask[query[np.einsum('ij,ij->i', diff, diff) < cutoff ** 2]] = True
+        return mask
+
+    def any_within(self, coords, cutoff=None):
+        """
+        Returns True as soon as any query atom is closer than cutoff to a cell list atom
+
+        Parameters
+        ----------
+        coords : np.ndarray
+        cutoff : float
+
+        Returns
+        -------
+        boolean
+        """
+        cutoff = self.cutoff if cutoff is None else min(cutoff, self.cutoff)
+        coords = np.asarray(coords, dtype=np.float64)
+        for start in range(0, len(coords), QUERY_CHUNK):
+            chunk = coords[start:start + QUERY_CHUNK]
+            query, found = self.candidates(chunk)
+            diff = chunk[query] - self.coords[found]
+            if np.any(np.einsum('ij,ij->i', diff, diff) < cutoff ** 2):
+                return True
+        return False
+
+
+def find_clashes(structure_1, structure_2, cutoff=CLASH_CUTOFF):
+    """
+    Find clashing atom pairs between two partners
+
+    Parameters
+    ----------
+    structure_1 : Structure
+    structure_2 : Structure
+    cutoff : float
+        Distance in angstroms under which two atoms clash
+
+    Returns
+    -------
+    result : dict
+        'pairs' list of (atom_num_1, atom_num_2, distance), 'residues' maps 'RES_NUM_CHAIN' label -> number of clashes
+        for residues on either partner
+    """
+    pairs, dist = CellList(structure_2.coords, cutoff).pairs_within(structure_1.coords)
+    residues = {}
+    for structure, column in ((structure_1, 0), (structure_2, 1)):
+        index, labels = structure.residue_index()
+        counts = np.bincount(index[pairs[:, column]], minlength=len(labels))
+        for position in np.flatnonzero(counts):
+            residues[labels[position]] = int(counts[position])
+    atom_pairs = [(int(structure_1.atom_num[i]), int(structure_2.atom_num[j]), float(d))
+                  for (i, j), d in zip(pairs, dist)]
+    return {'pairs': atom_pairs, 'residues': residues}
+
+
+def any_clash(structure_1, structure_2, cutoff=CLASH_CUTOFF):
+    """
+    Returns True if any atom of structure_1 clashes with structure_2, stops at the first clash found
+
+    Parameters
+    ----------
+    structure_1 : Structure
+    structure_2 : Structure
+    cutoff : float
+
+    Returns
+    -------
+    boolean
+    """
+    return CellList(structure_2.coords, cutoff).any_within(structure_1.coords)
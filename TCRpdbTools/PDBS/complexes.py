@@ -0,0 +1,272 @@
+#!/usr/bin/python3
+
+######################################################################
+# complexes.py -- A component of TRain                               #
+# Copyright: Austin Seamann, Dario Ghersi, and Ryan Ehrlich          #
+# Goal: Find every TCR-pMHC assembly in a PDB file. Chains are       #
+#       classified once by sequence and then paired by how many      #
+#       residues they have in contact, so files with several copies  #
+#       in the asymmetric unit are split into complete complexes.    #
+######################################################################
+
+
+import numpy as np
+from scipy.spatial import cKDTree
+try:  # Imported as part of the web app
+    from PDBS import references
+except ImportError:  # Ran as a script from within PDBS/
+    import references
+
+#################
+#     Global    #
+#################
+CONTACT_CUTOFF = 8.0  # CA-CA distance (angstroms) for two residues to be in contact
+PEPTIDE_LENGTH = 20  # Chains shorter than this are peptides
+B2M_SCORE = 0.6  # Lowest normalized score to the reference B2M to be called B2M
+B2M_LENGTH = 130  # B2M is ~100 residues, longer chains are MHC chains
+
+
+#################
+#    Methods    #
+#################
+def role_scores(sequences):
+    """
+    Align each chain to the reference ALPHA, BETA, MHC and B2M chains. Scores are normalized by the best score
+    either sequence could reach so short and long chains can be compared
+
+    Parameters
+    ----------
+    sequences : dict
+        chain -> sequence
+
+    Returns
+    -------
+    scores : dict
+        chain -> {role: normalized score}
+    """
+    roles = list(references.REFERENCES)
+    chains = [chain for chain, seq in sequences.items() if seq]
+    pairs = [(sequences[chain], sequences[chain]) for chain in chains]
+    pairs += [(seq, seq) for seq in references.REFERENCES.values()]
+    pairs += [(sequences[chain], references.REFERENCES[role]) for chain in chains for role in roles]
+    # Every alignment of the file in one cache lookup
+    values = references.alignment_scores(pairs)
+    seq_self = dict(zip(chains, values[:len(chains)]))
+    ref_self = dict(zip(roles, values[len(chains):len(chains) + len(roles)]))
+    values = iter(values[len(chains) + len(roles):])
+    scores = {}
+    for chain in chains:
+        scores[chain] = {role: next(values) / min(ref_self[role], seq_self[chain]) for role in roles}
+    return scores
+
+
+def classify_chains(sequences, scores):
+    """
+    Give each chain a broad class: PEPTIDE, B2M, TCR or MHC (MHC class I heavy or either class II chain)
+
+    Parameters
+    ----------
+    sequences : dict
+    scores : dict
+        Output of role_scores()
+
+    Returns
+    -------
+    classes : dict
+        chain -> class
+    """
+    classes = {}
+    for chain, score in scores.items():
+        if len(sequences[chain]) < PEPTIDE_LENGTH:
+            classes[chain] = 'PEPTIDE'
+        elif score['B2M'] >= B2M_SCORE and len(sequences[chain]) <= B2M_LENGTH:
+            classes[chain] = 'B2M'
+        elif max(score['ALPHA'], score['BETA']) > max(score['MHC'], score['B2M']):
+            classes[chain] = 'TCR'
+        else:
+            classes[chain] = 'MHC'
+    return classes
+
+
+def chain_contacts(structure, cutoff=CONTACT_CUTOFF):
+    """
+    Count residue contacts between every pair of chains from one neighbour search over all CA atoms
+
+    Parameters
+    ----------
+    structure : Structure
+    cutoff : float
+        CA-CA distance for a contact
+
+    Returns
+    -------
+    contacts : dict
+        (chain_1, chain_2) -> number of CA pairs within cutoff, stored both ways
+    """
+    ca = structure.select((structure.record == 'ATOM') & (structure.atom_id == 'CA') & (structure.alt_loc != 'B'))
+    chains, chain_index = np.unique(ca.chain_id, return_inverse=True)
+    pairs = cKDTree(ca.coords).query_pairs(cutoff, output_type='ndarray')
+    pairs = chain_index[pairs]
+    pairs = pairs[pairs[:, 0] != pairs[:, 1]]
+    counts = np.zeros((len(chains), len(chains)), dtype=np.int64)
+    np.add.at(counts, (pairs[:, 0], pairs[:, 1]), 1)
+    counts = counts + counts.T
+    contacts = {}
+    for i, j in zip(*np.nonzero(counts)):
+        contacts[(str(chains[i]), str(chains[j]))] = int(counts[i, j])
+    return contacts
+
+
+def greedy_pairs(left, right, weight):
+    """
+    Pair items of left with items of right, heaviest contact first, each item used once. When left and right are the
+    same list items are paired among themselves
+
+    Parameters
+    ----------
+    left : list
+    right : list
+    weight : function
+        (left item, right item) -> contact count
+
+    Returns
+    -------
+    pairs : list
+        (left item, right item) with a contact count above 0
+    """
+    same = left is right
+    options = sorted(((weight(a, b), a, b) for a in left for b in right if not same or a != b), key=lambda x: -x[0])
+    used_left, used_right = set(), set()
+    if same:
+        used_right = used_left
+    pairs = []
+    for count, a, b in options:
+        if count <= 0:
+            break
+        if a not in used_left and b not in used_right:
+            used_left.add(a)
+            used_right.add(b)
+            pairs.append((a, b))
+    return pairs
+
+
+def pair_tcrs(chains, scores, touch):
+    """
+    Pair TCR chains by contact, orientation decided by which assignment matches the references best
+
+    Parameters
+    ----------
+    chains : list
+        Chains classified as TCR
+    scores : dict
+        Output of role_scores()
+    touch : function
+        (chain, chain) -> contact count, called with single chain IDs (which may be several characters long)
+
+    Returns
+    -------
+    tcrs : list
+        {'ALPHA': chain, 'BETA': chain} per pair
+    """
+    tcrs = []
+    for a, b in greedy_pairs(chains, chains, touch):
+        if scores[a]['ALPHA'] + scores[b]['BETA'] < scores[b]['ALPHA'] + scores[a]['BETA']:
+            a, b = b, a
+        tcrs.append({'ALPHA': a, 'BETA': b})
+    return tcrs
+
+
+def tcr_chains(structure, scores=None):
+    """
+    Returns the alpha and beta chain of the first TCR in the file (by alpha chain order). Falls back on the best
+    scoring alpha chain and the best scoring beta chain of the others classified TCR when no pair is in contact
+
+    Parameters
+    ----------
+    structure : Structure
+    scores : dict
+        Optional output of role_scores()
+
+    Returns
+    -------
+    result : dict
+        'ALPHA' and 'BETA' chain IDs, same as PdbTools3.get_tcr_chains(). Empty when fewer than two chains are
+        classified TCR
+    """
+    sequences = structure.chain_sequences()
+    if scores is None:
+        scores = role_scores(sequences)
+    classes = classify_chains(sequences, scores)
+    contacts = chain_contacts(structure)
+    chains = [chain for chain in classes if classes[chain] == 'TCR']
+    tcrs = pair_tcrs(chains, scores, lambda a, b: contacts.get((a, b), 0))
+    if tcrs:
+        order = {chain: pos for pos, chain in enumerate(sequences)}
+        return min(tcrs, key=lambda x: order[x['ALPHA']])
+    if len(chains) < 2:  # No TCR in the file (ex. pMHC only), any pick would be an MHC or peptide chain
+        return {}
+    alpha = max(chains, key=lambda chain: scores[chain]['ALPHA'])
+    rest = [chain for chain in chains if chain != alpha]
+    return {'ALPHA': alpha, 'BETA': max(rest, key=lambda chain: scores[chain]['BETA'])}
+
+
+def find_complexes(structure, scores=None):
+    """
+    Find every TCR-pMHC assembly of a structure
+
+    Parameters
+    ----------
+    structure : Structure
+    scores : dict
+        Optional output of role_scores(), skips alignment when chain roles are already known
+
+    Returns
+    -------
+    assemblies : list
+        Dictionaries with the keys of get_tcr_chains(), 'MHC', 'B2M' and 'PEPTIDE' (and 'MHC2' for the second MHC
+        class II chain). Only complete assemblies (alpha, beta, MHC and peptide) are returned, in order of the alpha
+        chain in the file
+    """
+    sequences = structure.chain_sequences()
+    if scores is None:
+        scores = role_scores(sequences)
+    classes = classify_chains(sequences, scores)
+    contacts = chain_contacts(structure)
+
+    def touch(a, b):
+        # Contacts between two groups (lists) of chains, never strings: mmCIF chain IDs can be several characters
+        return sum(contacts.get((x, y), 0) for x in a for y in b)
+
+    def contact(a, b):
+        # Contacts between two single chains, the weight given to greedy_pairs() of chain lists
+        return touch([a], [b])
+
+    by_class = {name: [chain for chain in classes if classes[chain] == name] for name in
+                ('TCR', 'MHC', 'B2M', 'PEPTIDE')}
+    tcrs = pair_tcrs(by_class['TCR'], scores, contact)
+    # MHC units: class I heavy chain with its B2M, left over MHC chains paired as class II
+    units = []
+    for mhc, b2m in greedy_pairs(by_class['MHC'], by_class['B2M'], contact):
+        units.append({'MHC': mhc, 'B2M': b2m})
+    paired = set(unit['MHC'] for unit in units)
+    single = [chain for chain in by_class['MHC'] if chain not in paired]
+    for a, b in greedy_pairs(single, single, contact):
+        if scores[a]['MHC'] < scores[b]['MHC']:
+            a, b = b, a
+        units.append({'MHC': a, 'MHC2': b})
+    paired.update(unit.get('MHC2') for unit in units)
+    units.extend({'MHC': chain} for chain in single if chain not in paired)
+    chains_of = [[unit[key] for key in ('MHC', 'MHC2') if key in unit] for unit in units]
+    # Peptide of each unit then TCR of each unit
+    for peptide, pos in greedy_pairs(by_class['PEPTIDE'], list(range(len(units))),
+                                     lambda x, y: touch([x], chains_of[y])):
+        units[pos]['PEPTIDE'] = peptide
+    assemblies = []
+    for pos, unit_pos in greedy_pairs(list(range(len(tcrs))), list(range(len(units))),
+                                      lambda x, y: touch(list(tcrs[x].values()), chains_of[y])):
+        assembly = dict(tcrs[pos])
+        assembly.update(units[unit_pos])
+        if 'PEPTIDE' in assembly:
+            assemblies.append(assembly)
+    order = {chain: pos for pos, chain in enumerate(sequences)}
+    return sorted(assemblies, key=lambda x: order[x['ALPHA']])
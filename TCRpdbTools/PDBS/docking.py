@@ -0,0 +1,268 @@
+#!/usr/bin/python3
+
+######################################################################
+# docking.py -- A component of TRain                                 #
+# Copyright: Austin Seamann, Dario Ghersi, and Ryan Ehrlich          #
+# Goal: Build docking start positions for a TCR and a pMHC in bulk.  #
+#       The pair is placed in the canonical center() frame and the   #
+#       TCR is moved by batches of rigid body perturbations, starts  #
+#       that clash with the pMHC are dropped.                        #
+######################################################################
+
+
+import numpy as np
+from sklearn.decomposition import PCA
+from scipy.spatial import cKDTree
+from scipy.spatial.transform import Rotation
+try:  # Imported as part of the web app
+    from PDBS.structure import format_atoms, open_pdb
+    from PDBS.clash import CellList, CLASH_CUTOFF
+except ImportError:  # Ran as a script from within PDBS/
+    from structure import format_atoms, open_pdb
+    from clash import CellList, CLASH_CUTOFF
+
+#################
+#     Global    #
+#################
+BATCH = 256  # Starts transformed and clash checked at once
+MAX_ANGLE = 10.0  # Default largest rotation (degrees) of the TCR about its center
+MAX_SHIFT = 3.0  # Default largest translation (angstroms) of the TCR
+
+
+#################
+#    Methods    #
+#################
+def canonical_frame(coords):
+    """
+    Returns the frame PdbTools3.center() moves a structure into: centroid at 0,0,0 and principal axes along X, Y and Z.
+    The last atom (end of the beta chain) is used to fix flips of the axes
+
+    Parameters
+    ----------
+    coords : np.ndarray
+        (N, 3) coordinates in file order
+
+    Returns
+    -------
+    center : np.ndarray
+        Centroid of coords
+    transpose : np.ndarray
+        (3, 3) rotation, new coords = (coords - center) @ transpose
+    """
+    center = np.mean(coords, axis=0)
+    centered = coords - center
+    pca = PCA(n_components=3)
+    pca.fit(centered)
+    transpose = np.transpose(pca.components_)
+    # Determinate of components matrix - Corrects if determinate is negative
+    if np.linalg.det(transpose) < 0:
+        transpose[:, 0] = transpose[:, 0] * -1
+    # Always have N-terminus in positive coordinates (Fixes flips on x-axis)
+    if np.matmul(centered[-1], transpose)[1] < 0:
+        transpose = Rotation.from_euler('x', 180, degrees=True).apply(transpose)
+    # Always have alpha on left side (Fixes flips on y-axis)
+    if np.matmul(centered[-1], transpose)[0] < 0:
+        transpose = Rotation.from_euler('y', 180, degrees=True).apply(transpose)
+    return center, transpose
+
+
+def random_perturbations(n_starts, max_angle=MAX_ANGLE, max_shift=MAX_SHIFT, seed=None):
+    """
+    Random rigid body moves: rotation about a uniform random axis by up to max_angle and a translation uniform in a
+    ball of radius max_shift. max_angle >= 180 samples rotations uniformly
+
+    Parameters
+    ----------
+    n_starts : int
+    max_angle : float
+        Degrees
+    max_shift : float
+        Angstroms
+    seed : int
+        Optional seed for repeatable sets
+
+    Returns
+    -------
+    rotations : Rotation
+        n_starts rotations
+    translations : np.ndarray
+        (n_starts, 3)
+    """
+    rng = np.random.default_rng(seed)
+    if max_angle >= 180:
+        rotations = Rotation.random(n_starts, random_state=rng)
+    else:
+        axes = rng.normal(size=(n_starts, 3))
+        axes /= np.linalg.norm(axes, axis=1)[:, None]
+        angles = np.radians(max_angle) * rng.random(n_starts)
+        rotations = Rotation.from_rotvec(axes * angles[:, None])
+    directions = rng.normal(size=(n_starts, 3))
+    directions /= np.linalg.norm(directions, axis=1)[:, None]
+    translations = directions * (max_shift * np.cbrt(rng.random(n_starts)))[:, None]
+    return rotations, translations
+
+
+def grid_perturbations(n_starts, max_angle=MAX_ANGLE, max_shift=MAX_SHIFT):
+    """
+    Evenly spaced rigid body moves: rotations about X, Y and Z and translations along X, Y and Z each sampled at the
+    same number of steps in [-max, max]. Steps are chosen so the grid has at most n_starts moves
+
+    Parameters
+    ----------
+    n_starts : int
+    max_angle : float
+        Degrees
+    max_shift : float
+        Angstroms
+
+    Returns
+    -------
+    rotations : Rotation
+    translations : np.ndarray
+    """
+    steps = max(2, int(np.floor(n_starts ** (1 / 6) + 1e-9)))
+    angles = np.linspace(-max_angle, max_angle, steps)
+    shifts = np.linspace(-max_shift, max_shift, steps)
+    grid = np.stack(np.meshgrid(angles, angles, angles, shifts, shifts, shifts, indexing='ij'), axis=-1).reshape(-1, 6)
+    return Rotation.from_euler('xyz', grid[:, :3], degrees=True), grid[:, 3:]
+
+
+def movable_atoms(tcr_coords, pmhc_coords, pivot, max_angle, max_shift, cutoff):
+    """
+    Returns which TCR atoms could reach the pMHC under any of the moves, only these need a clash check
+
+    Parameters
+    ----------
+    tcr_coords : np.ndarray
+    pmhc_coords : np.ndarray
+    pivot : np.ndarray
+        Center of rotation
+    max_angle : float
+    max_shift : float
+    cutoff : float
+
+    Returns
+    -------
+    mask : np.ndarray
+    """
+    if max_angle >= 180:
+        return np.ones(len(tcr_coords), dtype=bool)
+    # Rotation by at most theta moves a point at radius r at most 2 r sin(theta / 2)
+    radius = np.linalg.norm(tcr_coords - pivot, axis=1)
+    reach = 2 * radius * np.sin(np.radians(max_angle) / 2) + max_shift + cutoff
+    distance = cKDTree(pmhc_coords).query(tcr_coords, distance_upper_bound=reach.max())[0]
+    return distance < reach
+
+
+def iter_starts(tcr, pmhc, rotations, translations, cutoff=CLASH_CUTOFF, check_clash=True, with_coords=True):
+    """
+    Apply rigid body moves to the TCR in batches and yield the starts that don't clash with the pMHC
+
+    Parameters
+    ----------
+    tcr : Structure
+        TCR atoms already in the canonical frame
+    pmhc : Structure
+        pMHC atoms already in the canonical frame
+    rotations : Rotation
+    translations : np.ndarray
+    cutoff : float
+        Clash distance
+    check_clash : boolean
+        Drop starts with clashes
+    with_coords : boolean
+        Move every TCR atom, when False only the atoms needed for the clash check are moved
+
+    Yields
+    ------
+    index : np.ndarray
+        Positions of the kept moves
+    coords : np.ndarray
+        (kept, n_tcr_atoms, 3) moved TCR coordinates, None when with_coords is False
+    """
+    matrices = rotations.as_matrix()
+    pivot = tcr.coords.mean(axis=0)
+    centered = tcr.coords - pivot
+    max_angle = np.degrees(rotations.magnitude().max()) if len(rotations) else 0.0
+    max_shift = np.linalg.norm(translations, axis=1).max() if len(translations) else 0.0
+    check = movable_atoms(tcr.coords, pmhc.coords, pivot, max_angle, max_shift, cutoff)
+    cells = CellList(pmhc.coords, cutoff)
+    for start in range(0, len(matrices), BATCH):
+        stop = min(start + BATCH, len(matrices))
+        keep = np.ones(stop - start, dtype=bool)
+        if check_clash and check.any():
+            # (batch, atoms, 3) = R @ (x - pivot) + pivot + t for every move at once
+            near = np.einsum('kij,mj->kmi', matrices[start:stop], centered[check])\
+                + (pivot + translations[start:stop])[:, None]
+            keep = ~cells.within_mask(near.reshape(-1, 3), cutoff).reshape(stop - start, -1).any(axis=1)
+        if not keep.any():
+            continue
+        index = np.arange(start, stop)[keep]
+        moved = None
+        if with_coords:
+            moved = np.einsum('kij,mj->kmi', matrices[index], centered) + (pivot + translations[index])[:, None]
+        yield index, moved
+
+
+def write_models(file_name, tcr, pmhc, starts):
+    """
+    Stream starts into a multi-model PDB. Each model holds the fixed pMHC followed by the moved TCR
+
+    Parameters
+    ----------
+    file_name : str
+    tcr : Structure
+    pmhc : Structure
+    starts : iterator
+        Output of iter_starts()
+
+    Returns
+    -------
+    count : int
+        Number of models written
+    """
+    pmhc_lines = pmhc.atom_lines() + 'TER\n'
+    prefixes, suffixes = tcr.line_parts()
+    count = 0
+    with open_pdb(file_name, 'w') as f:
+        for index, coords in starts:
+            for moved in coords:
+                count += 1
+                f.write('MODEL     ' + str(count).rjust(4) + '\n')
+                f.write(pmhc_lines)
+                f.write(format_atoms(prefixes, moved, suffixes))
+                f.write('TER\nENDMDL\n')
+        f.write('END\n')
+    return count
+
+
+def write_array(file_name, tcr, pmhc, rotations, translations, starts, frame):
+    """
+    Save kept starts as a compact NumPy archive. Only the move of each start is stored (quaternion and translation,
+    float32) along with the frame and the coordinates the moves apply to
+
+    Parameters
+    ----------
+    file_name : str
+        .npz file
+    tcr : Structure
+    pmhc : Structure
+    rotations : Rotation
+    translations : np.ndarray
+    starts : iterator
+        Output of iter_starts()
+    frame : tuple
+        Output of canonical_frame()
+
+    Returns
+    -------
+    count : int
+        Number of starts saved
+    """
+    kept = [index for index, coords in starts]
+    kept = np.concatenate(kept) if kept else np.zeros(0, dtype=np.int64)
+    np.savez(file_name, quaternions=rotations[kept].as_quat().astype(np.float32) if len(kept) else
+             np.zeros((0, 4), dtype=np.float32), translations=translations[kept].astype(np.float32),
+             pivot=tcr.coords.mean(axis=0), tcr_coords=tcr.coords.astype(np.float32),
+             pmhc_coords=pmhc.coords.astype(np.float32), frame_center=frame[0], frame_rotation=frame[1])
+    return len(kept)
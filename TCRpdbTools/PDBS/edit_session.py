@@ -0,0 +1,274 @@
+#!/usr/bin/python3
+
+######################################################################
+# edit_session.py -- A component of TRain                            #
+# Copyright: Austin Seamann, Dario Ghersi, and Ryan Ehrlich          #
+# Goal: Batch edits of a PDB file (mute, remove, trim, relabel,      #
+#       reorder) in memory with undo, written back with one write    #
+#       or streamed without touching the file.                       #
+######################################################################
+
+
+import numpy as np
+try:  # Imported as part of the web app
+    from PDBS.structure import line_columns, structure_from_lines, open_pdb
+    from PDBS.selection import select_mask, compile_selection
+except ImportError:  # Ran as a script from within PDBS/
+    from structure import line_columns, structure_from_lines, open_pdb
+    from selection import select_mask, compile_selection
+
+#################
+#     Global    #
+#################
+ROW_RECORDS = ('ATOM  ', 'HETATM', 'DEATOM', 'TER   ')  # Lines edits act on
+ATOM_RECORDS = ('ANISOU', 'SIGUIJ', 'SIGATM')  # Lines of the atom above them, removed and moved with it
+MUTABLE = ('ATOM', 'DEATOM')  # Records that can be muted
+
+
+#################
+#    Methods    #
+#################
+class EditSession:
+    """
+    Pending edits of one PDB file. Every edit only changes per-atom state (muted, removed, chain label, chain order),
+    lines are rebuilt once by lines() or commit(). Each edit can be undone. Usable as a context manager, the edits
+    are committed when the block ends without an error:
+
+        with pdb.edit() as session:
+            session.trim('D', 117)
+            session.trim('E', 115)
+            session.relabel({'D': 'A', 'E': 'B'})
+    """
+    def __init__(self, file_name, context=None):
+        """
+        Initialize EditSession
+
+        Parameters
+        ----------
+        file_name : str
+            PDB file, plain or compressed
+        context : function
+            Optional, returns the selection.Context of the file for role and loop keywords
+        """
+        self.file_name = file_name
+        self.context = context
+        with open_pdb(file_name, 'r') as file:
+            self.source = file.readlines()
+        self.rows = [pos for pos, line in enumerate(self.source) if line[0:6] in ROW_RECORDS]
+        self.table = line_columns([self.source[pos] for pos in self.rows])
+        self.original_chains = self.table.chain_id.copy()
+        # ANISOU (and SIGUIJ, SIGATM) lines belong to the row above them. Any other line (MODEL, ENDMDL, END...)
+        # stays in place: slots[k] holds the lines after the first k rows, slots[0] is the header
+        self.attached = [[] for _ in self.rows]
+        self.slots = [[] for _ in range(len(self.rows) + 1)]
+        self.models = np.zeros(len(self.rows), dtype=np.int64)  # MODEL records above each row
+        count, models = 0, 0
+        for pos, line in enumerate(self.source):
+            if count < len(self.rows) and self.rows[count] == pos:
+                self.models[count] = models
+                count += 1
+            elif count and line[0:6] in ATOM_RECORDS and not self.slots[count]:
+                self.attached[count - 1].append(pos)
+            else:
+                models += line[0:6] == 'MODEL '
+                self.slots[count].append(pos)
+        self.muted = self.table.record == 'DEATOM'
+        self.removed = np.zeros(len(self.rows), dtype=bool)
+        self.order = None
+        self.history = []
+        self._relabeled = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, error_type, error, traceback):
+        if error_type is None:
+            self.commit()
+
+    def select(self, selection):
+        """
+        Mask of the rows matched by a selection, chain names are the current labels
+
+        Parameters
+        ----------
+        selection : str
+            See selection.compile_selection()
+
+        Returns
+        -------
+        mask : np.ndarray
+        """
+        context = None
+        if compile_selection(selection).needs_context:
+            if self.context is None:
+                raise ValueError("Selection '" + selection + "' needs chain roles, open the session from PdbTools3")
+            context = self.context()
+            labels = self.labels()
+            if labels:
+                key = tuple(sorted(labels.items()))
+                if key not in self._relabeled:
+                    self._relabeled = {key: context.relabeled(labels)}
+                context = self._relabeled[key]
+        return select_mask(self.table, selection, context)
+
+    def labels(self):
+        """
+        Returns the chains renamed so far, original label -> current label
+        """
+        changed = self.original_chains != self.table.chain_id
+        return dict(zip(self.original_chains[changed].tolist(), self.table.chain_id[changed].tolist()))
+
+    def _save(self):
+        # Remember the state before an edit for undo()
+        self.history.append((self.muted.copy(), self.removed.copy(), self.table.chain_id.copy(), self.order))
+
+    def mute(self, selection):
+        """
+        Mute the ATOM records of a selection, muted atoms are left out of structure() and written as DEATOM
+        """
+        mask = self.select(selection) & np.isin(self.table.record, MUTABLE)
+        self._save()
+        self.muted = self.muted | mask
+
+    def unmute(self, selection):
+        """
+        Unmute the muted atoms of a selection, including atoms read as DEATOM records
+        """
+        mask = self.select(selection)
+        self._save()
+        self.muted = self.muted & ~mask
+
+    def remove(self, selection):
+        """
+        Remove the rows (atoms and TER records) of a selection together with their ANISOU lines
+        """
+        mask = self.select(selection)
+        self._save()
+        self.removed = self.removed | mask
+
+    def remove_chain(self, chain_id):
+        """
+        Remove every row of a chain
+        """
+        self.remove("chain '%s'" % chain_id.upper())
+
+    def trim(self, chain_id, cutoff):
+        """
+        Trim a chain after the residue number cutoff and drop secondary atoms, see PdbTools3.trim_chain()
+        """
+        self.remove("record ATOM,TER and (altloc B or not icode ' ' or chain '%s' and resi %d:)"
+                    % (chain_id.upper(), cutoff + 1))
+
+    def relabel(self, label_dic):
+        """
+        Rename chains, ex. {'A': 'D', 'B': 'E'}. Chains left out keep their label, see PdbTools3.update_label()
+        """
+        self._save()
+        chains = self.table.chain_id.copy()
+        for old, new in label_dic.items():
+            chains[self.table.chain_id == old] = new
+        self.table.chain_id = chains
+        self.table._masks = {}
+        self.table._residue_index = None
+
+    def reorder(self, chain_order):
+        """
+        Write chains in the given order (current labels), chains left out follow in their present order
+        """
+        self._save()
+        self.order = str(chain_order)
+
+    def undo(self):
+        """
+        Undo the last edit
+        """
+        if not self.history:
+            raise ValueError("Nothing to undo")
+        self.muted, self.removed, chains, self.order = self.history.pop()
+        if not np.array_equal(chains, self.table.chain_id):
+            self.table.chain_id = chains
+            self.table._masks = {}
+            self.table._residue_index = None
+
+    def row_order(self):
+        """
+        Returns the rows in output order. Chains are reordered within each model, TER records without a chain stay
+        with the chain before them
+        """
+        if self.order is None:
+            return np.arange(len(self.rows))
+        owners = self.table.chain_id.copy()
+        for pos in range(1, len(owners)):
+            if owners[pos] == ' ':
+                owners[pos] = owners[pos - 1]
+        rank = {chain: pos for pos, chain in enumerate(self.order)}
+        keys = np.array([rank.get(chain, len(rank)) for chain in owners.tolist()], dtype=np.int64)
+        return np.lexsort((keys, self.models))
+
+    def lines(self, keep_muted=True):
+        """
+        Yields the lines of the edited file
+
+        Parameters
+        ----------
+        keep_muted : boolean
+            Write muted atoms as DEATOM records (True) so they can be unmuted later, or leave them out
+        """
+        for pos in self.slots[0]:
+            yield self.source[pos]
+        for slot, row in enumerate(self.row_order().tolist(), start=1):
+            if not self.removed[row] and (keep_muted or not self.muted[row]):
+                yield from self.row_lines(row)
+            for pos in self.slots[slot]:
+                yield self.source[pos]
+
+    def row_lines(self, row):
+        """
+        Yields the edited line of a row followed by its ANISOU lines
+        """
+        line = self.source[self.rows[row]]
+        if self.table.record[row] in MUTABLE:
+            line = ('DEATOM' if self.muted[row] else 'ATOM  ') + line[6:]
+        chain = self.table.chain_id[row]
+        relabel = chain != self.original_chains[row]
+        if relabel and len(line) > 21:
+            line = line[:21] + chain + line[22:]
+        yield line
+        for pos in self.attached[row]:
+            line = self.source[pos]
+            yield line[:21] + chain + line[22:] if relabel and len(line) > 21 else line
+
+    def text(self, keep_muted=True):
+        """
+        Returns the edited file as one string, see lines()
+        """
+        return ''.join(self.lines(keep_muted))
+
+    def structure(self):
+        """
+        Returns the edited atoms (ATOM and HETATM records, muted atoms left out) as a Structure without writing
+        """
+        header, atoms = [], []
+        for line in self.lines(keep_muted=False):
+            if line[0:6] in ('ATOM  ', 'HETATM'):
+                atoms.append(line.rstrip('\n').ljust(80))
+            elif line[0:6] == 'ENDMDL':
+                break
+            elif not atoms:
+                header.append(line)
+        return structure_from_lines(atoms, header)
+
+    def commit(self, file_name=None, keep_muted=True):
+        """
+        Write the edited file with one write
+
+        Parameters
+        ----------
+        file_name : str
+            Optional new location, defaults to the file edited (compressed when it ends with .gz or .bgz)
+        keep_muted : boolean
+            See lines()
+        """
+        text = self.text(keep_muted)
+        with open_pdb(file_name or self.file_name, 'w') as file:
+            file.write(text)
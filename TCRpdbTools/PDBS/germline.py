@@ -0,0 +1,563 @@
+#!/usr/bin/python3
+
+######################################################################
+# germline.py -- A component of TRain                                #
+# Copyright: Austin Seamann, Dario Ghersi, and Ryan Ehrlich          #
+# Goal: Precompiled index of TRAV/TRBV germline genes used to call   #
+#       the V gene and find CDR1, CDR2, CDR2.5 and CDR3 of a TCR     #
+#       chain in one pass over its sequence.                         #
+#                                                                    #
+# The index ships as germline_index.npz next to this file. It is     #
+# built from the IMGT gapped human and mouse V genes bundled with    #
+# ANARCI (BSD licence, pip install anarci==2026.2.13.2):             #
+#     python germline.py --build anarci                              #
+# or from IMGT gapped amino acid V-REGION FASTA files (GENE-DB):     #
+#     python germline.py --build TRAV_human.fasta TRBV_human.fasta   #
+######################################################################
+
+
+import argparse
+import csv
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from importlib.metadata import PackageNotFoundError, version
+import numpy as np
+try:  # Imported as part of the web app
+    from PDBS.structure import parse_pdb, THREE_TO_ONE
+    from PDBS import complexes
+except ImportError:  # Ran as a script from within PDBS/
+    from structure import parse_pdb, THREE_TO_ONE
+    import complexes
+
+#################
+#     Global    #
+#################
+INDEX_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "germline_index.npz")
+INDEX_VERSION = 1
+K = 5  # k-mer length of the index
+ALPHABET = "ACDEFGHIKLMNPQRSTVWYX"
+BITS = 5  # Bits per residue in an encoded k-mer
+# IMGT unique numbering of the germline loops (1-based, inclusive), CDR2.5 is HV4
+LOOPS = {'CDR1': (27, 38), 'CDR2': (56, 65), 'CDR2.5': (81, 86)}
+CYS_104 = 104  # Second conserved cysteine, start of CDR3
+CDR3_END = re.compile('[FW]G.G')  # J gene motif closing CDR3
+LOOP_WINDOW = 5  # Residues a germline loop may shift by to be found exactly
+MIN_SCORE = 3  # Fewest shared k-mers for a germline call
+GENE_TYPES = {'ALPHA': 'TRAV', 'BETA': 'TRBV'}
+ANARCI = "anarci"  # --build source naming the germlines bundled with ANARCI
+ANARCI_CHAINS = {'A': 'TRAV', 'B': 'TRBV'}
+ANARCI_SPECIES = {'human': 'Homo sapiens', 'mouse': 'Mus musculus'}
+_CODES = np.full(256, ALPHABET.index('X'), dtype=np.int64)
+for _pos, _amino in enumerate(ALPHABET):
+    _CODES[ord(_amino)] = _pos
+
+
+#################
+#    Methods    #
+#################
+def read_imgt_fasta(file_name):
+    """
+    Read TRAV/TRBV V-REGION entries of an IMGT gapped amino acid FASTA.
+    Headers are IMGT's '|' separated fields: accession|allele|species|functionality|region|...
+
+    Parameters
+    ----------
+    file_name : str
+
+    Returns
+    -------
+    entries : list
+        (allele, species, gapped sequence)
+    """
+    entries = []
+    header, seq = None, []
+    with open(file_name, 'r') as file:
+        for line in list(file) + ['>']:
+            if line.startswith('>'):
+                if header is not None:
+                    fields = header.split('|')
+                    allele = fields[1] if len(fields) > 1 else fields[0]
+                    species = fields[2] if len(fields) > 2 else ''
+                    region = fields[4] if len(fields) > 4 else 'V-REGION'
+                    if allele.startswith(tuple(GENE_TYPES.values())) and region == 'V-REGION':
+                        entries.append((allele, species, ''.join(seq)))
+                header, seq = line[1:].strip(), []
+            else:
+                seq.append(line.strip().upper())
+    return entries
+
+
+def read_anarci_germlines():
+    """
+    Read the TRAV/TRBV germlines bundled with the optional ANARCI package. They are IMGT gapped V genes of 128
+    positions ('-' for gaps), position i being IMGT number i
+
+    Returns
+    -------
+    entries : list
+        (allele, species, gapped sequence), sorted by species and allele so builds are reproducible
+    source : str
+        ANARCI version the entries come from
+    """
+    try:
+        from anarci.germlines import all_germlines
+    except ImportError:
+        raise ImportError("Building the germline index from ANARCI needs it: pip install anarci")
+    try:
+        source = "anarci " + version("anarci")
+    except PackageNotFoundError:  # On the path without its distribution metadata
+        source = ANARCI
+    entries = []
+    for chain, gene_type in ANARCI_CHAINS.items():
+        for organism, species in ANARCI_SPECIES.items():
+            for allele, gapped in sorted(all_germlines['V'][chain].get(organism, {}).items()):
+                if allele.startswith(gene_type):
+                    entries.append((allele, species, gapped.replace('-', '.')))
+    return entries, source
+
+
+def read_sources(sources):
+    """
+    Germline entries of --build sources, each 'anarci' (see read_anarci_germlines()) or an IMGT FASTA file
+
+    Returns
+    -------
+    entries : list
+        (allele, species, gapped sequence)
+    source : str
+        Description of the sources, kept in the index
+    """
+    entries, described = [], []
+    for source in sources:
+        if source == ANARCI:
+            found, name = read_anarci_germlines()
+        else:
+            found, name = read_imgt_fasta(source), os.path.basename(source)
+        entries.extend(found)
+        described.append(name)
+    return entries, ", ".join(described)
+
+
+def gapped_loops(gapped):
+    """
+    Cut the germline loops out of an IMGT gapped sequence
+
+    Parameters
+    ----------
+    gapped : str
+        IMGT gapped sequence, '.' for gaps
+
+    Returns
+    -------
+    germline : str
+        Ungapped sequence
+    loops : dict
+        Loop name -> (start, end) in the ungapped sequence, end exclusive
+    cys : int
+        Position of Cys 104 in the ungapped sequence, -1 when the sequence stops before it
+    """
+    # Position of each IMGT number in the ungapped sequence
+    ungapped = np.cumsum([amino != '.' for amino in gapped]) - 1
+    loops = {}
+    for name, (start, end) in LOOPS.items():
+        loop = gapped[start - 1:end].replace('.', '')
+        first = ungapped[start - 2] + 1 if start > 1 else 0
+        loops[name] = (int(first), int(first + len(loop)))
+    cys = -1
+    if len(gapped) >= CYS_104 and gapped[CYS_104 - 1] == 'C':
+        cys = int(ungapped[CYS_104 - 1])
+    return gapped.replace('.', ''), loops, cys
+
+
+def encode_kmers(seq, k=K):
+    """
+    Encode every k-mer of a sequence as one integer
+
+    Parameters
+    ----------
+    seq : str
+    k : int
+
+    Returns
+    -------
+    codes : np.ndarray
+        (len(seq) - k + 1,) codes, k-mer i starts at position i
+    """
+    if len(seq) < k:
+        return np.zeros(0, dtype=np.int64)
+    residues = _CODES[np.frombuffer(seq.encode('ascii', 'replace'), dtype=np.uint8)]
+    codes = np.zeros(len(seq) - k + 1, dtype=np.int64)
+    for pos in range(k):
+        codes = (codes << BITS) | residues[pos:len(seq) - k + 1 + pos]
+    return codes
+
+
+def build_index(sources, file_name=INDEX_FILE, k=K):
+    """
+    Compile germline V genes into the k-mer index used by annotate()
+
+    Parameters
+    ----------
+    sources : list
+        'anarci' and/or IMGT gapped amino acid FASTA files, see read_sources()
+    file_name : str
+        Output .npz
+    k : int
+
+    Returns
+    -------
+    count : int
+        Number of germline alleles in the index
+    """
+    entries, source = read_sources(sources)
+    alleles, species, germlines, loops, cys = [], [], [], [], []
+    for allele, organism, gapped in entries:
+        germline, loop, cys_pos = gapped_loops(gapped)
+        alleles.append(allele)
+        species.append(organism)
+        germlines.append(germline)
+        loops.append([loop[name] for name in LOOPS])
+        cys.append(cys_pos)
+    codes, genes, positions = [], [], []
+    for gene, germline in enumerate(germlines):
+        found = encode_kmers(germline, k)
+        codes.append(found)
+        genes.append(np.full(len(found), gene, dtype=np.int32))
+        positions.append(np.arange(len(found), dtype=np.int32))
+    codes = np.concatenate(codes) if codes else np.zeros(0, dtype=np.int64)
+    order = np.argsort(codes, kind='stable')
+    np.savez_compressed(
+        file_name, version=INDEX_VERSION, k=k, source=source, alleles=np.array(alleles, dtype=str),
+        species=np.array(species, dtype=str), germlines=np.array(germlines, dtype=str),
+        loops=np.array(loops, dtype=np.int32).reshape(-1, len(LOOPS), 2), cys=np.array(cys, dtype=np.int32),
+        kmers=codes[order], kmer_genes=np.concatenate(genes)[order] if genes else np.zeros(0, dtype=np.int32),
+        kmer_positions=np.concatenate(positions)[order] if positions else np.zeros(0, dtype=np.int32))
+    return len(alleles)
+
+
+@lru_cache(maxsize=4)
+def load_index(file_name=INDEX_FILE):
+    """
+    Load a compiled germline index, cached so it is only read once per process
+
+    Parameters
+    ----------
+    file_name : str
+
+    Returns
+    -------
+    index : dict
+        Arrays saved by build_index()
+    """
+    if not os.path.exists(file_name):
+        raise FileNotFoundError("Germline index %s not found, build it with: python germline.py --build anarci"
+                                % file_name)
+    with np.load(file_name) as data:
+        index = {name: data[name] for name in data.files}
+    if int(index['version']) != INDEX_VERSION:
+        raise ValueError("Germline index %s is version %d, rebuild it for version %d"
+                         % (file_name, int(index['version']), INDEX_VERSION))
+    index['types'] = np.array([allele[:4] for allele in index['alleles']], dtype=str)
+    return index
+
+
+def annotate(seq, gene_type=None, index=None):
+    """
+    Call the V gene of a TCR chain and locate its CDRs. Every k-mer of the sequence is looked up in the index at once,
+    the germline allele and offset (diagonal) with the most shared k-mers is the call and its loops are mapped onto
+    the sequence through that offset
+
+    Parameters
+    ----------
+    seq : str
+        Amino acid sequence of the chain
+    gene_type : str
+        Optional 'TRAV' or 'TRBV' to only consider one chain type
+    index : dict
+        Optional output of load_index(), the default index when not given
+
+    Returns
+    -------
+    result : dict
+        'gene' allele call, 'species', 'score' shared k-mers and 'CDR1', 'CDR2', 'CDR2.5', 'CDR3' as (loop, start,
+        end) with start/end positions in seq (end exclusive). Empty when no germline matches. Without an index given
+        and no default index built only 'CDR3' is found, see motif_cdr3()
+    """
+    if index is None:
+        if not os.path.exists(INDEX_FILE):  # Germline calls need the index, the CDR3 motif does not
+            cdr3 = motif_cdr3(seq)
+            return {'CDR3': cdr3} if cdr3[0] else {}
+        index = load_index()
+    k = int(index['k'])
+    codes = encode_kmers(seq, k)
+    left = np.searchsorted(index['kmers'], codes, side='left')
+    right = np.searchsorted(index['kmers'], codes, side='right')
+    counts = right - left
+    if counts.sum() == 0:
+        return {}
+    # One row per (sequence k-mer, germline k-mer) hit
+    rows = np.repeat(np.arange(len(codes)), counts)
+    hits = np.repeat(left, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    genes = index['kmer_genes'][hits].astype(np.int64)
+    diagonals = rows - index['kmer_positions'][hits]
+    if gene_type is not None:
+        keep = index['types'][genes] == gene_type
+        genes, diagonals = genes[keep], diagonals[keep]
+        if len(genes) == 0:
+            return {}
+    # Best (allele, diagonal) pair, first allele wins ties so *01 is preferred
+    span = len(seq) + index['germlines'].dtype.itemsize // 4 + 1
+    keys, votes = np.unique(genes * 2 * span + diagonals + span, return_counts=True)
+    if votes.max() < MIN_SCORE:
+        return {}
+    best = keys[np.argmax(votes)]
+    gene, diagonal = int(best // (2 * span)), int(best % (2 * span) - span)
+    germline = str(index['germlines'][gene])
+    result = {'gene': str(index['alleles'][gene]), 'species': str(index['species'][gene]), 'score': int(votes.max())}
+    for name, (start, end) in zip(LOOPS, index['loops'][gene]):
+        result[name] = place_loop(seq, germline[start:end], int(start) + diagonal)
+    result['CDR3'] = find_cdr3(seq, int(index['cys'][gene]) + diagonal if index['cys'][gene] >= 0 else -1)
+    return result
+
+
+def place_loop(seq, loop, expected):
+    """
+    Returns where a germline loop sits in seq: an exact match close to the expected start, otherwise the expected
+    position itself
+
+    Parameters
+    ----------
+    seq : str
+    loop : str
+    expected : int
+        Start of the loop in seq from the germline offset
+
+    Returns
+    -------
+    loop : tuple
+        (loop, start, end)
+    """
+    found = seq.find(loop, max(0, expected - LOOP_WINDOW), max(0, expected + LOOP_WINDOW + len(loop)))
+    start = found if found >= 0 else min(max(0, expected), len(seq))
+    end = min(start + len(loop), len(seq))
+    return seq[start:end], start, end
+
+
+def find_cdr3(seq, cys):
+    """
+    CDR3 from the conserved cysteine through the F/W of the J gene FGXG (or WGXG) motif
+
+    Parameters
+    ----------
+    seq : str
+    cys : int
+        Expected position of Cys 104, -1 when unknown
+
+    Returns
+    -------
+    loop : tuple
+        (loop, start, end)
+    """
+    if cys < 0:
+        return '', len(seq), len(seq)
+    # The cysteine may shift by a few residues when the germline offset is off
+    near = [pos for pos in range(max(0, cys - 3), min(len(seq), cys + 4)) if seq[pos] == 'C']
+    if near:
+        cys = min(near, key=lambda pos: abs(pos - cys))
+    end = CDR3_END.search(seq, min(cys + 4, len(seq)))
+    stop = end.start() + 1 if end is not None else len(seq)
+    return seq[cys:stop], cys, stop
+
+
+def motif_cdr3(seq):
+    """
+    CDR3 found without a germline call: the J gene FGXG (or WGXG) motif closest to the end of the V domain and the
+    last cysteine 5-25 residues before it
+
+    Parameters
+    ----------
+    seq : str
+
+    Returns
+    -------
+    loop : tuple
+        (loop, start, end), empty loop when no motif is found
+    """
+    for end in CDR3_END.finditer(seq, min(80, len(seq))):
+        cys = seq.rfind('C', max(0, end.start() - 25), max(0, end.start() - 4))
+        if cys >= 0:
+            return seq[cys:end.start() + 1], cys, end.start() + 1
+    return '', len(seq), len(seq)
+
+
+def annotate_chain(structure, chain, gene_type=None, index=None):
+    """
+    Annotate one chain of a Structure with residue numbers in place of sequence positions
+
+    Parameters
+    ----------
+    structure : Structure
+    chain : str
+    gene_type : str
+        Optional 'TRAV' or 'TRBV'
+    index : dict
+
+    Returns
+    -------
+    result : dict
+        'gene', 'species', 'score' and each loop as [loop, first residue number, last residue number]
+    """
+    atoms = structure.select((structure.record == 'ATOM') & (structure.chain_id == chain))
+    residue, labels = atoms.residue_index()
+    first = np.flatnonzero(np.r_[True, residue[1:] != residue[:-1]]) if len(atoms) else np.zeros(0, dtype=np.int64)
+    seq = ''.join(THREE_TO_ONE.get(atoms.atom_comp_id[pos], 'X') for pos in first)
+    numbers = atoms.comp_num[first]
+    result = annotate(seq, gene_type, index)
+    for name in list(LOOPS) + ['CDR3']:
+        if name in result:
+            loop, start, end = result[name]
+            result[name] = [loop, int(numbers[start]), int(numbers[end - 1])] if loop else [loop, None, None]
+    return result
+
+
+def annotate_file(file_name, alpha="...", beta="...", index_file=INDEX_FILE):
+    """
+    Annotate the alpha and beta chain of a PDB file. Chains are found by sequence when not given
+
+    Parameters
+    ----------
+    file_name : str
+    alpha : str
+    beta : str
+    index_file : str
+
+    Returns
+    -------
+    result : dict
+        'ALPHA' and 'BETA' annotations, see annotate_chain()
+    """
+    structure = parse_pdb(file_name, hetatm=False)
+    if alpha == "..." or beta == "...":
+        tcr = complexes.tcr_chains(structure)
+        alpha = tcr.get('ALPHA') if alpha == "..." else alpha
+        beta = tcr.get('BETA') if beta == "..." else beta
+    index = load_index(index_file)
+    return {'ALPHA': annotate_chain(structure, alpha, GENE_TYPES['ALPHA'], index) if alpha else {},
+            'BETA': annotate_chain(structure, beta, GENE_TYPES['BETA'], index) if beta else {}}
+
+
+def _annotate_worker(file_name, index_file):
+    # Errors are kept per file so one bad entry doesn't stop a batch
+    try:
+        return file_name, annotate_file(file_name, index_file=index_file)
+    except (ValueError, KeyError, IndexError) as error:
+        return file_name, {'error': str(error)}
+
+
+def annotate_files(file_names, workers=None, index_file=INDEX_FILE):
+    """
+    Annotate many PDB files in parallel
+
+    Parameters
+    ----------
+    file_names : list
+    workers : int
+        Processes, defaults to the number of CPUs
+    index_file : str
+
+    Returns
+    -------
+    results : dict
+        File name -> annotate_file() result, in the order given
+    """
+    load_index(index_file)  # Fail early if the index is missing
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return dict(executor.map(_annotate_worker, file_names, [index_file] * len(file_names),
+                                 chunksize=max(1, len(file_names) // (4 * (workers or os.cpu_count() or 1)))))
+
+
+def gene_family(gene):
+    """
+    Returns the subgroup of a gene call, ex. TRAV12-2*01 -> TRAV12, TRAV29/DV5*01 -> TRAV29. Mouse duplicated genes
+    belong to the subgroup of their copy, ex. TRAV14D-2*01 -> TRAV14
+    """
+    return re.sub(r'(\d)D$', r'\1', re.split('[-/*]', gene)[0])
+
+
+def check_subgroups(results, summary_file):
+    """
+    Compare gene calls against the alpha_subgroup and beta_subgroup columns of an STCRDab summary TSV
+
+    Parameters
+    ----------
+    results : dict
+        File name -> annotate_file() result, file names start with the PDB ID
+    summary_file : str
+
+    Returns
+    -------
+    report : list
+        (pdb, chain type, called subgroup, summary subgroup, agrees) for every call with a subgroup in the summary
+    """
+    expected = {}
+    with open(summary_file, 'r') as file:
+        for row in csv.DictReader(file, delimiter='\t'):
+            expected.setdefault(row['pdb'], row)
+    report = []
+    for file_name, result in results.items():
+        pdb = os.path.basename(file_name)[:4].lower()
+        if pdb not in expected:
+            continue
+        for chain_type, column in (('ALPHA', 'alpha_subgroup'), ('BETA', 'beta_subgroup')):
+            called = gene_family(result.get(chain_type, {}).get('gene', ''))
+            subgroup = expected[pdb][column]
+            if subgroup and subgroup != 'NA':
+                report.append((pdb, chain_type, called, subgroup, called == subgroup))
+    return report
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("pdb", help="PDB file or directory of PDB files to annotate", type=str, nargs="?")
+    parser.add_argument("--build", help="Compile 'anarci' (germlines bundled with ANARCI) and/or IMGT gapped amino "
+                        "acid FASTA files into the index", type=str, nargs="+")
+    parser.add_argument("--index", help="Location of germline index", type=str, default=INDEX_FILE)
+    parser.add_argument("--workers", help="Processes used for a directory", type=int)
+    parser.add_argument("--check", help="STCRDab summary TSV to compare subgroup calls against", type=str)
+    return parser.parse_args()
+
+
+####################
+#     Controls     #
+####################
+def main():
+    args = parse_args()
+    if args.build:
+        print("Germline alleles: " + str(build_index(args.build, args.index)))
+    if args.pdb:
+        if os.path.isdir(args.pdb):
+            files = sorted(os.path.join(args.pdb, each) for each in os.listdir(args.pdb) if each.endswith(".pdb"))
+        else:
+            files = [args.pdb]
+        results = annotate_files(files, args.workers, args.index)
+        for file_name, result in results.items():
+            name = os.path.basename(file_name).split(".")[0]
+            if 'error' in result:
+                print(name + "\terror\t" + result['error'])
+                continue
+            for chain_type in ('ALPHA', 'BETA'):
+                loops = result[chain_type]
+                print("\t".join([name, chain_type, loops.get('gene', 'NA')] +
+                                [str(loops.get(loop, ['', None, None])[0]) for loop in list(LOOPS) + ['CDR3']]))
+        if args.check:
+            report = check_subgroups(results, args.check)
+            for pdb, chain_type, called, subgroup, agrees in report:
+                print("\t".join([pdb, chain_type, called, subgroup, str(agrees)]))
+            if report:
+                print("Agreement: %d of %d" % (sum(row[-1] for row in report), len(report)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,317 @@
+#!/usr/bin/python3
+
+######################################################################
+# library.py -- A component of TRain                                 #
+# Copyright: Austin Seamann, Dario Ghersi, and Ryan Ehrlich          #
+# Goal: Shared helpers for tools that work over the whole structure  #
+#       library: listing PDB files and reading every file once in a  #
+#       pool of processes.                                           #
+######################################################################
+
+
+import argparse
+import csv
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+try:  # Imported as part of the web app
+    from PDBS.structure import file_key, PDB_ENDINGS
+    from PDBS import structure_cache
+except ImportError:  # Ran as a script from within PDBS/
+    from structure import file_key, PDB_ENDINGS
+    import structure_cache
+
+#################
+#     Global    #
+#################
+ROLE_CACHE = "chain_roles.json"  # Chain roles cached in the library directory
+FASTA_WIDTH = 80  # Residues per FASTA line, same as PdbTools3.fasta_TCR()
+
+
+#################
+#    Methods    #
+#################
+def library_files(location, id_file=None):
+    """
+    Returns the PDB files (plain or compressed, see structure.PDB_ENDINGS) of a library directory or the single file
+    given, sorted by name. With an ID list only the files of those IDs are returned, in the order of the list
+
+    Parameters
+    ----------
+    location : str
+    id_file : str
+        Optional STCRDat summary TSV (IDs in the 'pdb' column) or file with one ID per line
+
+    Returns
+    -------
+    files : list
+    """
+    if id_file is not None:
+        files = []
+        for pdb in read_ids(id_file):
+            for ending in PDB_ENDINGS:
+                file_name = os.path.join(location, pdb + ending)
+                if os.path.exists(file_name):
+                    files.append(file_name)
+                    break
+        return files
+    if os.path.isdir(location):
+        return sorted(os.path.join(location, each) for each in os.listdir(location) if each.endswith(PDB_ENDINGS))
+    return [location]
+
+
+def read_ids(id_file):
+    """
+    Returns the unique PDB IDs of an STCRDat summary TSV or of a plain list, in order of first appearance
+
+    Parameters
+    ----------
+    id_file : str
+
+    Returns
+    -------
+    ids : list
+    """
+    ids = []
+    with open(id_file, 'r') as file:
+        for line in file:
+            pdb = line.split("\t")[0].strip()
+            if pdb and pdb != "pdb":
+                ids.append(pdb)
+    return list(dict.fromkeys(ids))
+
+
+def pdb_name(file_name):
+    """
+    Returns the name a library file is reported under, ex. /lib/1ao7.pdb -> 1ao7
+    """
+    return os.path.basename(file_name).split(".")[0]
+
+
+def parallel_map(function, items, workers=None):
+    """
+    Run function over items in a pool of processes, results keep the order of items
+
+    Parameters
+    ----------
+    function : function
+        Module level function (it is pickled to the workers)
+    items : list
+    workers : int
+        Processes, defaults to the number of CPUs. 1 runs in this process
+
+    Returns
+    -------
+    results : list
+    """
+    return list(parallel_imap(function, items, workers))
+
+
+def parallel_imap(function, items, workers=None):
+    """
+    Same as parallel_map() but yields each result as soon as it and every result before it are done, so one writer
+    can stream them out in a deterministic order
+    """
+    items = list(items)
+    if workers == 1 or len(items) <= 1:
+        for item in items:
+            yield function(item)
+        return
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(function, items, chunksize=max(1, len(items) // (4 * workers)))
+
+
+def load_roles(location):
+    """
+    Load the chain roles cached for a library directory
+
+    Parameters
+    ----------
+    location : str
+        Library directory
+
+    Returns
+    -------
+    roles : dict
+        File name -> {'key': [mtime_ns, size], 'ALPHA': chain, 'BETA': chain}
+    """
+    cache = os.path.join(location, ROLE_CACHE)
+    if not os.path.isdir(location) or not os.path.exists(cache):
+        return {}
+    try:
+        with open(cache, 'r') as file:
+            return json.load(file)
+    except ValueError:  # Partly written cache, rebuilt on the next save
+        return {}
+
+
+def save_roles(location, roles):
+    """
+    Save chain roles for a library directory, written to a temporary file first so readers never see half a file
+
+    Parameters
+    ----------
+    location : str
+    roles : dict
+        See load_roles()
+    """
+    if not os.path.isdir(location):
+        return
+    cache = os.path.join(location, ROLE_CACHE)
+    with open(cache + ".tmp", 'w') as file:
+        json.dump(roles, file, sort_keys=True)
+    os.replace(cache + ".tmp", cache)
+
+
+def cached_roles(roles, file_name):
+    """
+    Returns the cached roles of a file when the file has not changed since they were found, otherwise None
+    """
+    entry = roles.get(os.path.basename(file_name))
+    if entry is not None and entry['key'] == list(file_key(file_name)[1:]):
+        return {'ALPHA': entry['ALPHA'], 'BETA': entry['BETA']}
+    return None
+
+
+def tcr_sequences(file_name, roles=None):
+    """
+    Return the chain and sequence of the alpha and beta chain of a PDB file, read through the structure cache so
+    files seen before are not parsed again
+
+    Parameters
+    ----------
+    file_name : str
+    roles : dict
+        Optional known {'ALPHA': chain, 'BETA': chain}, skips the sequence alignments
+
+    Returns
+    -------
+    result : dict
+        'pdb' name, 'ALPHA' and 'BETA' (chain, sequence). 'error' holds the message when the file can not be read or
+        holds no TCR alpha/beta pair
+    """
+    try:
+        derived = structure_cache.load(file_name)[1]
+        sequences = derived['sequences']
+        tcr = derived['tcr'] if roles is None else roles
+        if 'ALPHA' not in tcr or 'BETA' not in tcr:
+            raise ValueError("No TCR alpha/beta pair found in " + file_name)
+        return {'pdb': pdb_name(file_name), 'ALPHA': (tcr['ALPHA'], sequences[tcr['ALPHA']]),
+                'BETA': (tcr['BETA'], sequences[tcr['BETA']])}
+    except (ValueError, KeyError, IndexError, OSError) as error:
+        return {'pdb': pdb_name(file_name), 'error': str(error)}
+
+
+def _sequence_worker(job):
+    # (file, cached roles or None) -> tcr_sequences() result plus the file key for the role cache
+    file_name, roles = job
+    result = tcr_sequences(file_name, roles)
+    if 'error' not in result:
+        result['key'] = list(file_key(file_name)[1:])
+    return result
+
+
+def library_sequences(location, id_file=None, workers=None):
+    """
+    Yield tcr_sequences() of every library file in a deterministic order, reading files in parallel. Chain roles are
+    cached next to the library so unchanged files skip the alignments on the next run
+
+    Parameters
+    ----------
+    location : str
+        Library directory or a single PDB file
+    id_file : str
+        Optional STCRDat summary TSV or ID list, see library_files()
+    workers : int
+
+    Yields
+    ------
+    result : dict
+    """
+    files = library_files(location, id_file)
+    roles = load_roles(location)
+    jobs = [(file_name, cached_roles(roles, file_name)) for file_name in files]
+    changed = False
+    for (file_name, known), result in zip(jobs, parallel_imap(_sequence_worker, jobs, workers)):
+        if known is None and 'error' not in result:
+            roles[os.path.basename(file_name)] = {'key': result['key'], 'ALPHA': result['ALPHA'][0],
+                                                  'BETA': result['BETA'][0]}
+            changed = True
+        yield result
+    if changed:
+        save_roles(location, roles)
+
+
+def write_fasta_record(file, name, seq):
+    """
+    Write one FASTA record wrapped at FASTA_WIDTH residues
+    """
+    file.write('>' + name + '\n')
+    for start in range(0, len(seq), FASTA_WIDTH):
+        file.write(seq[start:start + FASTA_WIDTH] + '\n')
+
+
+def export_sequences(location, fasta_file, table_file, id_file=None, workers=None):
+    """
+    Export the TCR sequences of a whole library: one merged FASTA (alpha followed by beta per structure, the record
+    layout of PdbTools3.fasta_TCR()) and a TSV with one row per chain. Chain roles and sequences come from the ATOM
+    records through the structure cache, files without a TCR pair are reported in 'errors'. Files are read in
+    parallel and written by this process only, in library order
+
+    Parameters
+    ----------
+    location : str
+        Library directory
+    fasta_file : str
+    table_file : str
+    id_file : str
+        Optional STCRDat summary TSV or ID list
+    workers : int
+
+    Returns
+    -------
+    counts : dict
+        'written' structures and 'errors' list of (pdb, message)
+    """
+    written, errors = 0, []
+    with open(fasta_file, 'w') as fasta, open(table_file, 'w', newline='') as table:
+        writer = csv.writer(table, delimiter='\t', lineterminator='\n')
+        writer.writerow(['pdb', 'chain_type', 'chain', 'length', 'sequence'])
+        for result in library_sequences(location, id_file, workers):
+            if 'error' in result:
+                errors.append((result['pdb'], result['error']))
+                continue
+            alpha, beta = result['ALPHA'][1], result['BETA'][1]
+            if alpha or beta:
+                write_fasta_record(fasta, result['pdb'], alpha + beta)
+                written += 1
+            for chain_type in ('ALPHA', 'BETA'):
+                chain, seq = result[chain_type]
+                writer.writerow([result['pdb'], chain_type, chain, len(seq), seq])
+    return {'written': written, 'errors': errors}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("library", help="Directory of PDB files", type=str)
+    parser.add_argument("--export", help="Prefix of the merged FASTA (.fasta) and sequence table (.tsv)", type=str)
+    parser.add_argument("--ids", help="STCRDat summary TSV or ID list, limits and orders the library", type=str)
+    parser.add_argument("--workers", help="Processes", type=int)
+    return parser.parse_args()
+
+
+####################
+#     Controls     #
+####################
+def main():
+    args = parse_args()
+    if args.export:
+        result = export_sequences(args.library, args.export + ".fasta", args.export + ".tsv", args.ids, args.workers)
+        for pdb, error in result['errors']:
+            print(pdb + "\terror\t" + error)
+        print("Exported: " + str(result['written']))
+
+
+if __name__ == '__main__':
+    main()
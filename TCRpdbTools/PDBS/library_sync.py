@@ -0,0 +1,328 @@
+#!/usr/bin/python3
+
+######################################################################
+# library_sync.py -- A component of TRain                            #
+# Copyright: Austin Seamann, Dario Ghersi, and Ryan Ehrlich          #
+# Goal: Bring a structure library in line with a new STCRDat summary #
+#       by only fetching, parsing, classifying and indexing entries  #
+#       that were added or changed, and retiring removed ones. A     #
+#       manifest of content hashes makes runs idempotent and lets an #
+#       interrupted run resume where it stopped.                     #
+######################################################################
+
+
+import argparse
+import hashlib
+import json
+import os
+try:  # Imported as part of the web app
+    from PDBS.structure import file_key, PDB_ENDINGS
+    from PDBS import structure_cache, catalog, library, cdr3_search
+except ImportError:  # Ran as a script from within PDBS/
+    from structure import file_key, PDB_ENDINGS
+    import structure_cache
+    import catalog
+    import library
+    import cdr3_search
+
+#################
+#     Global    #
+#################
+MANIFEST = "sync_manifest.json"  # Kept in the library directory
+MANIFEST_VERSION = 2
+RETIRED = "retired"  # Directory of the library that removed entries are moved to
+SAVE_EVERY = 20  # Entries synced between manifest saves, at most this many are redone after an interruption
+# Columns that change with the deposited coordinates, entries are only downloaded again when these change
+STRUCTURE_COLUMNS = ('Bchain', 'Achain', 'Gchain', 'Dchain', 'model', 'antigen_chain', 'mhc_chain1', 'mhc_chain2',
+                     'date', 'method', 'resolution', 'r_free', 'r_factor')
+
+
+#################
+#    Methods    #
+#################
+def summary_rows(summary):
+    """
+    Hash the summary rows of every PDB ID, an ID changes when any of its rows (one per TCR copy) changes. Rows are
+    hashed as column -> value so added, removed or reordered columns only change the IDs whose values differ
+
+    Parameters
+    ----------
+    summary : str
+        STCRDat summary TSV
+
+    Returns
+    -------
+    rows : dict
+        PDB ID -> (SHA1 of its rows, SHA1 of their STRUCTURE_COLUMNS), in order of first appearance
+    digest : str
+        SHA1 of the whole summary
+    """
+    grouped = {}
+    digest = hashlib.sha1()
+    with open(summary, 'rb') as file:
+        header = file.readline()
+        digest.update(header)
+        columns = header.decode().rstrip('\r\n').split('\t')
+        for line in file:
+            digest.update(line)
+            row = dict(zip(columns, line.decode().rstrip('\r\n').split('\t')))
+            pdb = row.get('pdb', '').strip().lower()
+            if pdb:
+                grouped.setdefault(pdb, []).append(row)
+    return {pdb: (row_hash(found), row_hash([{name: row.get(name) for name in STRUCTURE_COLUMNS} for row in found]))
+            for pdb, found in grouped.items()}, digest.hexdigest()
+
+
+def row_hash(rows):
+    """
+    Returns the SHA1 of a list of column -> value dictionaries
+    """
+    return hashlib.sha1(json.dumps(rows, sort_keys=True).encode()).hexdigest()
+
+
+def load_manifest(location):
+    """
+    Load the sync manifest of a library, an empty one when there is none yet
+
+    Returns
+    -------
+    manifest : dict
+        'version', 'summary' (hash of the summary last fully synced) and 'entries' PDB ID -> {'rows': summary rows
+        hash, 'structure': hash of their STRUCTURE_COLUMNS, 'file': file name, 'key': [mtime_ns, size], 'hash': SHA1
+        of the file}
+    """
+    try:
+        with open(os.path.join(location, MANIFEST), 'r') as file:
+            manifest = json.load(file)
+        if manifest.get('version') == MANIFEST_VERSION:
+            return manifest
+    except (OSError, ValueError):
+        pass
+    return {'version': MANIFEST_VERSION, 'summary': None, 'entries': {}}
+
+
+def save_manifest(location, manifest):
+    """
+    Save the sync manifest, written to a temporary file first so an interrupted save leaves the last one intact
+    """
+    file_name = os.path.join(location, MANIFEST)
+    with open(file_name + ".tmp", 'w') as file:
+        json.dump(manifest, file, sort_keys=True)
+    os.replace(file_name + ".tmp", file_name)
+
+
+def entry_file(location, pdb):
+    """
+    Returns the library file of a PDB ID (plain or compressed) or None
+    """
+    for ending in PDB_ENDINGS:
+        file_name = os.path.join(location, pdb + ending)
+        if os.path.exists(file_name):
+            return file_name
+    return None
+
+
+def fetch_entry(location, pdb):
+    """
+    Download a PDB file from RCSB into the library as <pdb>.pdb, replacing the old file in one step. Needs pypdb
+    """
+    try:
+        from pypdb.clients.pdb.pdb_client import get_pdb_file
+    except ImportError:
+        raise ImportError("Fetching entries needs pypdb: pip install pypdb")
+    text = get_pdb_file(pdb, compression=True)
+    if text is None:
+        raise ValueError("PDB %s could not be downloaded from RCSB" % pdb)
+    file_name = os.path.join(location, pdb + ".pdb")
+    with open(file_name + ".tmp", 'w') as file:
+        file.write(text)
+    os.replace(file_name + ".tmp", file_name)
+    for ending in PDB_ENDINGS:  # Compressed copies of the old entry
+        old = os.path.join(location, pdb + ending)
+        if old != file_name and os.path.exists(old):
+            os.remove(old)
+    return file_name
+
+
+def _sync_worker(job):
+    # (library, ID, download) -> entry fetched when asked or missing, parsed and classified through the structure cache
+    location, pdb, download = job
+    try:
+        file_name = entry_file(location, pdb)
+        if download or file_name is None:
+            file_name = fetch_entry(location, pdb)
+        derived = structure_cache.load(file_name)[1]
+        return {'pdb': pdb, 'file': os.path.basename(file_name), 'key': list(file_key(file_name)[1:]),
+                'hash': structure_cache.content_hash(file_name), 'tcr': derived['tcr']}
+    except Exception as error:
+        return {'pdb': pdb, 'error': " ".join(str(error).split()) or type(error).__name__}
+
+
+def plan_sync(location, rows, manifest):
+    """
+    Diff a summary against the manifest of the library
+
+    Parameters
+    ----------
+    location : str
+    rows : dict
+        See summary_rows()
+    manifest : dict
+        See load_manifest()
+
+    Returns
+    -------
+    jobs : list
+        (library, ID, download) of the entries to sync. Entries whose STRUCTURE_COLUMNS changed are downloaded
+        again, others (added, metadata changed, file touched) only when the library does not hold them
+    counts : dict
+        'added', 'changed', 'unchanged' and 'retired' lists of IDs
+    """
+    entries = manifest['entries']
+    counts = {'added': [], 'changed': [], 'unchanged': [], 'retired': [pdb for pdb in entries if pdb not in rows]}
+    jobs = []
+    for pdb, (digest, structure) in rows.items():
+        entry = entries.get(pdb)
+        if entry is None:
+            counts['added'].append(pdb)
+            jobs.append((location, pdb, False))
+        elif entry['structure'] != structure:
+            counts['changed'].append(pdb)
+            jobs.append((location, pdb, True))
+        elif entry['rows'] != digest or not file_current(location, entry):
+            counts['changed'].append(pdb)
+            jobs.append((location, pdb, False))
+        else:
+            counts['unchanged'].append(pdb)
+    return jobs, counts
+
+
+def file_current(location, entry):
+    """
+    Whether the library file of a manifest entry still holds the contents synced. Files with the same modification
+    time and size are not opened, touched files are hashed
+    """
+    file_name = os.path.join(location, entry['file'])
+    if not os.path.exists(file_name):
+        return False
+    if list(file_key(file_name)[1:]) == entry['key']:
+        return True
+    if structure_cache.content_hash(file_name) == entry['hash']:
+        entry['key'] = list(file_key(file_name)[1:])
+        return True
+    return False
+
+
+def retire(location, manifest, roles, pdb):
+    """
+    Move the file of an entry no longer in the summary to the retired directory and forget it
+    """
+    entry = manifest['entries'].pop(pdb)
+    file_name = os.path.join(location, entry['file'])
+    if os.path.exists(file_name):
+        os.makedirs(os.path.join(location, RETIRED), exist_ok=True)
+        os.replace(file_name, os.path.join(location, RETIRED, entry['file']))
+    roles.pop(entry['file'], None)
+
+
+def sync_library(location, summary, workers=None, retire_removed=True, cdr3_index=None):
+    """
+    Sync a library directory with a summary: entries added to or changed in the summary since the last sync (or
+    whose files changed) are fetched, parsed into the structure cache and classified, removed entries are retired,
+    and the catalog, chain roles and optionally the CDR3 index are updated. The manifest is saved as entries finish,
+    so running again after an interruption only redoes what was left. A run of the summary last synced, with every
+    file unchanged, returns before touching the manifest, catalog or indexes
+
+    Parameters
+    ----------
+    location : str
+        Library directory, created when missing
+    summary : str
+        New STCRDat summary TSV
+    workers : int
+    retire_removed : boolean
+        Move files of entries no longer in the summary to <library>/retired
+    cdr3_index : str
+        Optional CDR3 index (see cdr3_search) rebuilt when entries changed
+
+    Returns
+    -------
+    counts : dict
+        See plan_sync(), plus 'errors' list of (ID, message) and 'catalog' counts of catalog.update_catalog() (None
+        when nothing changed)
+    """
+    os.makedirs(location, exist_ok=True)
+    rows, digest = summary_rows(summary)
+    manifest = load_manifest(location)
+    jobs, counts = plan_sync(location, rows, manifest)
+    counts['errors'] = []
+    if manifest['summary'] == digest and not jobs and not (retire_removed and counts['retired']) and \
+            not (cdr3_index and not os.path.exists(cdr3_index)):
+        counts['catalog'] = None
+        return counts
+    roles = library.load_roles(location)
+    if retire_removed:
+        for pdb in counts['retired']:
+            retire(location, manifest, roles, pdb)
+    else:
+        counts['retired'] = []
+    for done, result in enumerate(library.parallel_imap(_sync_worker, jobs, workers), start=1):
+        if 'error' in result:
+            counts['errors'].append((result['pdb'], result['error']))
+        else:
+            rows_hash, structure_hash = rows[result['pdb']]
+            manifest['entries'][result['pdb']] = {'rows': rows_hash, 'structure': structure_hash,
+                                                  'file': result['file'], 'key': result['key'], 'hash': result['hash']}
+            if result['tcr']:
+                roles[result['file']] = {'key': result['key'], 'ALPHA': result['tcr']['ALPHA'],
+                                         'BETA': result['tcr']['BETA']}
+        if done % SAVE_EVERY == 0:
+            save_manifest(location, manifest)
+            library.save_roles(location, roles)
+    if not counts['errors']:
+        manifest['summary'] = digest
+    save_manifest(location, manifest)
+    library.save_roles(location, roles)
+    counts['catalog'] = catalog.update_catalog(location, workers=workers)
+    if cdr3_index and (jobs or counts['retired'] or not os.path.exists(cdr3_index)):
+        cdr3_search.build_index(location, cdr3_index, workers)
+    return counts
+
+
+####################
+#     Controls     #
+####################
+def parse_args():
+    """
+    Parse the arguments
+    """
+    parser = argparse.ArgumentParser(description="Sync a structure library with a new STCRDat summary")
+    parser.add_argument("library", help="Directory of PDB files", type=str)
+    parser.add_argument("summary", help="STCRDat summary TSV", type=str)
+    parser.add_argument("--workers", help="Processes", type=int)
+    parser.add_argument("--keep_removed", help="Leave files of removed entries in the library", action="store_true",
+                        default=False)
+    parser.add_argument("--cdr3_index", help="CDR3 index rebuilt when entries changed, ex. cdr3_index.npz", type=str)
+    parser.add_argument("--dry_run", help="Only list what would be synced", action="store_true", default=False)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.dry_run:
+        rows = summary_rows(args.summary)[0]
+        counts = plan_sync(args.library, rows, load_manifest(args.library))[1]
+        for name in ('added', 'changed', 'retired'):
+            for pdb in counts[name]:
+                print(pdb + "\t" + name)
+    else:
+        counts = sync_library(args.library, args.summary, args.workers, not args.keep_removed, args.cdr3_index)
+        for pdb, error in counts['errors']:
+            print(pdb + "\terror\t" + error)
+    print("Added: %d\tChanged: %d\tUnchanged: %d\tRetired: %d\tErrors: %d"
+          % (len(counts['added']), len(counts['changed']), len(counts['unchanged']), len(counts['retired']),
+             len(counts.get('errors', []))))
+
+
+if __name__ == '__main__':
+    main()
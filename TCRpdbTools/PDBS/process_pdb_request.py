@@ -1,29 +1,53 @@
 import os
+import re
+import shutil
+import tempfile
+import threading
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from PDBS.PDB_Tools_V3 import PdbTools3
+from PDBS.single_flight import shared, flight_key
+from PDBS import structure_cache
+from PDBS.stcrdat import load_summary
 from TCRpdbTools.settings import BASE_DIR
 from pypdb.clients.pdb.pdb_client import *
 from shutil import copyfile
 
+PDB_ID = re.compile(r"^[0-9][A-Za-z0-9]{3}$")
+MAX_BATCH = 200  # Most PDB IDs in one batch request
+STREAM_BLOCK = 1 << 16  # Bytes of a result file read at a time while streaming a batch
+FETCH_TTL = 24 * 3600  # Seconds a downloaded PDB is reused by later requests
+PREFETCH_LIMIT = 4  # Most prefetches waiting at a time, the oldest waiting one is cancelled to make room
+PREFETCH_NICE = 10  # Added to the niceness of the prefetch process so real jobs get the CPU first
+
+_prefetcher = None
+_prefetches = OrderedDict()  # PDB ID -> future, in order of selection
+_prefetch_lock = threading.Lock()
+
 
 def get_pdb(pdb_id):
+    # Downloaded gzip compressed (about 4x smaller), pypdb decompresses it. Concurrent requests for the same ID in
+    # any worker share one download
     pdb_loc = pdb_id + ".pdb"
-    with open(pdb_loc, "w") as f:
-        pdb_file = get_pdb_file(pdb_id, compression=False)
-        f.write(pdb_file)
-    return pdb_loc
 
+    def download():
+        pdb_file = get_pdb_file(pdb_id, compression=True)
+        if pdb_file is None:
+            raise ValueError("PDB %s could not be downloaded from RCSB" % pdb_id)
+        with open(pdb_loc, "w") as f:
+            f.write(pdb_file)
+        return os.path.abspath(pdb_loc)
 
-def process_modification(context):
-    # Change working directory while processing PDB
-    os.chdir(str(BASE_DIR) + "/PDBS/")
+    copyfile(shared(flight_key("fetch", pdb_id.lower()), download, FETCH_TTL), pdb_loc)
+    return pdb_loc
 
-    # Grab PDB from RCSB DB
-    pdb = context["pdb"]
-    pdb_loc = get_pdb(pdb)
 
-    # Perform actions
+def run_actions(pdb_loc, actions):
+    # Perform actions on a PDB in the working directory, returns the archive of split_all if one was asked for
     tool = PdbTools3(pdb_loc)
-    for action in context["actions"]:
+    archive = None
+    for action in actions:
         if action == "center":
             tool.center(pdb_loc)
         if action == "clean_docking_count_non_tcr":
@@ -40,7 +64,187 @@ def process_modification(context):
             tool.split_pmhc(pdb_loc)
         if action == "clean_pdb":
             tool.clean_pdb()
+        if action == "split_all":
+            archive = tool.split_archive(pdb_loc.split(".")[0] + "_split.zip")
+    return archive
+
+
+def process_copy(copy_loc, actions):
+    # Each copy has its own directory, so actions writing next to the PDB don't collide between workers
+    os.chdir(os.path.dirname(copy_loc))
+    archive = run_actions(os.path.basename(copy_loc), actions)
+    return os.path.abspath(archive) if archive else copy_loc
+
+
+def process_copies(pdb_loc, actions):
+    # Split every TCR-pMHC assembly of the PDB and process them in parallel, results are zipped by copy number
+    pdb = pdb_loc.split(".")[0]
+    copies = [os.path.abspath(copy) for copy in PdbTools3(pdb_loc).split_complexes()]
+    if not copies:
+        return None
+    with ProcessPoolExecutor(max_workers=min(len(copies), os.cpu_count() or 1)) as executor:
+        copies = list(executor.map(process_copy, copies, [actions] * len(copies)))
+    zip_loc = pdb + "_copies.zip"
+    with zipfile.ZipFile(zip_loc, "w", zipfile.ZIP_DEFLATED) as archive:
+        for count, copy in enumerate(copies, start=1):
+            archive.write(copy, "%s_%d%s" % (pdb, count, ".zip" if copy.endswith(".zip") else ".pdb"))
+    return zip_loc
+
+
+def process_modification(context):
+    # Concurrent requests for the same PDB and actions, from any worker, wait on one computation and share its result
+    key = flight_key("process", context["pdb"].lower(), list(context["actions"]), bool(context.get("all_copies")))
+    return shared(key, lambda: modify(context))
+
+
+def modify(context):
+    # Change working directory while processing PDB
+    os.chdir(str(BASE_DIR) + "/PDBS/")
+
+    # Grab PDB from RCSB DB
+    pdb = context["pdb"]
+    pdb_loc = get_pdb(pdb)
+
+    # Perform actions on every copy of the complex when asked, falls back on the whole file if none are complete
+    if context.get("all_copies"):
+        zip_loc = process_copies(pdb_loc, context["actions"])
+        if zip_loc is not None:
+            copyfile(zip_loc, "../static/PDBS/%s" % zip_loc)
+            os.chdir(str(BASE_DIR))
+            return str(BASE_DIR) + "/PDBS/" + zip_loc
+
+    archive = run_actions(pdb_loc, context["actions"])
+    if archive is not None:
+        copyfile(archive, "../static/PDBS/%s" % archive)
+        os.chdir(str(BASE_DIR))
+        return str(BASE_DIR) + "/PDBS/" + archive
 
     copyfile(pdb_loc, "../static/PDBS/%s.pdb" % pdb)
     os.chdir(str(BASE_DIR))
     return str(BASE_DIR) + "/PDBS/" + pdb_loc
+
+
+def filter_ids(filters, summary=None):
+    # PDB IDs of the (newest) summary matching every column filter, ex. {"mhc_type": "MH1", "resolution": ":2.5"}, see
+    # stcrdat.SummaryIndex.column_mask()
+    return load_summary(summary).ids_matching(filters)
+
+
+def process_entry(pdb, actions, work_dir):
+    # Fetch and process one PDB of a batch in its own directory, returns the result file
+    entry_dir = os.path.join(work_dir, pdb)
+    os.makedirs(entry_dir)
+    os.chdir(entry_dir)
+    pdb_loc = get_pdb(pdb)
+    archive = run_actions(pdb_loc, actions)
+    return os.path.abspath(archive or pdb_loc)
+
+
+class ZipStream:
+    # Write only file object for zipfile.ZipFile, keeps the bytes written since the last pop(). Having no seek()
+    # makes zipfile write every entry in one pass with data descriptors, so the archive can be sent as it grows
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_batch(pdbs, actions, workers=None):
+    # Process many PDBs in a worker pool and yield a ZIP archive piece by piece, each entry is added as soon as its
+    # PDB is done. Only one block of a result file is held in memory at a time. manifest.tsv, written last, holds
+    # the status of every PDB and the error of the ones that failed
+    work_dir = tempfile.mkdtemp(prefix="batch_", dir=str(BASE_DIR) + "/PDBS/")
+    stream = ZipStream()
+    manifest = ["pdb\tstatus\tfile\terror"]
+    executor = ProcessPoolExecutor(max_workers=min(len(pdbs), workers or os.cpu_count() or 1) or 1)
+    try:
+        with zipfile.ZipFile(stream, "w", zipfile.ZIP_DEFLATED) as archive:
+            futures = {executor.submit(process_entry, pdb, actions, work_dir): pdb for pdb in pdbs}
+            for future in as_completed(futures):
+                pdb = futures[future]
+                try:
+                    result = future.result()
+                except Exception as error:
+                    manifest.append("%s\terror\t\t%s" % (pdb, " ".join(str(error).split()) or type(error).__name__))
+                    continue
+                name = os.path.basename(result)
+                with open(result, "rb") as source, archive.open(name, "w") as target:
+                    for block in iter(lambda: source.read(STREAM_BLOCK), b""):
+                        target.write(block)
+                        yield stream.pop()
+                manifest.append("%s\tok\t%s\t" % (pdb, name))
+                shutil.rmtree(os.path.join(work_dir, pdb), ignore_errors=True)
+                yield stream.pop()
+            archive.writestr("manifest.tsv", "\n".join(manifest) + "\n")
+        yield stream.pop()
+    finally:
+        # Also reached when the client disconnects part way, pending PDBs are dropped and running ones finish first
+        executor.shutdown(wait=True, cancel_futures=True)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _lower_priority():
+    # Initializer of the prefetch process
+    try:
+        os.nice(PREFETCH_NICE)
+    except OSError:
+        pass
+
+
+def warm(pdb):
+    # Download a PDB into the shared download store and fill the structure cache (atoms, chain sequences and TCR
+    # roles), so a request for it right after finds both ready
+    work_dir = tempfile.mkdtemp(prefix="prefetch_", dir=str(BASE_DIR) + "/PDBS/")
+    try:
+        os.chdir(work_dir)
+        structure_cache.load(os.path.abspath(get_pdb(pdb)))
+    finally:
+        os.chdir(str(BASE_DIR) + "/PDBS/")
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return pdb
+
+
+def prefetch(pdb):
+    # Warm the caches of a selected PDB in one low priority background process. Selections waiting past
+    # PREFETCH_LIMIT are cancelled oldest first, the one being warmed always finishes. Returns the future or None
+    global _prefetcher
+    pdb = pdb.lower()
+    if not PDB_ID.match(pdb):
+        return None
+    with _prefetch_lock:
+        for done in [each for each, future in _prefetches.items() if future.done()]:
+            del _prefetches[done]
+        if pdb in _prefetches:
+            return _prefetches[pdb]
+        waiting = [each for each, future in _prefetches.items() if not future.running()]
+        while waiting and len(_prefetches) >= PREFETCH_LIMIT:
+            _prefetches.pop(waiting.pop(0)).cancel()
+        if _prefetcher is None:
+            _prefetcher = ProcessPoolExecutor(max_workers=1, initializer=_lower_priority)
+        _prefetches[pdb] = _prefetcher.submit(warm, pdb)
+        return _prefetches[pdb]
+
+
+def cancel_prefetch(pdb=None):
+    # Cancel the waiting prefetch of one PDB, or every waiting one. Returns the IDs cancelled
+    with _prefetch_lock:
+        cancelled = [each for each, future in _prefetches.items()
+                     if (pdb is None or each == pdb.lower()) and future.cancel()]
+        for each in cancelled:
+            del _prefetches[each]
+    return cancelled
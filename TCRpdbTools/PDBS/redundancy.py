@@ -0,0 +1,371 @@
+#!/usr/bin/python3
+
+######################################################################
+# redundancy.py -- A component of TRain                              #
+# Copyright: Austin Seamann, Dario Ghersi, and Ryan Ehrlich          #
+# Goal: Non-redundant TCR sets at chosen sequence identities. Pairs  #
+#       are prefiltered by shared k-mers and length, only candidates #
+#       get a banded alignment, spread over a pool of processes.     #
+######################################################################
+
+
+import argparse
+import numpy as np
+from scipy import sparse
+try:  # Imported as part of the web app
+    from PDBS import germline, library
+except ImportError:  # Ran as a script from within PDBS/
+    import germline
+    import library
+
+#################
+#     Global    #
+#################
+THRESHOLDS = (0.90, 0.95, 0.99)
+K = 5  # k-mer length of the prefilter
+J_LENGTH = 10  # Residues of the J gene kept after the CDR3 when trimming to the variable domain
+PAIR_CHUNK = 2000  # Candidate pairs sent to a worker at once
+EPSILON = 1e-9  # Identities this close to a threshold count as reaching it
+FAR = 1 << 30  # Edit distance of cells outside the band
+
+
+#################
+#    Methods    #
+#################
+def variable_domain(seq):
+    """
+    Trim a TCR chain to its variable domain (through the J gene after CDR3). Constant domains are nearly identical
+    between TCRs and would hide differences in the variable domain
+
+    Parameters
+    ----------
+    seq : str
+
+    Returns
+    -------
+    seq : str
+    """
+    loop, start, end = germline.motif_cdr3(seq)
+    return seq[:end + J_LENGTH] if loop else seq
+
+
+def kmer_matrix(seqs, k=K):
+    """
+    Sparse (sequence, k-mer) presence matrix
+
+    Parameters
+    ----------
+    seqs : list
+    k : int
+
+    Returns
+    -------
+    matrix : sparse.csr_matrix
+    """
+    rows, codes = [], []
+    for row, seq in enumerate(seqs):
+        found = np.unique(germline.encode_kmers(seq, k))
+        rows.append(np.full(len(found), row, dtype=np.int64))
+        codes.append(found)
+    rows = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)
+    codes = np.concatenate(codes) if codes else np.zeros(0, dtype=np.int64)
+    columns = np.unique(codes, return_inverse=True)[1].reshape(-1)
+    return sparse.csr_matrix((np.ones(len(rows), dtype=np.int32), (rows, columns)),
+                             shape=(len(seqs), int(columns.max()) + 1 if len(columns) else 0))
+
+
+def candidate_pairs(seqs, identity, k=K):
+    """
+    Pairs that could reach the identity. The k-mer matrix only records presence, and an edit removes at most k
+    k-mers, so sequences within d edits share at least max(distinct k-mers of either) - k * d k-mers. Pairs below
+    that bound are dropped without an alignment
+
+    Parameters
+    ----------
+    seqs : list
+    identity : float
+        Lowest identity of interest
+    k : int
+
+    Returns
+    -------
+    pairs : np.ndarray
+        (P, 2) with i < j
+    """
+    if len(seqs) < 2:
+        return np.zeros((0, 2), dtype=np.int64)
+    matrix = kmer_matrix(seqs, k)
+    shared = sparse.triu(matrix @ matrix.T, k=1).tocoo()
+    lengths = np.array([len(seq) for seq in seqs])
+    distinct = np.asarray(matrix.sum(axis=1)).reshape(-1)
+    edits = max_edits(identity, np.maximum(lengths[shared.row], lengths[shared.col]))
+    keep = shared.data >= np.maximum(distinct[shared.row], distinct[shared.col]) - k * edits
+    return np.column_stack((shared.row[keep], shared.col[keep])).astype(np.int64)
+
+
+def encode(seqs, length, fill):
+    """
+    Sequences as rows of byte codes, padded to length with fill
+    """
+    codes = np.full((len(seqs), length), fill, dtype=np.uint8)
+    for row, seq in enumerate(seqs):
+        codes[row, :len(seq)] = np.frombuffer(seq.encode('ascii', 'replace'), dtype=np.uint8)
+    return codes
+
+
+def banded_distances(firsts, seconds, band):
+    """
+    Edit distances of many sequence pairs from one banded dynamic program run over every pair at once. Only cells
+    within band of the diagonal are filled (a path leaving the band needs more than band gaps), each row is a few
+    array operations over all pairs: a horizontal gap chain is a running minimum
+
+    Parameters
+    ----------
+    firsts : list
+    seconds : list
+        Same order as firsts
+    band : int
+        Largest distance of interest
+
+    Returns
+    -------
+    distances : np.ndarray
+        Edit distance of each pair, band + 1 for pairs further apart than band
+    """
+    band = int(band)
+    lengths_1 = np.array([len(seq) for seq in firsts], dtype=np.int64)
+    lengths_2 = np.array([len(seq) for seq in seconds], dtype=np.int64)
+    distances = np.full(len(firsts), band + 1, dtype=np.int64)
+    if not len(firsts):
+        return distances
+    rows = int(lengths_1.max())
+    seq_1 = encode(firsts, rows, 0)
+    seq_2 = encode(seconds, max(rows + band, int(lengths_2.max()), 1), 1)
+    offsets = np.arange(-band, band + 1)  # Column j of row i is cell i + offset
+    end = lengths_2 - lengths_1 + band  # Offset index of the last cell of each pair
+    reachable = (end >= 0) & (end <= 2 * band)
+    table = np.broadcast_to(np.where(offsets >= 0, offsets, FAR), (len(firsts), len(offsets))).copy()
+    done = reachable & (lengths_1 == 0)
+    distances[done] = table[done, end[done]]
+    for row in range(1, rows + 1):
+        columns = row + offsets
+        diagonal = table + (seq_2[:, np.clip(columns - 1, 0, None)] != seq_1[:, row - 1:row])
+        diagonal[:, columns < 1] = FAR
+        vertical = np.full_like(table, FAR)
+        vertical[:, :-1] = table[:, 1:] + 1
+        table = np.minimum.accumulate(np.minimum(diagonal, vertical) - offsets, axis=1) + offsets
+        np.minimum(table, FAR, out=table)
+        done = reachable & (lengths_1 == row)
+        distances[done] = table[done, end[done]]
+    return np.minimum(distances, band + 1)
+
+
+def identities(firsts, seconds, identity):
+    """
+    Identity (1 - edit distance / longer length) of sequence pairs, see banded_distances()
+
+    Parameters
+    ----------
+    firsts : list
+    seconds : list
+    identity : float
+        Lowest identity of interest, sets the band
+
+    Returns
+    -------
+    identities : np.ndarray
+        0.0 for pairs below the identity asked for
+    """
+    longest = np.maximum([len(seq) for seq in firsts], [len(seq) for seq in seconds]) if firsts else np.zeros(0)
+    if not len(longest):
+        return np.zeros(0)
+    result = 1.0 - banded_distances(firsts, seconds, max_edits(identity, longest.max())) / np.maximum(longest, 1)
+    return np.where(result >= identity - EPSILON, result, 0.0)
+
+
+def pair_identity(seq_1, seq_2, identity):
+    """
+    Identity (1 - edit distance / longer length) of two sequences, 0.0 when the pair is below the identity asked for
+    """
+    return float(identities([seq_1], [seq_2], identity)[0])
+
+
+def max_edits(identity, length):
+    """
+    Most edits a sequence of length can have and still reach identity
+    """
+    return np.floor((1 - identity) * length + EPSILON)
+
+
+def _identity_worker(job):
+    # Identities of a chunk of candidate pairs: job is (first seqs, second seqs, identity)
+    firsts, seconds, identity = job
+    return identities(firsts, seconds, identity).tolist()
+
+
+def chain_identities(seqs, identity=min(THRESHOLDS), workers=None):
+    """
+    Identity of every pair of unique sequences that reaches identity, candidates are aligned in parallel
+
+    Parameters
+    ----------
+    seqs : list
+        Unique sequences
+    identity : float
+    workers : int
+
+    Returns
+    -------
+    matrix : sparse.csr_matrix
+        Symmetric identities with 1 on the diagonal, pairs below identity are left out
+    """
+    n = len(seqs)
+    pairs = candidate_pairs(seqs, identity)
+    jobs = []
+    for start in range(0, len(pairs), PAIR_CHUNK):
+        chunk = pairs[start:start + PAIR_CHUNK]
+        jobs.append(([seqs[i] for i in chunk[:, 0]], [seqs[j] for j in chunk[:, 1]], identity))
+    values = np.array([value for chunk in library.parallel_map(_identity_worker, jobs, workers) for value in chunk],
+                      dtype=np.float64)
+    keep = values > 0
+    rows = np.concatenate((pairs[keep, 0], pairs[keep, 1], np.arange(n)))
+    columns = np.concatenate((pairs[keep, 1], pairs[keep, 0], np.arange(n)))
+    values = np.concatenate((values[keep], values[keep], np.ones(n)))
+    return sparse.csr_matrix((values, (rows, columns)), shape=(n, n))
+
+
+def pair_identities(alphas, betas, identity=min(THRESHOLDS), workers=None):
+    """
+    Identity of every pair of TCRs above the lowest identity of interest. A pair's identity is the lower of its alpha
+    and beta identity, so both chains have to match for two TCRs to be redundant. Each chain is only aligned once per
+    unique sequence, libraries hold many copies of the same TCR
+
+    Parameters
+    ----------
+    alphas : list
+        Alpha variable domain sequences
+    betas : list
+        Beta variable domain sequences, same order
+    identity : float
+    workers : int
+
+    Returns
+    -------
+    matrix : sparse.csr_matrix
+        Symmetric identities with 1 on the diagonal, pairs below identity are left out
+    """
+    n = len(alphas)
+    result = None
+    for seqs in (alphas, betas):
+        unique, inverse = np.unique(np.array(seqs, dtype=str), return_inverse=True)
+        inverse = inverse.reshape(-1)
+        # Expand unique sequence identities to every structure holding them
+        members = sparse.csr_matrix((np.ones(n), (np.arange(n), inverse)), shape=(n, len(unique)))
+        expanded = (members @ chain_identities(unique.tolist(), identity, workers) @ members.T).tocsr()
+        result = expanded if result is None else result.minimum(expanded)
+    result.eliminate_zeros()
+    return result
+
+
+def representatives(matrix, identity, order=None):
+    """
+    Greedy non-redundant selection: entries are visited in order and become a representative unless they reach the
+    identity with an earlier representative
+
+    Parameters
+    ----------
+    matrix : sparse.csr_matrix
+        Output of pair_identities()
+    identity : float
+    order : list
+        Optional visiting order (ex. best resolution first), defaults to index order
+
+    Returns
+    -------
+    clusters : dict
+        Representative index -> list of member indices (representative first)
+    """
+    order = range(matrix.shape[0]) if order is None else order
+    clusters = {}
+    for entry in order:
+        row = matrix.getrow(entry)
+        close = [(value, int(other)) for other, value in zip(row.indices, row.data)
+                 if value >= identity - EPSILON and int(other) in clusters]
+        if close:
+            representative = max(close)[1]
+            clusters[representative].append(entry)
+        else:
+            clusters[entry] = [entry]
+    return clusters
+
+
+def non_redundant(location, prefix, thresholds=THRESHOLDS, id_file=None, workers=None):
+    """
+    Write non-redundant sets of a library: PREFIX_<identity>.tsv with one row per representative and its members, and
+    PREFIX_identity.tsv, the identity matrix (0 below the lowest threshold)
+
+    Parameters
+    ----------
+    location : str
+        Library directory
+    prefix : str
+    thresholds : list
+        Identities, ex. 0.9
+    id_file : str
+        Optional STCRDat summary TSV or ID list, also sets the visiting order
+    workers : int
+
+    Returns
+    -------
+    counts : dict
+        Identity -> number of representatives
+    """
+    names, alphas, betas = [], [], []
+    for result in library.library_sequences(location, id_file, workers):
+        if 'error' not in result and result['ALPHA'][1] and result['BETA'][1]:
+            names.append(result['pdb'])
+            alphas.append(variable_domain(result['ALPHA'][1]))
+            betas.append(variable_domain(result['BETA'][1]))
+    matrix = pair_identities(alphas, betas, min(thresholds), workers)
+    counts = {}
+    for identity in thresholds:
+        clusters = representatives(matrix, identity)
+        counts[identity] = len(clusters)
+        with open("%s_%d.tsv" % (prefix, round(identity * 100)), 'w') as file:
+            file.write("representative\tmembers\n")
+            for representative, members in clusters.items():
+                file.write(names[representative] + "\t" + ",".join(names[member] for member in members) + "\n")
+    with open(prefix + "_identity.tsv", 'w') as file:
+        file.write("pdb\t" + "\t".join(names) + "\n")
+        for row in range(len(names)):
+            values = np.zeros(len(names))
+            line = matrix.getrow(row)
+            values[line.indices] = line.data
+            values[row] = 1.0
+            file.write(names[row] + "\t" + "\t".join("%.3f" % value for value in values) + "\n")
+    return counts
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("library", help="Directory of PDB files", type=str)
+    parser.add_argument("--out", help="Prefix of output tables", type=str, default="non_redundant")
+    parser.add_argument("--thresholds", help="Identities to select at", type=float, nargs="+",
+                        default=list(THRESHOLDS))
+    parser.add_argument("--ids", help="STCRDat summary TSV or ID list, limits and orders the library", type=str)
+    parser.add_argument("--workers", help="Processes", type=int)
+    return parser.parse_args()
+
+
+####################
+#     Controls     #
+####################
+def main():
+    args = parse_args()
+    counts = non_redundant(args.library, args.out, args.thresholds, args.ids, args.workers)
+    for identity, count in counts.items():
+        print("%d%%\t%d representatives" % (round(identity * 100), count))
+
+
+if __name__ == '__main__':
+    main()
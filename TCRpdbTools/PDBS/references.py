@@ -0,0 +1,93 @@
+#!/usr/bin/python3
+
+######################################################################
+# references.py -- A component of TRain                              #
+# Copyright: Austin Seamann, Dario Ghersi, and Ryan Ehrlich          #
+# Goal: Hard coded reference chains used to classify the chains of  #
+#       a TCR-pMHC PDB file by sequence alignment.                   #
+######################################################################
+
+
+from functools import lru_cache
+from Bio import Align
+from Bio.Align import substitution_matrices
+try:  # Imported as part of the web app
+    from PDBS import score_cache
+except ImportError:  # Ran as a script from within PDBS/
+    import score_cache
+
+#################
+#     Global    #
+#################
+# Hard coded peptide chains for alpha and beta elements of the TCR (1ao7 D and E first)
+ALPHA_CHAINS = [
+    'KEVEQNSGPLSVPEGAIASLNCTYSDRGSQSFFTYRQYSGKSPELIMSIYSNGDKEDGRFTAQLNKASQYVSLLIRDSQPSDSATYLCAVTTDSTGKLQFGAGT'
+    'QVVVTPDIQNPDPAVYQLRDSKSSDKSVCLFTDFDSQTNVSQSKDSDVYITDKTVLDMRSMDFKSNSAVATSNKSDFACANAFNNSIIPEDTFFPSPESS',
+    'QKVTQTQTSISVMEKTTVTMDCVYETQDSSYFLFTYKQTASGEIVFLIRQDSYKKENATVGHYSLNFQKPKSSIGLIITATQIEDSAVYFCAMRGDYGGSGNKL'
+    'IFGTGTLLSVKP']
+BETA_CHAINS = [
+    'NAGVTQTPKFQVLKTGQSMTLQCAQDMNHEYMSTYRQDPGMGLRLIHYSVGAGITDQGEVPNGYNVSRSTTEDFPLRLLSAAPSQTSVYFCASRPGLAGGRPEQ'
+    'YFGPGTRLTVTEDLKNVFPPEVAVFEPSEAEISHTQKATLVCLATGFYPDHVELSTTVNGKEVHSGVSTDPQPLKEQPALNDSRYALSSRLRVSATFTQNPRNHF'
+    'RCQVQFYGLSENDETTQDRAKPVTQIVSAEATGRAD',
+    'VTLLEQNPRTRLVPRGQAVNLRCILKNSQYPTMSTYQQDLQKQLQTLFTLRSPGDKEVKSLPGADYLATRVTDTELRLQVANMSQGRTLYCTCSADRVGNTLYFG'
+    'EGSRLIV']
+# Hard coded MHC chain (1ao7 A)
+MHC_CHAIN = 'GSHSMRYFFTSVSRPGRGEPRFIAVGYVDDTQFVRFDSDAASQRMEPRAPWIEQEGPEYWDGETRKVKAHSQTHRVDLGTLRGYYNQSEAGSHTV'\
+            'QRMYGCDVGSDWRFLRGYHQYAYDGKDYIALKEDLRSWTAADMAAQTTKHKWEAAHVAEQLRAYLEGTCVEWLRRYLENGKETLQRTDAPKTHMT'\
+            'HHAVSDHEATLRCWALSFYPAEITLTWQRDGEDQTQDTELVETRPAGDGTFQKWAAVVVPSGQEQRYTCHVQHEGLPKPLTLRWE'
+# Hard coded b2m chain (1ao7 B)
+B2M_CHAIN = 'MIQRTPKIQVYSRHPAENGKSNFLNCYVSGFHPSDIEVDLLKNGERIEKVEHSDLSFSKDWSFYLLYCTEFTPTEKDEYACRVNHVTLSQPCIVKWDRDM'
+# Reference used for each chain role
+REFERENCES = {'ALPHA': ALPHA_CHAINS[0], 'BETA': BETA_CHAINS[0], 'MHC': MHC_CHAIN, 'B2M': B2M_CHAIN}
+# Settings of role_aligner(), part of every cached score key
+ROLE_PARAMS = "global|BLOSUM62|end_gap=0"
+
+
+#################
+#    Methods    #
+#################
+def role_aligner():
+    """
+    Returns the aligner used to score chains against the references: global, BLOSUM62, free end gaps
+
+    Returns
+    -------
+    aligner : Align.PairwiseAligner
+    """
+    aligner = Align.PairwiseAligner()
+    aligner.mode = 'global'
+    aligner.substitution_matrix = substitution_matrices.load('BLOSUM62')
+    aligner.target_end_gap_score = 0.0
+    aligner.query_end_gap_score = 0.0
+    return aligner
+
+
+@lru_cache(maxsize=1)
+def _shared_aligner():
+    return role_aligner()
+
+
+def alignment_scores(pairs):
+    """
+    role_aligner() scores of (sequence, reference) pairs. Scores come from the persistent score cache when any
+    process has aligned the same pair before, only new pairs are aligned
+
+    Parameters
+    ----------
+    pairs : list
+        (sequence, reference sequence)
+
+    Returns
+    -------
+    scores : list
+        Same order as pairs
+    """
+    reference_ids = [score_cache.sequence_key(ref, '', '') for seq, ref in pairs]
+    return score_cache.get_cache().scores(pairs, reference_ids, ROLE_PARAMS, _shared_aligner().score)
+
+
+def alignment_score(seq, reference):
+    """
+    role_aligner() score of one sequence against a reference, see alignment_scores()
+    """
+    return alignment_scores([(seq, reference)])[0]
@@ -0,0 +1,208 @@
+#!/usr/bin/python3
+
+######################################################################
+# sasa.py -- A component of TRain                                    #
+# Copyright: Austin Seamann, Dario Ghersi, and Ryan Ehrlich          #
+# Goal: Shrake-Rupley solvent accessible surface area (SASA) and     #
+#       buried surface area between a TCR and its pMHC, computed on  #
+#       NumPy arrays so thousands of docking decoys can be scored.   #
+######################################################################
+
+
+from functools import lru_cache
+import numpy as np
+from scipy.spatial import cKDTree
+
+#################
+#     Global    #
+#################
+PROBE = 1.4  # Water probe radius (angstroms)
+N_POINTS = 100  # Sphere points per atom
+PAIR_CHUNK = 50000  # Atom pairs tested at once, bounds memory to PAIR_CHUNK * N_POINTS floats
+
+
+#################
+#    Methods    #
+#################
+@lru_cache(maxsize=8)
+def sphere_points(n_points=N_POINTS):
+    """
+    Returns n points evenly spread over a unit sphere (golden spiral)
+
+    Parameters
+    ----------
+    n_points : int
+
+    Returns
+    -------
+    points : np.ndarray
+        (n_points, 3) array, read only since it is shared between calls
+    """
+    index = np.arange(n_points, dtype=np.float64) + 0.5
+    phi = np.arccos(1 - 2 * index / n_points)
+    theta = np.pi * (1 + 5 ** 0.5) * index
+    points = np.column_stack((np.cos(theta) * np.sin(phi), np.sin(theta) * np.sin(phi), np.cos(phi)))
+    points.setflags(write=False)
+    return points
+
+
+def shrake_rupley(coords, radii, n_points=N_POINTS, probe=PROBE, subset=None):
+    """
+    Calculate the SASA of every atom. Neighbour lists come from a KD-tree and every sphere point of an atom is tested
+    against all of its neighbours in one batched NumPy operation
+
+    Parameters
+    ----------
+    coords : np.ndarray
+        (N, 3) atom coordinates
+    radii : np.ndarray
+        (N,) van der Waals radii
+    n_points : int
+        Sphere points per atom, more points give a finer estimate
+    probe : float
+        Solvent probe radius
+    subset : np.ndarray
+        Optional indices of the only atoms to calculate, all N atoms still occlude
+
+    Returns
+    -------
+    sasa : np.ndarray
+        Accessible area in square angstroms of each atom (or of each atom in subset)
+    """
+    coords = np.asarray(coords, dtype=np.float64)
+    expanded = np.asarray(radii, dtype=np.float64) + probe
+    targets = np.arange(len(coords)) if subset is None else np.asarray(subset, dtype=np.int64)
+    if len(targets) == 0:
+        return np.zeros(0)
+    points = sphere_points(n_points)
+    pairs = neighbour_pairs(coords, expanded, subset)
+    # Rows of buried are positions in targets
+    buried = np.zeros((len(targets), n_points), dtype=bool)
+    for start in range(0, len(pairs), PAIR_CHUNK):
+        chunk = pairs[start:start + PAIR_CHUNK]
+        row, atom_i, atom_j = chunk[:, 0], targets[chunk[:, 0]], chunk[:, 1]
+        # Point p of atom i is inside j when |r_i * p + d|^2 < r_j^2 with d = c_i - c_j, which reduces to a single
+        # matrix product: p . d < (r_j^2 - r_i^2 - |d|^2) / (2 * r_i)
+        diff = coords[atom_i] - coords[atom_j]
+        limit = (expanded[atom_j] ** 2 - expanded[atom_i] ** 2 - np.einsum('ij,ij->i', diff, diff))\
+            / (2 * expanded[atom_i])
+        inside = diff @ points.T < limit[:, None]
+        # Collapse the rows of each target, rows are sorted so each target appears once in the result
+        first = np.flatnonzero(np.r_[True, row[1:] != row[:-1]])
+        buried[row[first]] |= np.logical_or.reduceat(inside, first, axis=0)
+    exposed = n_points - buried.sum(axis=1)
+    return 4.0 * np.pi * expanded[targets] ** 2 * exposed / n_points
+
+
+def neighbour_pairs(coords, expanded, subset=None):
+    """
+    Neighbour list of every target atom: all other atoms whose expanded sphere overlaps it
+
+    Parameters
+    ----------
+    coords : np.ndarray
+    expanded : np.ndarray
+        Radii plus probe
+    subset : np.ndarray
+        Optional indices of atoms to find neighbours for, defaults to all atoms
+
+    Returns
+    -------
+    pairs : np.ndarray
+        (P, 2) array of [position in subset, neighbour atom index] sorted by the first column
+    """
+    tree = cKDTree(coords)
+    cutoff = 2 * expanded.max()
+    targets = np.arange(len(coords)) if subset is None else np.asarray(subset, dtype=np.int64)
+    if subset is None:
+        pairs = tree.query_pairs(cutoff, output_type='ndarray')
+        pairs = np.concatenate((pairs, pairs[:, ::-1]))
+    else:
+        pairs = cKDTree(coords[targets]).sparse_distance_matrix(tree, cutoff, output_type='ndarray')
+        pairs = np.column_stack((pairs['i'], pairs['j'])).astype(np.int64)
+        pairs = pairs[targets[pairs[:, 0]] != pairs[:, 1]]
+    atom_i = targets[pairs[:, 0]]
+    dist = np.linalg.norm(coords[atom_i] - coords[pairs[:, 1]], axis=1)
+    pairs = pairs[dist < expanded[atom_i] + expanded[pairs[:, 1]]]
+    return pairs[np.argsort(pairs[:, 0], kind='stable')]
+
+
+def residue_sasa(structure, atom_sasa):
+    """
+    Sum atom SASA into residues
+
+    Parameters
+    ----------
+    structure : Structure
+    atom_sasa : np.ndarray
+        Output of shrake_rupley() for the atoms of structure
+
+    Returns
+    -------
+    result : dict
+        'RES_NUM_CHAIN' label -> SASA
+    """
+    index, labels = structure.residue_index()
+    totals = np.bincount(index, weights=atom_sasa, minlength=len(labels))
+    return dict(zip(labels, totals.tolist()))
+
+
+def structure_sasa(structure, n_points=N_POINTS, probe=PROBE):
+    """
+    Per-residue SASA of a Structure
+
+    Parameters
+    ----------
+    structure : Structure
+    n_points : int
+    probe : float
+
+    Returns
+    -------
+    result : dict
+        'RES_NUM_CHAIN' label -> SASA
+    """
+    return residue_sasa(structure, shrake_rupley(structure.coords, structure.radii(), n_points, probe))
+
+
+def interface_sasa(structure, tcr_chains, pmhc_chains, n_points=N_POINTS, probe=PROBE):
+    """
+    Calculate the SASA of the TCR-pMHC complex and of each partner on its own. The partners are the atoms split_tcr()
+    and split_pmhc() would write, taken from the same arrays so no intermediate files are made
+
+    Parameters
+    ----------
+    structure : Structure
+        Primary atoms of the complex, see Structure.primary_mask()
+    tcr_chains : str
+        Alpha and beta chain IDs
+    pmhc_chains : str
+        MHC and peptide chain IDs
+    n_points : int
+    probe : float
+
+    Returns
+    -------
+    result : dict
+        'complex', 'separated' and 'delta' map residue label -> SASA. 'bsa' is the total buried surface area
+    """
+    tcr_mask = structure.chain_mask(tcr_chains)
+    pmhc_mask = structure.chain_mask(pmhc_chains)
+    complex_ = structure.select(tcr_mask | pmhc_mask)
+    radii = complex_.radii()
+    complex_atoms = shrake_rupley(complex_.coords, radii, n_points, probe)
+    # Only atoms within reach of the other partner change when the complex is pulled apart
+    separated_atoms = complex_atoms.copy()
+    tcr_part = complex_.chain_mask(tcr_chains)
+    reach = 2 * (radii.max() + probe)
+    for part in (tcr_part, ~tcr_part):
+        own = np.flatnonzero(part)
+        other = cKDTree(complex_.coords[~part])
+        near = own[np.asarray(other.query(complex_.coords[own], distance_upper_bound=reach)[0]) < reach]
+        position = np.searchsorted(own, near)
+        separated_atoms[near] = shrake_rupley(complex_.coords[own], radii[own], n_points, probe, position)
+    complex_res = residue_sasa(complex_, complex_atoms)
+    separated_res = residue_sasa(complex_, separated_atoms)
+    delta = {label: separated_res[label] - complex_res[label] for label in complex_res}
+    return {'complex': complex_res, 'separated': separated_res, 'delta': delta,
+            'bsa': float(separated_atoms.sum() - complex_atoms.sum())}
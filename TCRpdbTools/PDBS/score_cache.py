@@ -0,0 +1,197 @@
+#!/usr/bin/python3
+
+######################################################################
+# score_cache.py -- A component of TRain                             #
+# Copyright: Austin Seamann, Dario Ghersi, and Ryan Ehrlich          #
+# Goal: Persistent cache of alignment scores against the reference   #
+#       chains, shared by every process (CLI runs and web workers)   #
+#       through one SQLite file in WAL mode.                         #
+######################################################################
+
+
+import hashlib
+import os
+import sqlite3
+import time
+
+#################
+#     Global    #
+#################
+CACHE_FILE = os.environ.get("TRAIN_SCORE_CACHE",
+                            os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "train",
+                                         "score_cache.sqlite"))
+MAX_ENTRIES = 200000  # Oldest entries are evicted past this size
+EVICT_FRACTION = 0.1  # Share of MAX_ENTRIES removed at once when full
+TIMEOUT = 30.0  # Seconds to wait on a locked database
+MEMORY_ENTRIES = 10000  # Scores also kept in memory by each process
+
+
+#################
+#    Methods    #
+#################
+def sequence_key(seq, reference, params):
+    """
+    Key of one score: hash of the sequence, the reference and the scoring parameters
+
+    Parameters
+    ----------
+    seq : str
+    reference : str
+        Reference ID, ex. 'B2M:<hash of reference sequence>'
+    params : str
+        Description of the aligner settings
+
+    Returns
+    -------
+    key : str
+    """
+    return hashlib.sha1(("%s|%s|%s" % (seq, reference, params)).encode()).hexdigest()
+
+
+class ScoreCache:
+    """
+    Alignment scores in a SQLite file. Readers and writers in other processes are safe (WAL journal), the file is
+    kept to max_entries by evicting the least recently written scores. Each process opens its own connection, so a
+    cache made before a fork is reopened in the child
+    """
+    def __init__(self, file_name=CACHE_FILE, max_entries=MAX_ENTRIES):
+        """
+        Initialize ScoreCache
+
+        Parameters
+        ----------
+        file_name : str
+            SQLite file, created when missing
+        max_entries : int
+        """
+        self.file_name = file_name
+        self.max_entries = max_entries
+        self.memory = {}
+        self._connection = None
+        self._pid = None
+
+    def connection(self):
+        """
+        Returns this process's connection, None when the file can not be opened (scores are then only kept in memory)
+        """
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(self.file_name)), exist_ok=True)
+                self._connection = sqlite3.connect(self.file_name, timeout=TIMEOUT, isolation_level=None)
+                self._connection.execute("PRAGMA journal_mode=WAL")
+                self._connection.execute("PRAGMA synchronous=NORMAL")
+                self._connection.execute("CREATE TABLE IF NOT EXISTS scores (key TEXT PRIMARY KEY, score REAL NOT NULL,"
+                                         " written REAL NOT NULL)")
+                self._connection.execute("CREATE INDEX IF NOT EXISTS scores_written ON scores (written)")
+            except (sqlite3.Error, OSError):
+                self._connection = None
+        return self._connection
+
+    def get_many(self, keys):
+        """
+        Returns the cached scores of keys
+
+        Parameters
+        ----------
+        keys : list
+
+        Returns
+        -------
+        scores : dict
+            key -> score for the keys found
+        """
+        found = {key: self.memory[key] for key in keys if key in self.memory}
+        missing = [key for key in keys if key not in found]
+        connection = self.connection()
+        if missing and connection is not None:
+            try:
+                for start in range(0, len(missing), 500):
+                    chunk = missing[start:start + 500]
+                    rows = connection.execute("SELECT key, score FROM scores WHERE key IN (%s)"
+                                              % ",".join("?" * len(chunk)), chunk).fetchall()
+                    found.update(rows)
+            except sqlite3.Error:
+                pass
+            self._remember(found)
+        return found
+
+    def put_many(self, scores):
+        """
+        Store scores, evicting the oldest entries when the cache is full
+
+        Parameters
+        ----------
+        scores : dict
+            key -> score
+        """
+        if not scores:
+            return
+        self._remember(scores)
+        connection = self.connection()
+        if connection is None:
+            return
+        now = time.time()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            connection.executemany("INSERT OR REPLACE INTO scores (key, score, written) VALUES (?, ?, ?)",
+                                   [(key, float(score), now) for key, score in scores.items()])
+            count = connection.execute("SELECT COUNT(*) FROM scores").fetchone()[0]
+            if count > self.max_entries:
+                remove = count - self.max_entries + int(self.max_entries * EVICT_FRACTION)
+                connection.execute("DELETE FROM scores WHERE key IN (SELECT key FROM scores ORDER BY written LIMIT ?)",
+                                   (remove,))
+            connection.execute("COMMIT")
+        except sqlite3.Error:
+            try:
+                connection.execute("ROLLBACK")
+            except sqlite3.Error:
+                pass
+
+    def _remember(self, scores):
+        if len(self.memory) + len(scores) > MEMORY_ENTRIES:
+            self.memory.clear()
+        self.memory.update(scores)
+
+    def scores(self, pairs, reference_ids, params, score_function):
+        """
+        Scores of (sequence, reference) pairs, only the pairs missing from the cache are aligned
+
+        Parameters
+        ----------
+        pairs : list
+            (sequence, reference sequence)
+        reference_ids : list
+            ID of each reference sequence, same order as pairs
+        params : str
+            Description of the aligner settings
+        score_function : function
+            (sequence, reference sequence) -> score
+
+        Returns
+        -------
+        scores : list
+            Same order as pairs
+        """
+        keys = [sequence_key(seq, reference_id, params) for (seq, ref), reference_id in zip(pairs, reference_ids)]
+        found = self.get_many(list(dict.fromkeys(keys)))
+        new = {}
+        for key, (seq, ref) in zip(keys, pairs):
+            if key not in found and key not in new:
+                new[key] = float(score_function(seq, ref))
+        self.put_many(new)
+        found.update(new)
+        return [found[key] for key in keys]
+
+
+_CACHE = None
+
+
+def get_cache():
+    """
+    Returns the ScoreCache of this process, shared by every caller
+    """
+    global _CACHE
+    if _CACHE is None:
+        _CACHE = ScoreCache()
+    return _CACHE
@@ -0,0 +1,407 @@
+#!/usr/bin/python3
+
+######################################################################
+# selection.py -- A component of TRain                              #
+# Copyright: Austin Seamann, Dario Ghersi, and Ryan Ehrlich          #
+# Goal: Small selection language compiled to NumPy boolean masks     #
+#       over the atom arrays of a Structure, ex.                     #
+#           chain D and resi 1-10,95- and not name H*                #
+#           cdr3b and name CA                                        #
+#           alpha or beta and altloc A,' '                           #
+######################################################################
+
+
+import re
+from fnmatch import fnmatchcase
+from functools import lru_cache
+import numpy as np
+try:  # Imported as part of the web app
+    from PDBS.structure import THREE_TO_ONE
+    from PDBS import complexes, germline
+except ImportError:  # Ran as a script from within PDBS/
+    from structure import THREE_TO_ONE
+    import complexes
+    import germline
+
+#################
+#     Global    #
+#################
+# Keyword -> Structure field compared against the listed values
+FIELDS = {'chain': 'chain_id', 'name': 'atom_id', 'resn': 'atom_comp_id', 'altloc': 'alt_loc',
+          'icode': 'icode', 'element': 'atom_type', 'record': 'record'}
+# Keywords that need no values
+FLAGS = {
+    'all': lambda table: np.ones(len(table), dtype=bool),
+    'none': lambda table: np.zeros(len(table), dtype=bool),
+    'backbone': lambda table: np.isin(table.atom_id, ('N', 'CA', 'C', 'O')),
+    'hydrogen': lambda table: table.atom_type == 'H',
+}
+# Chain role keywords -> role of find_complexes() / tcr_chains()
+ROLES = {'alpha': 'ALPHA', 'beta': 'BETA', 'mhc': 'MHC', 'b2m': 'B2M', 'peptide': 'PEPTIDE'}
+# Loop keywords -> (chain role, germline loop name)
+LOOPS = {'cdr%s%s' % (loop.replace('.', '').lower()[3:], role[0].lower()): (role, loop)
+         for role in ('ALPHA', 'BETA') for loop in ('CDR1', 'CDR2', 'CDR2.5', 'CDR3')}
+KEYWORDS = set(FIELDS) | set(FLAGS) | set(ROLES) | set(LOOPS) | {'resi', 'tcr', 'and', 'or', 'not'}
+# Commas and blanks both separate values
+TOKEN = re.compile(r"[\s,]*(?:(\()|(\))|'([^']*)'|\"([^\"]*)\"|([^\s(),]+))")
+RANGE = re.compile(r"^(-?\d+)?([-:])(-?\d+)?$")
+MAX_MASKS = 64  # Masks kept per structure
+
+
+#################
+#    Methods    #
+#################
+def tokenize(text):
+    """
+    Split a selection into words, parentheses and quoted values (quotes keep blanks, ex. altloc ' ')
+    """
+    tokens, pos = [], 0
+    text = text.strip(' \t\n,')
+    while pos < len(text):
+        match = TOKEN.match(text, pos)
+        if match is None:
+            raise ValueError("Can not read selection %r at %r" % (text, text[pos:]))
+        pos = match.end()
+        opened, closed, single, double, word = match.groups()
+        if opened or closed:
+            tokens.append(opened or closed)
+        elif word is not None:
+            tokens.append(word)
+        else:  # Quoted value, never a keyword
+            tokens.append(('quoted', single if single is not None else double))
+    return tokens
+
+
+def residue_ranges(values):
+    """
+    Read residue numbers and ranges: 5, -3, 1-10, 95- (to the end), :10 (from the start) or 1:10 (needed for
+    negative numbers, ex. -5:-1)
+
+    Returns
+    -------
+    ranges : list
+        (first, last), None for an open end
+    """
+    ranges = []
+    for value in values:
+        if re.match(r"^-?\d+$", value):
+            ranges.append((int(value), int(value)))
+            continue
+        match = RANGE.match(value)
+        if match is None or (match.group(1) is None and match.group(3) is None):
+            raise ValueError("Not a residue range: %r" % value)
+        ranges.append((None if match.group(1) is None else int(match.group(1)),
+                       None if match.group(3) is None else int(match.group(3))))
+    return ranges
+
+
+def range_mask(comp_num, ranges):
+    """
+    Mask of residue numbers inside any of (first, last) ranges, None for an open end
+    """
+    mask = np.zeros(len(comp_num), dtype=bool)
+    for first, last in ranges:
+        inside = np.ones(len(comp_num), dtype=bool)
+        if first is not None:
+            inside &= comp_num >= first
+        if last is not None:
+            inside &= comp_num <= last
+        mask |= inside
+    return mask
+
+
+def field_mask(column, values):
+    """
+    Mask of a text column matching any value, values with * or ? are wildcards (ex. name H*)
+    """
+    plain = [value for value in values if '*' not in value and '?' not in value]
+    mask = np.isin(column, plain)
+    for pattern in values:
+        if pattern not in plain:
+            unique = np.unique(column)
+            mask |= np.isin(column, [value for value in unique if fnmatchcase(str(value), pattern)])
+    return mask
+
+
+@lru_cache(maxsize=256)
+def compile_selection(text):
+    """
+    Compile a selection into a function of (table, context) returning the mask of the selected atoms. Precedence,
+    highest first: not, and, or. Parentheses group
+
+    Terms:
+        chain D,E  resi 1-10,20,95-  name CA,C*  resn GLY  altloc A  icode A  element C  record ATOM
+        all  none  backbone  hydrogen
+        alpha  beta  tcr  mhc  b2m  peptide            (chain roles, need a context)
+        cdr1a cdr2a cdr25a cdr3a cdr1b cdr2b cdr25b cdr3b  (loops, need a context)
+
+    Parameters
+    ----------
+    text : str
+
+    Returns
+    -------
+    mask : function
+        (table, context) -> np.ndarray of bool, table is a Structure and context a Context of the same structure.
+        Its needs_context attribute tells if the selection uses chain roles or loops
+    """
+    tokens = tokenize(text)
+    pos = [0]
+    uses_roles = []
+
+    def peek():
+        return tokens[pos[0]] if pos[0] < len(tokens) else None
+
+    def take():
+        pos[0] += 1
+        return tokens[pos[0] - 1]
+
+    def values():
+        found = []
+        while peek() is not None and peek() not in ('(', ')') and \
+                (isinstance(peek(), tuple) or peek().lower() not in KEYWORDS):
+            found.append(take())
+        if not found:
+            raise ValueError("Selection %r: missing values after %r" % (text, tokens[pos[0] - 1]))
+        return [value[1] if isinstance(value, tuple) else value for value in found]
+
+    def term():
+        token = take() if peek() is not None else None
+        if token is None or isinstance(token, tuple):
+            raise ValueError("Selection %r: expected a keyword, found %r" % (text, token))
+        if token == '(':
+            inner = either()
+            if peek() != ')':
+                raise ValueError("Selection %r: missing )" % text)
+            take()
+            return inner
+        word = token.lower()
+        if word == 'not':
+            inner = term()
+            return lambda table, context: ~inner(table, context)
+        if word in FIELDS:
+            field, wanted = FIELDS[word], values()
+            if field == 'atom_type':
+                wanted = [value.upper() for value in wanted]
+            return lambda table, context: field_mask(getattr(table, field), wanted)
+        if word == 'resi':
+            ranges = residue_ranges(values())
+            return lambda table, context: range_mask(table.comp_num, ranges)
+        if word in FLAGS:
+            return lambda table, context: FLAGS[word](table)
+        if word in ROLES or word == 'tcr' or word in LOOPS:
+            uses_roles.append(word)
+        if word in ROLES or word == 'tcr':
+            roles = ('ALPHA', 'BETA') if word == 'tcr' else (ROLES[word],)
+            return lambda table, context: np.isin(table.chain_id, needs(context).chains(roles))
+        if word in LOOPS:
+            role, loop = LOOPS[word]
+            return lambda table, context: needs(context).loop_mask(table, role, loop)
+        raise ValueError("Selection %r: unknown keyword %r" % (text, token))
+
+    def both():
+        mask = term()
+        while peek() is not None and not isinstance(peek(), tuple) and peek().lower() == 'and':
+            take()
+            left, right = mask, term()
+            mask = (lambda a, b: lambda table, context: a(table, context) & b(table, context))(left, right)
+        return mask
+
+    def either():
+        mask = both()
+        while peek() is not None and not isinstance(peek(), tuple) and peek().lower() == 'or':
+            take()
+            left, right = mask, both()
+            mask = (lambda a, b: lambda table, context: a(table, context) | b(table, context))(left, right)
+        return mask
+
+    if not tokens:
+        raise ValueError("Empty selection")
+    compiled = either()
+    if peek() is not None:
+        raise ValueError("Selection %r: unexpected %r" % (text, peek()))
+    compiled.needs_context = bool(uses_roles)
+    return compiled
+
+
+def needs(context):
+    # Role and loop keywords are only known for a parsed structure
+    if context is None:
+        raise ValueError("Chain role and loop selections need the structure, ex. PdbTools3.select_atoms()")
+    return context
+
+
+def select_mask(table, text, context=None):
+    """
+    Mask of the atoms of table matched by a selection. Masks are cached on the table, so the same selection of the
+    same structure is only evaluated once
+
+    Parameters
+    ----------
+    table : Structure
+        Parsed structure or structure.line_columns() of PDB lines
+    text : str
+        Selection, see compile_selection()
+    context : Context
+        Chain roles and loops for role and loop keywords, optional otherwise
+
+    Returns
+    -------
+    mask : np.ndarray
+        Read only
+    """
+    key = (text, context)
+    mask = table._masks.get(key)
+    if mask is None:
+        mask = compile_selection(text)(table, context)
+        mask.setflags(write=False)
+        if len(table._masks) >= MAX_MASKS:
+            table._masks.clear()
+        table._masks[key] = mask
+    return mask
+
+
+class Context:
+    """
+    Chain roles and CDR loops of a structure, found the first time a selection asks for them
+    """
+    def __init__(self, structure):
+        """
+        Initialize Context
+
+        Parameters
+        ----------
+        structure : Structure
+        """
+        self.structure = structure
+        self._atoms = None
+        self._assemblies = None
+        self._roles = None
+        self._loops = {}
+
+    def atoms(self):
+        """
+        Returns the ATOM records of the structure, roles and loops are only found on these
+        """
+        if self._atoms is None:
+            self._atoms = self.structure.select(self.structure.record == 'ATOM')
+        return self._atoms
+
+    def assemblies(self):
+        """
+        Returns the TCR-pMHC assemblies of the structure, see complexes.find_complexes(). When none is complete one
+        partial assembly is made of the TCR of tcr_chains() and the chains classified MHC, B2M or PEPTIDE
+        """
+        if self._assemblies is None:
+            sequences = self.atoms().chain_sequences()
+            assemblies = []
+            if sequences:
+                scores = complexes.role_scores(sequences)
+                assemblies = complexes.find_complexes(self.atoms(), scores)
+                if not assemblies:
+                    classes = complexes.classify_chains(sequences, scores)
+                    assemblies = [{role: chain for chain, role in classes.items() if role in ROLES.values()}]
+                    if 'TCR' in classes.values():
+                        assemblies[0].update(complexes.tcr_chains(self.atoms(), scores))
+            self._assemblies = assemblies
+        return self._assemblies
+
+    def roles(self):
+        """
+        Returns role -> list of chain IDs over every assembly, the second chain of class II MHC counts as MHC
+        """
+        if self._roles is None:
+            roles = {role: [] for role in ROLES.values()}
+            for assembly in self.assemblies():
+                for role in roles:
+                    if assembly.get(role) and assembly[role] not in roles[role]:
+                        roles[role].append(assembly[role])
+                if assembly.get('MHC2'):
+                    roles['MHC'].append(assembly['MHC2'])
+            self._roles = roles
+        return self._roles
+
+    def chains(self, roles):
+        """
+        Returns the chain IDs of the given roles
+        """
+        return [chain for role in roles for chain in self.roles()[role]]
+
+    def loops(self, role):
+        """
+        Returns loop name -> list of (chain, first residue number, last residue number) on the chains of a role.
+        Uses the germline index, without it only CDR3 is found (by motif)
+        """
+        if role not in self._loops:
+            loops = {}
+            for chain in self.roles()[role]:
+                try:
+                    result = germline.annotate_chain(self.atoms(), chain, germline.GENE_TYPES[role])
+                except FileNotFoundError:
+                    result = {'CDR3': motif_loop(self.atoms(), chain)}
+                for name in list(germline.LOOPS) + ['CDR3']:
+                    if result.get(name) and result[name][0]:
+                        loops.setdefault(name, []).append((chain, result[name][1], result[name][2]))
+            self._loops[role] = loops
+        return self._loops[role]
+
+    def relabeled(self, labels):
+        """
+        Returns a Context of the same structure with chains renamed, ex. {'A': 'D'}. Roles and loops are still found
+        on the original structure and only when first needed
+        """
+        return RelabeledContext(self, labels)
+
+    def loop_mask(self, table, role, loop):
+        """
+        Mask of the atoms of table on one loop of every chain of a role
+        """
+        mask = np.zeros(len(table), dtype=bool)
+        for chain, first, last in self.loops(role).get(loop, []):
+            mask |= (table.chain_id == chain) & range_mask(table.comp_num, [(first, last)])
+        return mask
+
+
+class RelabeledContext(Context):
+    """
+    Context whose chain IDs are renamed, see Context.relabeled()
+    """
+    def __init__(self, context, labels):
+        """
+        Initialize RelabeledContext
+
+        Parameters
+        ----------
+        context : Context
+        labels : dict
+            Original chain ID -> new chain ID
+        """
+        Context.__init__(self, context.structure)
+        self.original = context
+        self.labels = dict(labels)
+
+    def assemblies(self):
+        return [{role: self.labels.get(chain, chain) for role, chain in assembly.items()}
+                for assembly in self.original.assemblies()]
+
+    def roles(self):
+        return {role: [self.labels.get(chain, chain) for chain in chains]
+                for role, chains in self.original.roles().items()}
+
+    def loops(self, role):
+        return {name: [(self.labels.get(chain, chain), first, last) for chain, first, last in ranges]
+                for name, ranges in self.original.loops(role).items()}
+
+
+def motif_loop(structure, chain):
+    """
+    CDR3 of a chain found by motif, as [loop, first residue number, last residue number]
+    """
+    atoms = structure.select(structure.chain_id == chain)
+    residue, labels = atoms.residue_index()
+    first = np.flatnonzero(np.r_[True, residue[1:] != residue[:-1]]) if len(atoms) else np.zeros(0, dtype=np.int64)
+    seq = ''.join(THREE_TO_ONE.get(atoms.atom_comp_id[pos], 'X') for pos in first)
+    loop, start, end = germline.motif_cdr3(seq)
+    if not loop:
+        return [loop, None, None]
+    return [loop, int(atoms.comp_num[first[start]]), int(atoms.comp_num[first[end - 1]])]
@@ -0,0 +1,162 @@
+#!/usr/bin/python3
+
+######################################################################
+# single_flight.py -- A component of TRain                           #
+# Copyright: Austin Seamann, Dario Ghersi, and Ryan Ehrlich          #
+# Goal: Coalesce identical work across threads and worker processes. #
+#       The first caller of a key computes the result file while     #
+#       later callers wait on a lock file and share what it stored.  #
+######################################################################
+
+
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import time
+
+#################
+#     Global    #
+#################
+FLIGHT_DIR = os.environ.get("TRAIN_FLIGHT_DIR",
+                            os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "train",
+                                         "flights"))
+RESULT_TTL = 300  # Seconds a stored result is handed out before it is computed again
+GRACE = 60  # Seconds an outdated result is kept for callers that were just handed it
+PRUNE_INTERVAL = 600  # Seconds between prunes of every key
+LOCK = "lock"  # Lock file in the directory of a key, next to its result directories
+PRUNED = ".pruned"  # File in the flight directory whose modification time is the last prune
+
+
+#################
+#    Methods    #
+#################
+def flight_key(*parts):
+    """
+    Returns a file name safe key of JSON serializable parts, ex. flight_key("process", "1ao7", ["center"])
+    """
+    return hashlib.sha1(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+
+def stored_results(key_dir):
+    """
+    Returns the result directories of a key, newest first, as (time the result expires, directory)
+    """
+    found = []
+    for name in os.listdir(key_dir):
+        if name.isdigit() and os.path.isdir(os.path.join(key_dir, name)):
+            found.append((int(name) / 1e9, os.path.join(key_dir, name)))
+    return sorted(found, reverse=True)
+
+
+def drop_expired(results, now):
+    """
+    Remove result directories expired for longer than GRACE, returns the ones kept
+    """
+    kept = []
+    for expires, directory in results:
+        if expires < now - GRACE:
+            shutil.rmtree(directory, ignore_errors=True)
+        else:
+            kept.append((expires, directory))
+    return kept
+
+
+def prune(flight_dir=FLIGHT_DIR):
+    """
+    Remove the expired results of every key. Keys being computed are skipped, keys left without results lose their
+    directory. A caller opening the lock of a key just removed computes it again, which only repeats work
+
+    Returns
+    -------
+    removed : int
+        Key directories removed
+    """
+    removed = 0
+    now = time.time()
+    try:
+        keys = list(os.scandir(flight_dir))
+    except OSError:
+        return 0
+    for entry in keys:
+        if not entry.is_dir():
+            continue
+        try:
+            with open(os.path.join(entry.path, LOCK), "a") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                try:
+                    if not drop_expired(stored_results(entry.path), now):
+                        shutil.rmtree(entry.path, ignore_errors=True)
+                        removed += 1
+                finally:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+        except OSError:  # Held by a caller, or removed by another prune
+            continue
+    return removed
+
+
+def prune_due(flight_dir, interval=PRUNE_INTERVAL):
+    """
+    Whether every key is due a prune, the first caller past the interval claims it
+    """
+    marker = os.path.join(flight_dir, PRUNED)
+    try:
+        if os.stat(marker).st_mtime >= time.time() - interval:
+            return False
+    except FileNotFoundError:
+        pass
+    with open(marker, "a"):
+        os.utime(marker)
+    return True
+
+
+def shared(key, compute, ttl=RESULT_TTL, flight_dir=FLIGHT_DIR):
+    """
+    Run compute() once for every caller of the same key in a ttl window. Callers hold an exclusive lock on
+    <flight_dir>/<key>/lock while they look for a stored result or compute one, so concurrent callers in any process
+    wait for the first one and then receive its result. A failed compute() stores nothing, the next waiting caller
+    tries again. Only the directory of the key is listed, every PRUNE_INTERVAL one caller prunes all keys
+
+    Parameters
+    ----------
+    key : str
+        See flight_key()
+    compute : function
+        Takes no arguments and returns the path of the result file
+    ttl : int
+        Seconds a stored result is shared
+    flight_dir : str
+        Directory of lock files and stored results, shared by every worker process. Created when missing
+
+    Returns
+    -------
+    result : str
+        Path of the stored copy of the result file, it keeps the file name compute() gave it
+    """
+    key_dir = os.path.join(flight_dir, key)
+    while True:
+        os.makedirs(key_dir, exist_ok=True)
+        try:
+            lock = open(os.path.join(key_dir, LOCK), "a")
+            break
+        except FileNotFoundError:  # Key removed by a prune in between, make it again
+            continue
+    with lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            results = drop_expired(stored_results(key_dir), time.time())
+            if results and results[0][0] >= time.time():
+                names = os.listdir(results[0][1])
+                if names:
+                    return os.path.join(results[0][1], names[0])
+            result = compute()
+            directory = os.path.join(key_dir, "%d" % (time.time_ns() + int(ttl * 1e9)))  # Named by expiry
+            os.makedirs(directory + ".tmp")
+            shutil.copyfile(result, os.path.join(directory + ".tmp", os.path.basename(result)))
+            os.rename(directory + ".tmp", directory)
+            return os.path.join(directory, os.path.basename(result))
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+            if prune_due(flight_dir):
+                prune(flight_dir)
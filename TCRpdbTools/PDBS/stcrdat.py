@@ -0,0 +1,456 @@
+#!/usr/bin/python3
+
+######################################################################
+# stcrdat.py -- A component of TRain                                 #
+# Copyright: Austin Seamann, Dario Ghersi, and Ryan Ehrlich          #
+# Goal: Column oriented in memory index of the STCRDat summary TSV.  #
+#       Compiled once into a memory mapped snapshot, it answers      #
+#       filtered, prefix searched, sorted and paginated queries of   #
+#       the PDB metadata with NumPy masks.                           #
+######################################################################
+
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import time
+from functools import lru_cache
+import numpy as np
+
+#################
+#     Global    #
+#################
+SUMMARY_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "api")
+SUMMARY_ENDING = "_summary.tsv"
+NUMERIC = ('model', 'docking_angle', 'resolution', 'r_free', 'r_factor', 'affinity', 'affinity_temperature')
+RANGED = NUMERIC + ('date', 'copies')  # Columns filtered with 'low:high' ranges
+MISSING = ('', 'NA')  # Summary values of unknown entries
+SEPARATORS = (' , ', ', ', ',', ' | ')  # Between the values of multi valued cells, ex. 'mus musculus, homo sapiens'
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+MAGIC = b"TRSTCRDT"  # First bytes of every snapshot
+SNAPSHOT_VERSION = 1  # Bumped when the index layout changes, snapshots are then compiled again
+ALIGN = 64  # Columns start on multiples of this many bytes
+SWAP_CHECK = 5  # Seconds between looks for a newer summary
+DATE_FILTER = re.compile(r'\d{4}(-\d{2}(-\d{2})?)?$')  # YYYY, YYYY-MM or YYYY-MM-DD
+
+_latest = (0, None)  # (time looked, newest summary) of load_summary()
+
+
+#################
+#    Methods    #
+#################
+def iso_date(date):
+    """
+    Returns an mm/dd/yy summary date as YYYY-MM-DD so dates sort as text, '' when missing
+    """
+    parts = date.split('/')
+    if len(parts) != 3 or not all(part.isdigit() for part in parts):
+        return ''
+    year = int(parts[2])
+    if year < 100:
+        year += 1900 if year > 70 else 2000
+    return "%04d-%02d-%02d" % (year, int(parts[0]), int(parts[1]))
+
+
+def date_bound(value, high):
+    """
+    Returns a YYYY, YYYY-MM or YYYY-MM-DD filter bound as a full date: the first day it covers for a low bound, the
+    last for a high bound (day 31 of any month still compares correctly as text)
+
+    Parameters
+    ----------
+    value : str
+    high : boolean
+
+    Returns
+    -------
+    date : str
+        YYYY-MM-DD
+    """
+    if not DATE_FILTER.match(value):
+        raise ValueError("Bad date '%s', use YYYY, YYYY-MM or YYYY-MM-DD" % value)
+    return value + ('-12-31' if high else '-01-01')[len(value) - 4:]
+
+
+def number(value):
+    """
+    Returns a summary value as a float, NaN when missing
+    """
+    try:
+        return float(value)
+    except ValueError:
+        return np.nan
+
+
+class SummaryIndex:
+    """
+    One row per PDB ID (the first summary row of the ID, 'copies' counts its rows), one NumPy array per column.
+    Numeric columns are float arrays with NaN for missing values, dates are YYYY-MM-DD text and rows are sorted by
+    ID so prefix searches are binary searches
+    """
+    def __init__(self, columns, version):
+        """
+        Initialize SummaryIndex
+
+        Parameters
+        ----------
+        columns : dict
+            Column name -> np.ndarray, 'pdb' holds the sorted IDs
+        version : str
+            Identifies the summary contents, part of every ETag
+        """
+        self.columns = columns
+        self.version = version
+        self.ids = columns['pdb']
+        self._lower = {}  # Lower case text columns, multi valued cells as |value|value|, built when first filtered
+
+    @classmethod
+    def from_tsv(cls, file_name):
+        """
+        Build the index of a summary TSV
+        """
+        with open(file_name, 'rb') as file:
+            content = file.read()
+        lines = content.decode('utf-8').splitlines()
+        names = lines[0].split('\t')
+        first, copies = {}, {}
+        for line in lines[1:]:
+            values = line.split('\t')
+            if not values[0]:
+                continue
+            pdb = values[0].lower()
+            copies[pdb] = copies.get(pdb, 0) + 1
+            first.setdefault(pdb, values + [''] * (len(names) - len(values)))
+        ids = sorted(first)
+        columns = {}
+        for pos, name in enumerate(names):
+            values = [first[pdb][pos] for pdb in ids]
+            if name == 'pdb':
+                columns[name] = np.array(ids, dtype=str)
+            elif name in NUMERIC:
+                columns[name] = np.array([number(value) for value in values], dtype=np.float64)
+            elif name == 'date':
+                columns[name] = np.array([iso_date(value) for value in values], dtype=str)
+            else:
+                columns[name] = np.array(['' if value in MISSING else value for value in values], dtype=str)
+        columns['copies'] = np.array([copies[pdb] for pdb in ids], dtype=np.int64)
+        return cls(columns, hashlib.sha1(content).hexdigest())
+
+    def __len__(self):
+        return len(self.ids)
+
+    def lower(self, name):
+        """
+        Returns a text column in lower case with every value wrapped as |value| for whole value matches
+        """
+        if name not in self._lower:
+            values = np.char.lower(self.columns[name])
+            for separator in SEPARATORS:
+                values = np.char.replace(values, separator, '|')
+            self._lower[name] = np.char.add(np.char.add('|', values), '|')
+        return self._lower[name]
+
+    def column_mask(self, name, value):
+        """
+        Mask of the rows whose column matches a filter value. Several accepted values are separated by commas, a
+        multi valued cell matches when any of its values is accepted (case ignored). Numeric and date columns also
+        take inclusive 'low:high' ranges, either end left open. Dates may be partial, '2010' is the whole year and
+        '2010-03:2012' runs from March 2010 through 2012
+
+        Parameters
+        ----------
+        name : str
+        value : str
+
+        Returns
+        -------
+        mask : np.ndarray
+        """
+        if name not in self.columns:
+            raise ValueError("Unknown column '%s'" % name)
+        column = self.columns[name]
+        mask = np.zeros(len(self), dtype=bool)
+        for accepted in str(value).split(','):
+            accepted = accepted.strip()
+            if name in RANGED:
+                low, colon, high = accepted.partition(':')
+                if not colon:
+                    high = low
+                match = np.ones(len(self), dtype=bool)
+                if name == 'date':
+                    if low:
+                        match &= column >= date_bound(low, False)
+                    if high:
+                        match &= column <= date_bound(high, True)
+                    match &= column != ''
+                else:
+                    try:
+                        if low:
+                            match &= column >= float(low)
+                        if high:
+                            match &= column <= float(high)
+                    except ValueError:
+                        raise ValueError("Bad %s filter '%s', use a value or low:high" % (name, accepted))
+                mask |= match
+            else:
+                mask |= np.char.find(self.lower(name), '|' + accepted.lower() + '|') >= 0
+        return mask
+
+    def prefix_rows(self, prefix):
+        """
+        Returns the rows (a slice) of the IDs starting with a prefix
+        """
+        prefix = prefix.lower()
+        start = int(np.searchsorted(self.ids, prefix, side='left'))
+        end = int(np.searchsorted(self.ids, prefix + '\uffff', side='left'))
+        return slice(start, end)
+
+    def match(self, filters=None, search=None):
+        """
+        Rows matching every filter and the ID prefix search, in ID order
+
+        Parameters
+        ----------
+        filters : dict
+            Column -> filter value, see column_mask()
+        search : str
+            ID prefix
+
+        Returns
+        -------
+        rows : np.ndarray
+        """
+        mask = np.zeros(len(self), dtype=bool)
+        mask[self.prefix_rows(search or '')] = True
+        for name, value in (filters or {}).items():
+            mask &= self.column_mask(name, value)
+        return np.flatnonzero(mask)
+
+    def sort_rows(self, rows, sort):
+        """
+        Order rows by a column, '-column' for descending. Missing values go last either way and ties keep ID order
+        """
+        descending = sort.startswith('-')
+        name = sort.lstrip('-')
+        if name not in self.columns:
+            raise ValueError("Unknown sort column '%s'" % name)
+        values = self.columns[name][rows]
+        missing = np.isnan(values) if values.dtype.kind == 'f' else values == ''
+        rank = np.unique(values, return_inverse=True)[1].reshape(-1)
+        key = np.where(missing, len(rows) + 1, -rank if descending else rank)
+        return rows[np.argsort(key, kind='stable')]
+
+    def records(self, rows, fields=None):
+        """
+        Returns rows as dictionaries of plain values, missing values as None
+        """
+        names = list(fields) if fields else list(self.columns)
+        unknown = [name for name in names if name not in self.columns]
+        if unknown:
+            raise ValueError("Unknown column(s): " + ", ".join(unknown))
+        lists = {}
+        for name in names:
+            values = self.columns[name][rows]
+            if values.dtype.kind == 'f':
+                lists[name] = [None if np.isnan(value) else value for value in values.tolist()]
+            elif values.dtype.kind == 'U':
+                lists[name] = [value or None for value in values.tolist()]
+            else:
+                lists[name] = values.tolist()
+        return [{name: lists[name][pos] for name in names} for pos in range(len(rows))]
+
+    def etag(self, **query):
+        """
+        Returns the ETag of a query result: the summary version and the query, so equal queries of the same
+        summary share a tag without building the result
+        """
+        return '"%s"' % hashlib.sha1((self.version + json.dumps(query, sort_keys=True, default=str)).encode())\
+            .hexdigest()[:32]
+
+    def query(self, filters=None, search=None, sort='pdb', page=1, size=PAGE_SIZE, fields=None):
+        """
+        Filter, search, sort and paginate the index
+
+        Parameters
+        ----------
+        filters : dict
+            See column_mask()
+        search : str
+            ID prefix
+        sort : str
+            Column, '-column' for descending
+        page : int
+            Starting at 1
+        size : int
+            Rows per page, at most MAX_PAGE_SIZE
+        fields : list
+            Columns returned, all by default
+
+        Returns
+        -------
+        result : dict
+            'count' matching rows, 'page', 'size', 'pages' and 'results' (records())
+        """
+        page, size = int(page), int(size)
+        if page < 1 or not 0 < size <= MAX_PAGE_SIZE:
+            raise ValueError("page starts at 1 and size is 1 to %d" % MAX_PAGE_SIZE)
+        rows = self.match(filters, search)
+        if sort and sort != 'pdb':
+            rows = self.sort_rows(rows, sort)
+        pages = -(-len(rows) // size)
+        return {'count': len(rows), 'page': page, 'size': size, 'pages': pages,
+                'results': self.records(rows[(page - 1) * size:page * size], fields)}
+
+    def ids_matching(self, filters=None, search=None):
+        """
+        Returns the IDs matching filters and an ID prefix, see match()
+        """
+        return self.ids[self.match(filters, search)].tolist()
+
+
+def snapshot_file(summary):
+    """
+    Returns where the snapshot of a summary TSV is kept: next to it, named after it and SNAPSHOT_VERSION
+    """
+    return "%s.v%d.snapshot" % (summary[:-len('.tsv')] if summary.endswith('.tsv') else summary, SNAPSHOT_VERSION)
+
+
+def write_snapshot(file_name, index):
+    """
+    Write an index as one binary file: MAGIC, the length of a JSON description, the description (version, summary
+    hash, column types, shapes and offsets) and every column aligned to ALIGN bytes. Written to a temporary file
+    first so readers never see half a file
+
+    Parameters
+    ----------
+    file_name : str
+    index : SummaryIndex
+    """
+    columns, offset = {}, 0
+    for name, column in index.columns.items():
+        columns[name] = {'dtype': column.dtype.str, 'shape': list(column.shape), 'offset': offset}
+        offset += -(-column.nbytes // ALIGN) * ALIGN
+    description = json.dumps({'version': SNAPSHOT_VERSION, 'summary': index.version, 'columns': columns}).encode()
+    start = -(-(len(MAGIC) + 8 + len(description)) // ALIGN) * ALIGN
+    temp = "%s.%d.tmp" % (file_name, os.getpid())
+    with open(temp, 'wb') as file:
+        file.write(MAGIC + len(description).to_bytes(8, 'little') + description)
+        for name, column in index.columns.items():
+            file.seek(start + columns[name]['offset'])
+            file.write(np.ascontiguousarray(column).tobytes())
+        file.truncate(start + offset)
+    os.replace(temp, file_name)
+
+
+def read_snapshot(file_name):
+    """
+    Map a snapshot written by write_snapshot(), columns are read only views of the file so every worker shares the
+    same pages
+    """
+    with open(file_name, 'rb') as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError("%s is not an STCRDat snapshot" % file_name)
+        length = int.from_bytes(file.read(8), 'little')
+        description = json.loads(file.read(length))
+    if description['version'] != SNAPSHOT_VERSION:
+        raise ValueError("%s is snapshot version %d" % (file_name, description['version']))
+    start = -(-(len(MAGIC) + 8 + length) // ALIGN) * ALIGN
+    data = np.memmap(file_name, dtype=np.uint8, mode='r') if os.path.getsize(file_name) > start else None
+    columns = {}
+    for name, spec in description['columns'].items():
+        dtype, shape = np.dtype(spec['dtype']), tuple(spec['shape'])
+        if data is None or 0 in shape or dtype.itemsize == 0:
+            columns[name] = np.zeros(shape, dtype=dtype)
+        else:
+            columns[name] = np.ndarray(shape, dtype=dtype, buffer=data, offset=start + spec['offset'])
+    return SummaryIndex(columns, description['summary'])
+
+
+def compile_snapshot(summary):
+    """
+    Build step: compile a summary TSV into its snapshot, see snapshot_file(). Returns the snapshot location
+    """
+    file_name = snapshot_file(summary)
+    write_snapshot(file_name, SummaryIndex.from_tsv(summary))
+    return file_name
+
+
+def latest_summary(directory=SUMMARY_DIR):
+    """
+    Returns the newest summary TSV of a directory. Summaries are named after their download date
+    (YYYYMMDD_..._summary.tsv), so a newer file dropped in sorts last
+    """
+    summaries = sorted(name for name in os.listdir(directory) if name.endswith(SUMMARY_ENDING))
+    if not summaries:
+        raise FileNotFoundError("No *%s file in %s" % (SUMMARY_ENDING, directory))
+    return os.path.join(directory, summaries[-1])
+
+
+def load_summary(file_name=None):
+    """
+    Returns the SummaryIndex of a summary TSV, by default the newest one of SUMMARY_DIR (looked for at most every
+    SWAP_CHECK seconds). Indexes are mapped from their snapshot, compiled first when it is missing or older than the
+    TSV, and are built again only when the TSV changes on disk. Requests holding the old index keep using it while
+    new calls get the swapped one
+    """
+    global _latest
+    if file_name is None:
+        checked, file_name = _latest
+        if file_name is None or time.time() - checked > SWAP_CHECK:
+            file_name = latest_summary()
+            _latest = (time.time(), file_name)
+    return _load_summary(file_name, os.stat(file_name).st_mtime_ns)
+
+
+@lru_cache(maxsize=2)
+def _load_summary(file_name, mtime):
+    snapshot = snapshot_file(file_name)
+    try:
+        if os.stat(snapshot).st_mtime_ns >= mtime:
+            return read_snapshot(snapshot)
+    except (OSError, ValueError, KeyError):
+        pass
+    try:
+        return read_snapshot(compile_snapshot(file_name))
+    except OSError:  # Read only directory, build the index in memory
+        return SummaryIndex.from_tsv(file_name)
+
+
+####################
+#     Controls     #
+####################
+def parse_args():
+    """
+    Parse the arguments
+    """
+    parser = argparse.ArgumentParser(description="Query the STCRDat summary, ex. stcrdat.py mhc_type=MH1 "
+                                                 "resolution=:2.5 --sort resolution")
+    parser.add_argument("filters", help="column=value filters, see SummaryIndex.column_mask()", nargs='*')
+    parser.add_argument("--summary", help="Summary TSV, the newest in api/ by default", type=str)
+    parser.add_argument("--compile", help="Compile the summary snapshot and exit", action='store_true')
+    parser.add_argument("--search", help="PDB ID prefix", type=str)
+    parser.add_argument("--sort", help="Column, -column for descending", type=str, default='pdb')
+    parser.add_argument("--fields", help="Comma separated columns shown", type=str, default='pdb')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.compile:
+        print(compile_snapshot(args.summary or latest_summary()))
+        return
+    filters = dict(each.split('=', 1) for each in args.filters)
+    index = load_summary(args.summary)
+    fields = args.fields.split(',')
+    rows = index.match(filters, args.search)
+    if args.sort != 'pdb':
+        rows = index.sort_rows(rows, args.sort)
+    for record in index.records(rows, fields):
+        print('\t'.join('NA' if record[name] is None else str(record[name]) for name in fields))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,529 @@
+#!/usr/bin/python3
+
+######################################################################
+# structure.py -- A component of TRain                               #
+# Copyright: Austin Seamann, Dario Ghersi, and Ryan Ehrlich          #
+# Goal: Column oriented, in-memory copy of the atoms in a PDB file   #
+#       so geometric methods can work on NumPy arrays instead of     #
+#       re-reading the text file one line at a time.                 #
+######################################################################
+
+
+import gzip
+import os
+import numpy as np
+
+#################
+#     Global    #
+#################
+# Bondi van der Waals radii (angstroms) by element
+VDW_RADII = {'H': 1.10, 'C': 1.70, 'N': 1.55, 'O': 1.52, 'S': 1.80, 'P': 1.80, 'SE': 1.90, 'F': 1.47, 'CL': 1.75,
+             'BR': 1.85, 'I': 1.98, 'FE': 1.94, 'ZN': 1.39, 'MG': 1.73, 'CA': 1.97, 'NA': 2.27, 'K': 2.75}
+DEFAULT_RADIUS = 1.80
+THREE_TO_ONE = {
+    'ALA': 'A', 'ARG': 'R', 'ASN': 'N', 'ASP': 'D', 'ASX': 'B', 'CYS': 'C', 'GLU': 'E',
+    'GLN': 'Q', 'GLX': 'Z', 'GLY': 'G', 'HIS': 'H', 'ILE': 'I', 'LEU': 'L', 'LYS': 'K',
+    'MET': 'M', 'PHE': 'F', 'PRO': 'P', 'SER': 'S', 'THR': 'T', 'TRP': 'W', 'TYR': 'Y',
+    'VAL': 'V'
+}
+PARSER_VERSION = 1  # Bumped whenever parse_pdb() output changes, invalidates cached structures
+HEADER_END = ('ATOM  ', 'HETATM', 'MODEL ')  # First records after the header section
+GZIP_MAGIC = b'\x1f\x8b'  # First bytes of gzip (and BGZF) files
+COMPRESSED = ('.gz', '.bgz')  # Output names with these endings are written compressed
+PDB_ENDINGS = ('.pdb', '.pdb.gz', '.pdb.bgz')  # Names of PDB files in a library directory
+COMPRESS_LEVEL = 6  # gzip level of compressed output, 1 (fastest) to 9 (smallest)
+
+
+#################
+#    Methods    #
+#################
+class Structure:
+    """
+    Atom records of a PDB file stored as one NumPy array per field. Field names follow the atom dictionaries
+    returned by PdbTools3.get_atoms_on_chain()
+    """
+    FIELDS = ('record', 'atom_num', 'atom_id', 'alt_loc', 'atom_comp_id', 'chain_id', 'comp_num', 'icode',
+              'coords', 'occupancy', 'B_iso_or_equiv', 'atom_type')
+
+    def __init__(self, fields, header=None):
+        """
+        Initialize Structure
+
+        Parameters
+        ----------
+        fields : dict
+            Field name -> NumPy array, see Structure.FIELDS
+        header : list
+            Lines of the PDB file found before the first atom record
+        """
+        for name in self.FIELDS:
+            setattr(self, name, fields[name])
+        self.header = header if header is not None else []
+        self._residue_index = None
+        self._masks = {}  # Selection masks, see selection.select()
+
+    def __len__(self):
+        return len(self.atom_num)
+
+    def get_chains(self):
+        """
+        Returns a list of all chains in order of first appearance
+
+        Returns
+        -------
+        chains : list
+        """
+        chains, first = np.unique(self.chain_id, return_index=True)
+        return [str(chain) for chain in chains[np.argsort(first)]]
+
+    def select(self, mask):
+        """
+        Returns a new Structure holding only the atoms where mask is True
+
+        Parameters
+        ----------
+        mask : np.ndarray
+            Boolean array with one entry per atom
+
+        Returns
+        -------
+        structure : Structure
+        """
+        return Structure({name: getattr(self, name)[mask] for name in self.FIELDS}, self.header)
+
+    def chain_mask(self, chains):
+        """
+        Returns a boolean mask of the atoms found on any of the chains provided
+
+        Parameters
+        ----------
+        chains : str
+            Chain IDs, ex. 'DE'
+        """
+        return np.isin(self.chain_id, list(chains))
+
+    def primary_mask(self, hydrogens=False):
+        """
+        Returns a boolean mask of ATOM records without secondary alt. locations (and hydrogens by default)
+
+        Parameters
+        ----------
+        hydrogens : boolean
+            Keep hydrogen atoms
+        """
+        mask = (self.record == 'ATOM') & (self.alt_loc != 'B') & (self.alt_loc != 'C')
+        if not hydrogens:
+            mask &= self.atom_type != 'H'
+        return mask
+
+    def radii(self):
+        """
+        Returns the van der Waals radius of every atom
+
+        Returns
+        -------
+        radii : np.ndarray
+        """
+        elements, inverse = np.unique(self.atom_type, return_inverse=True)
+        lookup = np.array([VDW_RADII.get(element, DEFAULT_RADIUS) for element in elements])
+        return lookup[inverse.reshape(-1)]
+
+    def residue_index(self):
+        """
+        Returns an integer residue position for every atom along with a label for each residue.
+        Residues are numbered in order of appearance, a new residue starts whenever chain, number or icode changes
+
+        Returns
+        -------
+        index : np.ndarray
+        labels : list
+            'RES_NUM_CHAIN' labels, same format as PdbTools3.getLines()
+        """
+        if self._residue_index is None:
+            if len(self) == 0:
+                self._residue_index = (np.zeros(0, dtype=np.int64), [])
+            else:
+                change = np.ones(len(self), dtype=bool)
+                change[1:] = (self.chain_id[1:] != self.chain_id[:-1]) | (self.comp_num[1:] != self.comp_num[:-1])\
+                    | (self.icode[1:] != self.icode[:-1])
+                index = np.cumsum(change) - 1
+                starts = np.flatnonzero(change)
+                labels = ['%s_%d%s_%s' % (self.atom_comp_id[pos], self.comp_num[pos], self.icode[pos].strip(),
+                                          self.chain_id[pos]) for pos in starts]
+                self._residue_index = (index, labels)
+        return self._residue_index
+
+    def chain_sequences(self):
+        """
+        Returns the single letter amino acid sequence of every chain, one letter per residue of the ATOM records
+
+        Returns
+        -------
+        sequences : dict
+            chain -> sequence, chains in order of first appearance
+        """
+        atoms = self.select(self.record == 'ATOM')
+        index, labels = atoms.residue_index()
+        first = np.flatnonzero(np.r_[True, index[1:] != index[:-1]]) if len(atoms) else np.zeros(0, dtype=np.int64)
+        sequences = {chain: [] for chain in atoms.get_chains()}
+        for pos in first:
+            amino = THREE_TO_ONE.get(atoms.atom_comp_id[pos])
+            if amino is not None:
+                sequences[atoms.chain_id[pos]].append(amino)
+        return {chain: ''.join(seq) for chain, seq in sequences.items()}
+
+    def line_parts(self):
+        """
+        Returns the text before and after the XYZ columns of every atom line, so only coordinates need formatting
+        when the same atoms are written many times
+
+        Returns
+        -------
+        prefixes : list
+            Columns 1-30 of each atom line
+        suffixes : list
+            Columns 55-80 of each atom line, with newline
+        """
+        prefixes = []
+        suffixes = []
+        for pos in range(len(self)):
+            name = self.atom_id[pos]
+            if len(name) < 4 and len(self.atom_type[pos]) < 2:
+                name = ' ' + name
+            prefixes.append('%-6s%5d %-4s%1s%3s %1s%4d%1s   ' % (self.record[pos], self.atom_num[pos], name,
+                                                                 self.alt_loc[pos], self.atom_comp_id[pos],
+                                                                 self.chain_id[pos], self.comp_num[pos],
+                                                                 self.icode[pos]))
+            suffixes.append('%6.2f%6.2f          %2s\n' % (self.occupancy[pos], self.B_iso_or_equiv[pos],
+                                                           self.atom_type[pos]))
+        return prefixes, suffixes
+
+    def atom_lines(self, coords=None):
+        """
+        Returns PDB formatted atom lines
+
+        Parameters
+        ----------
+        coords : np.ndarray
+            Optional replacement coordinates, ex. after a rigid body move
+
+        Returns
+        -------
+        output : str
+        """
+        prefixes, suffixes = self.line_parts()
+        return format_atoms(prefixes, self.coords if coords is None else coords, suffixes)
+
+
+def format_atoms(prefixes, coords, suffixes):
+    """
+    Join atom line parts around formatted coordinates
+
+    Parameters
+    ----------
+    prefixes : list
+    coords : np.ndarray
+    suffixes : list
+
+    Returns
+    -------
+    output : str
+    """
+    xyz = ['%8.3f%8.3f%8.3f' % (x, y, z) for x, y, z in np.asarray(coords).tolist()]
+    return ''.join([prefix + cord + suffix for prefix, cord, suffix in zip(prefixes, xyz, suffixes)])
+
+
+def is_compressed(file_name):
+    """
+    Returns True when a file is gzip (or BGZF) compressed, decided by its first bytes and not its name
+    """
+    try:
+        with open(file_name, 'rb') as file:
+            return file.read(2) == GZIP_MAGIC
+    except OSError:
+        return False
+
+
+def open_pdb(file_name, mode='r'):
+    """
+    Open a PDB (or any text) file, compressed or not. Reads decompress gzip and BGZF files as a stream, writes are
+    compressed when the name ends with .gz (gzip) or .bgz (BGZF, block compressed so it stays seekable)
+
+    Parameters
+    ----------
+    file_name : str
+    mode : str
+        'r', 'w' or 'a', optionally with 'b'. '+' is ignored (compressed streams are one way)
+
+    Returns
+    -------
+    file : file object
+    """
+    mode = mode.replace('+', '')
+    binary = 'b' in mode
+    if mode[0] == 'r':
+        if is_compressed(file_name):
+            return gzip.open(file_name, mode if binary else 'rt')
+    elif file_name.endswith('.bgz'):
+        from Bio import bgzf
+        return bgzf.BgzfWriter(file_name, mode[0] + 'b', compresslevel=COMPRESS_LEVEL)
+    elif file_name.endswith(COMPRESSED):
+        return gzip.open(file_name, mode if binary else mode[0] + 't', compresslevel=COMPRESS_LEVEL)
+    return open(file_name, mode)
+
+
+def pdb_suffix(file_name):
+    """
+    Returns the ending a PDB file written from file_name gets, '.pdb' or the same compressed ending as file_name
+    """
+    for ending in COMPRESSED:
+        if file_name.endswith(ending):
+            return '.pdb' + ending
+    return '.pdb'
+
+
+def parse_pdb(file_name, hetatm=True):
+    """
+    Read the ATOM (and optional HETATM) records of a PDB file into a Structure. Only the first MODEL is read
+
+    Parameters
+    ----------
+    file_name : str
+        Location of PDB file
+    hetatm : boolean
+        Include HETATM records
+
+    Returns
+    -------
+    structure : Structure
+    """
+    records = ('ATOM  ', 'HETATM') if hetatm else ('ATOM  ',)
+    header = []
+    lines = []
+    with open_pdb(file_name) as file:
+        for line in file:
+            if line[0:6] in records:
+                lines.append(line.rstrip('\n').ljust(80))
+            elif line[0:6] == 'ENDMDL':
+                break
+            elif not lines:
+                header.append(line)
+    return structure_from_lines(lines, header)
+
+
+def structure_from_lines(lines, header=None):
+    """
+    Build a Structure from fixed column ATOM/HETATM lines
+
+    Parameters
+    ----------
+    lines : list
+        Atom lines padded to 80 characters
+    header : list
+        Lines found before the first atom
+
+    Returns
+    -------
+    structure : Structure
+    """
+    fields = {
+        'record': np.array([line[0:6].strip() for line in lines], dtype='U6'),
+        'atom_num': np.array([int(line[6:11]) for line in lines], dtype=np.int64),
+        'atom_id': np.array([line[12:16].strip() for line in lines], dtype='U4'),
+        'alt_loc': np.array([line[16] for line in lines], dtype='U1'),
+        'atom_comp_id': np.array([line[17:20].strip() for line in lines], dtype='U3'),
+        'chain_id': np.array([line[21] for line in lines], dtype='U1'),
+        'comp_num': np.array([int(line[22:26]) for line in lines], dtype=np.int64),
+        'icode': np.array([line[26] for line in lines], dtype='U1'),
+        'coords': np.array([(line[30:38], line[38:46], line[46:54]) for line in lines],
+                           dtype=np.float64).reshape(-1, 3),
+        'occupancy': np.array([float(line[54:60].strip() or 0) for line in lines], dtype=np.float64),
+        'B_iso_or_equiv': np.array([float(line[60:66].strip() or 0) for line in lines], dtype=np.float64),
+        'atom_type': np.array([element_of(line) for line in lines], dtype='U2'),
+    }
+    return Structure(fields, header)
+
+
+def line_columns(lines):
+    """
+    Fixed column fields of atom-like lines (ATOM, HETATM, TER, DEATOM) as a Structure without reading coordinates, so
+    text edits can use the same selections as parsed structures. Columns are cut from one byte matrix, blank or
+    non-numeric residue numbers read as 0
+
+    Parameters
+    ----------
+    lines : list
+
+    Returns
+    -------
+    structure : Structure
+        Coordinates, occupancy and B-factors are zero
+    """
+    empty = structure_from_lines([])
+    text = np.array([line.rstrip('\n').encode('latin-1')[:80].ljust(80) for line in lines], dtype='S80')
+    chars = text.view('S1').reshape(len(lines), 80)
+
+    def column(start, end, field):
+        values = np.char.strip(chars[:, start:end].copy().view('S%d' % (end - start)).reshape(-1))
+        return values.astype(getattr(empty, field).dtype)
+
+    numbers = np.char.strip(chars[:, 22:26].copy().view('S4').reshape(-1))
+    valid = np.char.isdigit(np.char.lstrip(numbers, b'-')) if len(lines) else np.zeros(0, dtype=bool)
+    element = column(76, 78, 'atom_type')
+    name = column(12, 16, 'atom_id')
+    guessed = np.char.upper(np.char.lstrip(name, '0123456789')).astype('U1')
+    fields = {
+        'record': column(0, 6, 'record'),
+        'atom_num': np.zeros(len(lines), dtype=np.int64),
+        'atom_id': name,
+        'alt_loc': chars[:, 16].astype('U1'),
+        'atom_comp_id': column(17, 20, 'atom_comp_id'),
+        'chain_id': chars[:, 21].astype('U1'),
+        'comp_num': np.where(valid, numbers, b'0').astype(np.int64),
+        'icode': chars[:, 26].astype('U1'),
+        'coords': np.zeros((len(lines), 3), dtype=np.float64),
+        'occupancy': np.zeros(len(lines), dtype=np.float64),
+        'B_iso_or_equiv': np.zeros(len(lines), dtype=np.float64),
+        'atom_type': np.where(element != '', np.char.upper(element), guessed).astype(empty.atom_type.dtype),
+    }
+    return Structure(fields)
+
+
+def element_of(line):
+    """
+    Returns the element of an atom line, falls back on the atom name when columns 77-78 are empty
+
+    Parameters
+    ----------
+    line : str
+
+    Returns
+    -------
+    element : str
+    """
+    element = line[76:78].strip().upper()
+    if element:
+        return element
+    name = line[12:16]
+    if name[0].isdigit() or name[0] == ' ':  # ' CA ' or '1HB ' style names
+        return name.strip().lstrip('0123456789')[:1].upper()
+    return name[:2].strip().upper()
+
+
+def file_key(file_name):
+    """
+    Returns a key that changes whenever the file on disk changes
+
+    Parameters
+    ----------
+    file_name : str
+
+    Returns
+    -------
+    key : tuple
+    """
+    stat = os.stat(file_name)
+    return os.path.abspath(file_name), stat.st_mtime_ns, stat.st_size
+
+
+def read_header(file_name):
+    """
+    Read the lines of a PDB file found before its first atom record, the coordinates are never read
+
+    Parameters
+    ----------
+    file_name : str
+
+    Returns
+    -------
+    header : list
+    """
+    header = []
+    with open_pdb(file_name) as file:
+        for line in file:
+            if line[0:6] in HEADER_END:
+                break
+            header.append(line)
+    return header
+
+
+def parse_header(header):
+    """
+    Pull the entry metadata out of the header lines of a PDB file
+
+    Parameters
+    ----------
+    header : list
+        Output of read_header() or Structure.header
+
+    Returns
+    -------
+    metadata : dict
+        'pdb' ID (lower case, '' when there is no HEADER record), 'resolution' (angstroms, None when not given),
+        'method', 'seqres' chain -> sequence from the SEQRES records and 'molecules' chain -> COMPND molecule name
+    """
+    metadata = {'pdb': '', 'resolution': None, 'method': '', 'seqres': {}, 'molecules': {}}
+    method, compound, remark_3 = [], [], None
+    for line in header:
+        record = line[0:6]
+        if record == 'HEADER':
+            metadata['pdb'] = line[62:66].strip().lower()
+        elif record == 'EXPDTA':
+            method.append(line[10:79].strip())
+        elif record == 'COMPND':
+            compound.append(line[10:80].strip())
+        elif record == 'SEQRES':
+            residues = [THREE_TO_ONE.get(residue, 'X') for residue in line[19:70].split()]
+            metadata['seqres'][line[11]] = metadata['seqres'].get(line[11], '') + ''.join(residues)
+        elif record == 'REMARK' and metadata['resolution'] is None:
+            # 'REMARK   2 RESOLUTION.    2.60 ANGSTROMS.' is the standard place, REMARK 3 is the fall back
+            if line[6:10] == '   2' and 'RESOLUTION.' in line:
+                metadata['resolution'] = header_number(line.split('RESOLUTION.')[1])
+            elif line[6:10] == '   3' and 'RESOLUTION RANGE HIGH' in line and remark_3 is None:
+                remark_3 = header_number(line.split(':')[-1])
+    if metadata['resolution'] is None:
+        metadata['resolution'] = remark_3
+    metadata['method'] = ' '.join(method)
+    metadata['molecules'] = compound_molecules(' '.join(compound))
+    return metadata
+
+
+def header_number(text):
+    """
+    Returns the first number in a header field, None for 'NOT APPLICABLE' and other text
+    """
+    for word in text.split():
+        try:
+            return float(word)
+        except ValueError:
+            continue
+    return None
+
+
+def compound_molecules(compound):
+    """
+    Returns the molecule name of every chain from the joined text of the COMPND records
+
+    Parameters
+    ----------
+    compound : str
+        ex. 'MOL_ID: 1; MOLECULE: HLA-A*0201; CHAIN: A; MOL_ID: 2; ...'
+
+    Returns
+    -------
+    molecules : dict
+        chain -> molecule name
+    """
+    molecules, molecule = {}, ''
+    for token in compound.split(';'):
+        name, _, value = token.partition(':')
+        name = name.strip()
+        if name == 'MOL_ID':
+            molecule = ''
+        elif name == 'MOLECULE':
+            molecule = value.strip()
+        elif name == 'CHAIN':
+            for chain in value.split(','):
+                if chain.strip():
+                    molecules[chain.strip()] = molecule
+    return molecules
@@ -0,0 +1,276 @@
+#!/usr/bin/python3
+
+######################################################################
+# structure_cache.py -- A component of TRain                         #
+# Copyright: Austin Seamann, Dario Ghersi, and Ryan Ehrlich          #
+# Goal: Transparent binary cache of parsed structures. Each file is  #
+#       parsed once per content and parser version, later opens map  #
+#       the stored arrays straight from disk without copying.        #
+######################################################################
+
+
+import hashlib
+import json
+import os
+import time
+import numpy as np
+try:  # Imported as part of the web app
+    from PDBS.structure import Structure, PARSER_VERSION
+    from PDBS import cif, complexes
+except ImportError:  # Ran as a script from within PDBS/
+    from structure import Structure, PARSER_VERSION
+    import cif
+    import complexes
+
+#################
+#     Global    #
+#################
+CACHE_DIR = os.environ.get("TRAIN_STRUCTURE_CACHE",
+                           os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "train",
+                                        "structures"))
+MAGIC = b"TRSTRUCT"  # First bytes of every cached structure
+ALIGN = 64  # Arrays start on multiples of this many bytes
+HASH_BLOCK = 1 << 20
+MAX_BYTES = int(os.environ.get("TRAIN_STRUCTURE_CACHE_BYTES", 4 << 30))  # Least recently used structures past this
+KEY_TTL = 30 * 86400  # Seconds an unused file key is kept
+TOUCH_AFTER = 3600  # Seconds before a hit marks a cached file as used again, so most hits write nothing
+PRUNE_EVERY = 50  # Structures written by a process between prunes
+_written = 0
+
+
+#################
+#    Methods    #
+#################
+def content_hash(file_name):
+    """
+    Returns the SHA1 of a file's contents
+    """
+    digest = hashlib.sha1()
+    with open(file_name, 'rb') as file:
+        for block in iter(lambda: file.read(HASH_BLOCK), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def stat_key(file_name):
+    """
+    Returns a key of where a file is and when it last changed, used to skip hashing files already seen
+    """
+    stat = os.stat(file_name)
+    return hashlib.sha1(("%s|%d|%d" % (os.path.abspath(file_name), stat.st_mtime_ns, stat.st_size)).encode())\
+        .hexdigest()
+
+
+def derived_values(structure):
+    """
+    Values worth keeping next to the atoms: chain sequences and TCR chain roles of the ATOM records
+
+    Parameters
+    ----------
+    structure : Structure
+
+    Returns
+    -------
+    derived : dict
+        'sequences' chain -> sequence and 'tcr' {'ALPHA': chain, 'BETA': chain} (empty when not found)
+    """
+    atoms = structure.select(structure.record == 'ATOM')
+    sequences = atoms.chain_sequences()
+    try:
+        tcr = complexes.tcr_chains(atoms) if sequences else {}
+    except (ValueError, KeyError, IndexError):
+        tcr = {}
+    return {'sequences': sequences, 'tcr': tcr}
+
+
+def write_cached(file_name, structure, derived):
+    """
+    Write a structure as one binary file: MAGIC, the length of a JSON description, the description (field types,
+    shapes and offsets, header lines, derived values) and every field array aligned to ALIGN bytes. Written to a
+    temporary file first so readers never see half a file
+
+    Parameters
+    ----------
+    file_name : str
+    structure : Structure
+    derived : dict
+    """
+    fields, offset = {}, 0
+    for name in Structure.FIELDS:
+        column = np.ascontiguousarray(getattr(structure, name))
+        fields[name] = {'dtype': column.dtype.str, 'shape': list(column.shape), 'offset': offset}
+        offset += -(-column.nbytes // ALIGN) * ALIGN
+    description = json.dumps({'version': PARSER_VERSION, 'fields': fields, 'header': structure.header,
+                              'derived': derived}).encode()
+    start = -(-(len(MAGIC) + 8 + len(description)) // ALIGN) * ALIGN
+    temp = "%s.%d.tmp" % (file_name, os.getpid())
+    with open(temp, 'wb') as file:
+        file.write(MAGIC + len(description).to_bytes(8, 'little') + description)
+        for name in Structure.FIELDS:
+            file.seek(start + fields[name]['offset'])
+            file.write(np.ascontiguousarray(getattr(structure, name)).tobytes())
+        file.truncate(start + offset)
+    os.replace(temp, file_name)
+
+
+def read_cached(file_name):
+    """
+    Map a structure written by write_cached(), field arrays are read only views of the file
+
+    Returns
+    -------
+    structure : Structure
+    derived : dict
+    """
+    with open(file_name, 'rb') as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError("%s is not a cached structure" % file_name)
+        length = int.from_bytes(file.read(8), 'little')
+        description = json.loads(file.read(length))
+    if description['version'] != PARSER_VERSION:
+        raise ValueError("%s was written by parser version %d" % (file_name, description['version']))
+    start = -(-(len(MAGIC) + 8 + length) // ALIGN) * ALIGN
+    data = np.memmap(file_name, dtype=np.uint8, mode='r') if os.path.getsize(file_name) > start else None
+    fields = {}
+    for name, spec in description['fields'].items():
+        dtype, shape = np.dtype(spec['dtype']), tuple(spec['shape'])
+        if data is None or 0 in shape:
+            fields[name] = np.zeros(shape, dtype=dtype)
+        else:
+            fields[name] = np.ndarray(shape, dtype=dtype, buffer=data, offset=start + spec['offset'])
+    return Structure(fields, description['header']), description['derived']
+
+
+def touch(file_name):
+    """
+    Mark a cache file as recently used by its modification time (access times are often not kept)
+    """
+    try:
+        if os.stat(file_name).st_mtime < time.time() - TOUCH_AFTER:
+            os.utime(file_name)
+    except OSError:
+        pass
+
+
+def prune(cache_dir=CACHE_DIR, max_bytes=MAX_BYTES, key_ttl=KEY_TTL):
+    """
+    Shrink a cache directory: least recently used structures are removed until the rest fit in max_bytes, then file
+    keys unused for key_ttl seconds or pointing at a removed structure, and temporary files left by killed writers
+
+    Parameters
+    ----------
+    cache_dir : str
+    max_bytes : int
+    key_ttl : int
+
+    Returns
+    -------
+    removed : int
+        Files removed
+    """
+    now, removed, structures = time.time(), 0, []
+    try:
+        entries = list(os.scandir(cache_dir))
+    except OSError:
+        return 0
+    for entry in entries:
+        try:
+            stat = entry.stat()
+        except OSError:
+            continue
+        if entry.name.endswith(".tmp") and stat.st_mtime < now - TOUCH_AFTER:
+            removed += _remove(entry.path)
+        elif entry.name.endswith(".struct"):
+            structures.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in structures)
+    for _, size, path in sorted(structures):
+        if total <= max_bytes:
+            break
+        removed += _remove(path)
+        total -= size
+    try:
+        keys = list(os.scandir(os.path.join(cache_dir, "keys")))
+    except OSError:
+        return removed
+    for entry in keys:
+        try:
+            if entry.stat().st_mtime < now - key_ttl:
+                removed += _remove(entry.path)
+                continue
+            with open(entry.path, 'r') as file:
+                if not os.path.exists(os.path.join(cache_dir, file.read().strip())):
+                    removed += _remove(entry.path)
+        except OSError:
+            continue
+    return removed
+
+
+def _remove(path):
+    # 1 when removed, another process may have removed it first
+    try:
+        os.remove(path)
+        return 1
+    except OSError:
+        return 0
+
+
+def load(file_name, cache_dir=CACHE_DIR):
+    """
+    Returns the parsed structure of a PDB, mmCIF or BinaryCIF file (with HETATM records) and its derived values. A
+    file seen before only costs a stat and a mapping, changed files are hashed and parsed only when their contents
+    are new. Every PRUNE_EVERY structures written the cache is pruned, see prune()
+
+    Parameters
+    ----------
+    file_name : str
+    cache_dir : str
+        Cache directory, ex. next to the library. Created when missing
+
+    Returns
+    -------
+    structure : Structure
+    derived : dict
+        See derived_values()
+    """
+    global _written
+    pointer = os.path.join(cache_dir, "keys", stat_key(file_name))
+    try:
+        with open(pointer, 'r') as file:
+            location = os.path.join(cache_dir, file.read().strip())
+        result = read_cached(location)
+        touch(pointer)
+        touch(location)
+        return result
+    except (OSError, ValueError):
+        pass
+    cached = "%s-v%d.struct" % (content_hash(file_name), PARSER_VERSION)
+    location = os.path.join(cache_dir, cached)
+    try:
+        result = read_cached(location)
+        touch(location)
+    except (OSError, ValueError):
+        structure = cif.read_structure(file_name)
+        result = structure, derived_values(structure)
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            write_cached(location, *result)
+        except OSError:  # Read only cache, still return the parsed structure
+            return result
+        if _written % PRUNE_EVERY == 0:
+            prune(cache_dir)
+        _written += 1
+    try:
+        os.makedirs(os.path.dirname(pointer), exist_ok=True)
+        with open(pointer + ".%d.tmp" % os.getpid(), 'w') as file:
+            file.write(cached)
+        os.replace(pointer + ".%d.tmp" % os.getpid(), pointer)
+    except OSError:
+        pass
+    return result
+
+
+def open_structure(file_name, cache_dir=CACHE_DIR):
+    """
+    Cached replacement of cif.read_structure(file_name), see load()
+    """
+    return load(file_name, cache_dir)[0]
@@ -0,0 +1,67 @@
+######################################################################
+# support.py -- A component of TRain                                 #
+# Copyright: Austin Seamann, Dario Ghersi, and Ryan Ehrlich          #
+# Goal: Shared setup of the PDBS tests. Caches are pointed at a      #
+#       temporary directory before any PDBS module is imported and   #
+#       the example structures of PDBS/ are located.                 #
+######################################################################
+
+
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+#################
+#     Global    #
+#################
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+PDBS_DIR = os.path.dirname(TESTS_DIR)
+APP_DIR = os.path.dirname(PDBS_DIR)  # Holds the PDBS and api packages
+CACHE_DIR = tempfile.mkdtemp(prefix="train-tests-")
+atexit.register(shutil.rmtree, CACHE_DIR, True)
+os.environ["TRAIN_SCORE_CACHE"] = os.path.join(CACHE_DIR, "score_cache.sqlite")
+os.environ["TRAIN_STRUCTURE_CACHE"] = os.path.join(CACHE_DIR, "structures")
+os.environ["TRAIN_FLIGHT_DIR"] = os.path.join(CACHE_DIR, "flights")
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
+
+
+#################
+#    Methods    #
+#################
+def example(name):
+    """
+    Returns the path of an example structure of PDBS/, ex. example('1ao7.pdb')
+    """
+    return os.path.join(PDBS_DIR, name)
+
+
+def library(*names):
+    """
+    Returns a temporary library directory holding copies of example structures, removed by the caller
+    """
+    location = tempfile.mkdtemp(prefix="train-library-")
+    for name in names:
+        shutil.copy(example(name), location)
+    return location
+
+
+def write_cif(structure, file_name):
+    """
+    Write the atoms of a Structure as a minimal mmCIF atom_site loop
+    """
+    items = ('group_PDB', 'id', 'auth_atom_id', 'label_alt_id', 'auth_comp_id', 'auth_asym_id', 'auth_seq_id',
+             'pdbx_PDB_ins_code', 'Cartn_x', 'Cartn_y', 'Cartn_z', 'occupancy', 'B_iso_or_equiv', 'type_symbol',
+             'pdbx_PDB_model_num')
+    with open(file_name, 'w') as file:
+        file.write("data_test\nloop_\n" + "".join("_atom_site.%s\n" % item for item in items))
+        for pos in range(len(structure)):
+            x, y, z = structure.coords[pos]
+            file.write(" ".join([structure.record[pos], str(structure.atom_num[pos]), structure.atom_id[pos],
+                                 structure.alt_loc[pos].strip() or '.', structure.atom_comp_id[pos],
+                                 structure.chain_id[pos], str(structure.comp_num[pos]),
+                                 structure.icode[pos].strip() or '?', "%.3f" % x, "%.3f" % y, "%.3f" % z,
+                                 "%.2f" % structure.occupancy[pos], "%.2f" % structure.B_iso_or_equiv[pos],
+                                 structure.atom_type[pos].strip() or '?', '1']) + "\n")
@@ -0,0 +1,123 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import numpy as np
+
+import support
+from PDBS import cif, score_cache, structure_cache
+from PDBS.structure import Structure
+
+
+class StructureCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.work = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.work, 'cache')
+        self.file_name = shutil.copy(support.example('1ao7.pdb'), self.work)
+
+    def tearDown(self):
+        shutil.rmtree(self.work)
+
+    def test_round_trip(self):
+        parsed = cif.read_structure(self.file_name)
+        structure, derived = structure_cache.load(self.file_name, self.cache_dir)
+        for name in Structure.FIELDS:
+            np.testing.assert_array_equal(getattr(structure, name), getattr(parsed, name))
+        self.assertEqual(structure.header, parsed.header)
+        self.assertEqual(derived['tcr'], {'ALPHA': 'D', 'BETA': 'E'})
+        self.assertEqual(sorted(derived['sequences']), ['A', 'B', 'C', 'D', 'E'])
+        structure, _ = structure_cache.load(self.file_name, self.cache_dir)
+        self.assertFalse(structure.coords.flags.writeable)  # Mapped from the cache file, not copied
+        np.testing.assert_array_equal(structure.coords, parsed.coords)
+
+    def test_hit_skips_parsing(self):
+        structure_cache.load(self.file_name, self.cache_dir)
+        with mock.patch.object(cif, 'read_structure', side_effect=AssertionError("parsed again")):
+            structure_cache.load(self.file_name, self.cache_dir)
+            # A copy with the same contents shares the cached structure, only its key is new
+            copy = os.path.join(self.work, 'copy.pdb')
+            shutil.copy(self.file_name, copy)
+            structure_cache.load(copy, self.cache_dir)
+        self.assertEqual(len([name for name in os.listdir(self.cache_dir) if name.endswith('.struct')]), 1)
+
+    def test_changed_file_parsed_again(self):
+        structure_cache.load(self.file_name, self.cache_dir)
+        with open(self.file_name) as file:
+            lines = [line for line in file if not line.startswith(('ATOM', 'HETATM')) or line[21] != 'C']
+        with open(self.file_name, 'w') as file:
+            file.writelines(lines)
+        structure, derived = structure_cache.load(self.file_name, self.cache_dir)
+        self.assertNotIn('C', set(structure.chain_id))
+        self.assertNotIn('C', derived['sequences'])
+
+    def test_prune(self):
+        structure_cache.load(self.file_name, self.cache_dir)
+        self.assertEqual(structure_cache.prune(self.cache_dir, max_bytes=1 << 40), 0)
+        stale = os.path.join(self.cache_dir, 'left.struct.1.tmp')
+        open(stale, 'w').close()
+        os.utime(stale, (0, 0))
+        # Over the size limit: the structure, its key and the stale temporary file go
+        self.assertEqual(structure_cache.prune(self.cache_dir, max_bytes=0), 3)
+        self.assertEqual(os.listdir(os.path.join(self.cache_dir, 'keys')), [])
+        structure, _ = structure_cache.load(self.file_name, self.cache_dir)
+        self.assertTrue(len(structure))
+
+    def test_bad_cache_file(self):
+        bad = os.path.join(self.work, 'bad.struct')
+        with open(bad, 'wb') as file:
+            file.write(b'not a structure')
+        with self.assertRaises(ValueError):
+            structure_cache.read_cached(bad)
+
+
+class ScoreCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.work = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.work, 'scores.sqlite')
+
+    def tearDown(self):
+        shutil.rmtree(self.work)
+
+    def test_only_missing_pairs_scored(self):
+        calls = []
+
+        def score(seq, ref):
+            calls.append((seq, ref))
+            return len(seq) + len(ref)
+
+        cache = score_cache.ScoreCache(self.file_name)
+        pairs = [('AAA', 'CC'), ('AAA', 'CC'), ('DD', 'CC')]
+        self.assertEqual(cache.scores(pairs, ['r1', 'r1', 'r1'], 'p', score), [5.0, 5.0, 4.0])
+        self.assertEqual(len(calls), 2)
+        # Another process (fresh memory) reads the stored scores from the file
+        other = score_cache.ScoreCache(self.file_name)
+        self.assertEqual(other.scores(pairs + [('E', 'CC')], ['r1'] * 4, 'p', score), [5.0, 5.0, 4.0, 3.0])
+        self.assertEqual(len(calls), 3)
+        # Other parameters or references are other keys
+        other.scores([('AAA', 'CC')], ['r2'], 'p', score)
+        other.scores([('AAA', 'CC')], ['r1'], 'q', score)
+        self.assertEqual(len(calls), 5)
+
+    def test_eviction(self):
+        cache = score_cache.ScoreCache(self.file_name, max_entries=10)
+        for batch in range(3):
+            cache.put_many({'%d-%d' % (batch, pos): float(pos) for pos in range(5)})
+            time.sleep(0.01)
+        count = cache.connection().execute("SELECT COUNT(*) FROM scores").fetchone()[0]
+        self.assertLessEqual(count, 10)
+        self.assertEqual(score_cache.ScoreCache(self.file_name).get_many(['2-4']), {'2-4': 4.0})
+        self.assertEqual(score_cache.ScoreCache(self.file_name).get_many(['0-0']), {})
+
+    def test_unwritable_file(self):
+        # The cache directory would be made under a plain file, scores are only kept in memory
+        blocker = os.path.join(self.work, 'file')
+        open(blocker, 'w').close()
+        cache = score_cache.ScoreCache(os.path.join(blocker, 'scores.sqlite'))
+        self.assertEqual(cache.scores([('A', 'C')], ['r'], 'p', lambda seq, ref: 1.0), [1.0])
+
+
+if __name__ == '__main__':
+    unittest.main()
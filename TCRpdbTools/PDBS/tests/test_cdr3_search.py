@@ -0,0 +1,51 @@
+import os
+import shutil
+import unittest
+
+import support
+from PDBS import cdr3_search
+
+
+class SearchTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.location = support.library('1ao7.pdb', '1bd2.pdb', '1fyt.pdb', '1g6r.pdb', '2vlk.pdb', '3gsn.pdb',
+                                       '3utt.pdb')
+        cls.index_file = os.path.join(cls.location, 'cdr3_index.npz')
+        cls.count = cdr3_search.build_index(cls.location, cls.index_file, workers=1)
+        cls.index = cdr3_search.load_index(cls.index_file)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.location)
+
+    def test_exact_match(self):
+        self.assertGreaterEqual(self.count, 2)
+        cdr3 = self.index['cdr3_list'][0]
+        hit = cdr3_search.search(cdr3, 1, index=self.index)[0]
+        self.assertEqual((hit['cdr3'], hit['distance']), (cdr3, 0))
+        self.assertEqual(hit['pdb'], str(self.index['pdbs'][0]))
+
+    def test_chain_type(self):
+        hits = cdr3_search.search(self.index['cdr3_list'][0], 50, 'BETA', index=self.index)
+        self.assertTrue(hits and all(hit['chain_type'] == 'BETA' for hit in hits))
+
+    def test_exact_scan(self):
+        # Every third residue changed: no k-mer is shared with the source entry, only the exact scan scores it
+        source = self.index['cdr3_list'][0]
+        query = ''.join('W' if pos % 3 == 1 else aa for pos, aa in enumerate(source))
+        best = min(cdr3_search.edit_distance(query, cdr3) for cdr3 in self.index['cdr3_list'])
+        exact = cdr3_search.search(query, 1, index=self.index, candidates=None)
+        self.assertEqual(exact[0]['distance'], best)
+        approximate = cdr3_search.search(query, 1, index=self.index, candidates=1)
+        self.assertGreaterEqual(approximate[0]['distance'], best)
+
+    def test_bad_arguments(self):
+        with self.assertRaises(ValueError):
+            cdr3_search.search('CASS', 0, index=self.index)
+        with self.assertRaises(ValueError):
+            cdr3_search.search('CASS', metric='hamming', index=self.index)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import support
+from PDBS import cif
+from PDBS.structure import parse_pdb, Structure
+
+try:
+    import msgpack
+except ImportError:  # BinaryCIF is optional
+    msgpack = None
+
+
+def byte_array(values, code):
+    return {'kind': 'ByteArray', 'type': code}, np.asarray(values, dtype=cif.BYTE_TYPES[code]).tobytes()
+
+
+def pack_integers(values):
+    # IntegerPacking into signed bytes: values past the limit continue into the next byte
+    packed = []
+    for value in values.tolist():
+        while value >= 127 or value <= -128:
+            packed.append(127 if value > 0 else -128)
+            value -= packed[-1]
+        packed.append(value)
+    return np.array(packed)
+
+
+def encode_integers(values):
+    # Delta, then IntegerPacking, then ByteArray, as written by MolStar
+    values = np.asarray(values, dtype=np.int64)
+    deltas = np.diff(values, prepend=values[0])
+    byte, data = byte_array(pack_integers(deltas), 1)
+    return {'data': data, 'encoding': [{'kind': 'Delta', 'origin': int(values[0]), 'srcType': 3},
+                                       {'kind': 'IntegerPacking', 'byteCount': 1, 'isUnsigned': False,
+                                        'srcSize': len(deltas)}, byte]}
+
+
+def encode_floats(values):
+    byte, data = byte_array(np.round(np.asarray(values) * 1000), 3)
+    return {'data': data, 'encoding': [{'kind': 'FixedPoint', 'factor': 1000, 'srcType': 33}, byte]}
+
+
+def encode_strings(values):
+    strings, index = np.unique(np.asarray(values, dtype=str), return_inverse=True)
+    offsets = np.cumsum([0] + [len(value) for value in strings])
+    offset_byte, offset_data = byte_array(offsets, 3)
+    data_byte, data = byte_array(index, 3)
+    return {'data': data, 'encoding': [{'kind': 'StringArray', 'stringData': ''.join(strings),
+                                        'offsets': offset_data, 'offsetEncoding': [offset_byte],
+                                        'dataEncoding': [data_byte]}]}
+
+
+def write_bcif(structure, file_name):
+    blank = np.char.strip(structure.alt_loc.astype(str)) == ''
+    columns = [('group_PDB', encode_strings(structure.record)), ('id', encode_integers(structure.atom_num)),
+               ('auth_atom_id', encode_strings(structure.atom_id)),
+               ('auth_comp_id', encode_strings(structure.atom_comp_id)),
+               ('auth_asym_id', encode_strings(structure.chain_id)),
+               ('auth_seq_id', encode_integers(structure.comp_num)),
+               ('Cartn_x', encode_floats(structure.coords[:, 0])), ('Cartn_y', encode_floats(structure.coords[:, 1])),
+               ('Cartn_z', encode_floats(structure.coords[:, 2])), ('occupancy', encode_floats(structure.occupancy)),
+               ('B_iso_or_equiv', encode_floats(structure.B_iso_or_equiv)),
+               ('type_symbol', encode_strings(structure.atom_type))]
+    items = [{'name': name, 'data': data, 'mask': None} for name, data in columns]
+    mask_byte, mask = byte_array(blank.astype(np.uint8), 4)
+    items.append({'name': 'label_alt_id', 'data': encode_strings(np.where(blank, '', structure.alt_loc)),
+                  'mask': {'data': mask, 'encoding': [mask_byte]}})
+    content = {'version': '0.3.0', 'encoder': 'test', 'dataBlocks': [{'header': 'TEST', 'categories': [
+        {'name': '_atom_site', 'rowCount': len(structure), 'columns': items}]}]}
+    with open(file_name, 'wb') as file:
+        file.write(msgpack.packb(content, use_bin_type=True))
+
+
+class CifTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.expected = parse_pdb(support.example('1ao7.pdb'))
+
+    def setUp(self):
+        self.work = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.work)
+
+    def assertSameAtoms(self, structure, expected):
+        for name in Structure.FIELDS:
+            if name == 'coords':
+                np.testing.assert_allclose(structure.coords, expected.coords, atol=1e-3)
+            else:
+                np.testing.assert_array_equal(getattr(structure, name), getattr(expected, name), err_msg=name)
+
+    def test_matches_pdb(self):
+        file_name = os.path.join(self.work, '1ao7.cif')
+        support.write_cif(self.expected, file_name)
+        self.assertSameAtoms(cif.read_structure(file_name), self.expected)
+        compressed = file_name + '.gz'
+        with open(file_name, 'rb') as source, gzip.open(compressed, 'wb') as target:
+            target.write(source.read())
+        self.assertSameAtoms(cif.read_structure(compressed, hetatm=False),
+                             self.expected.select(self.expected.record == 'ATOM'))
+
+    def test_quotes_and_models(self):
+        file_name = os.path.join(self.work, 'small.cif')
+        with open(file_name, 'w') as file:
+            file.write("data_small\n_entry.id small\nloop_\n_atom_site.group_PDB\n_atom_site.id\n"
+                       "_atom_site.auth_atom_id\n_atom_site.auth_comp_id\n_atom_site.auth_asym_id\n"
+                       "_atom_site.auth_seq_id\n_atom_site.Cartn_x\n_atom_site.Cartn_y\n_atom_site.Cartn_z\n"
+                       "_atom_site.type_symbol\n_atom_site.pdbx_PDB_model_num\n"
+                       "ATOM 1 \"O5'\" DA A 1 1.0 2.0 3.0 O 1\n"
+                       "HETATM 2 O HOH A 2 4.0 5.0 6.0 O 1\n"
+                       "ATOM 3 \"O5'\" DA A 1 9.0 9.0 9.0 O 2\n#\n")
+        structure = cif.read_structure(file_name)
+        self.assertEqual(structure.atom_id.tolist(), ["O5'", 'O'])
+        self.assertEqual(structure.record.tolist(), ['ATOM', 'HETATM'])
+        self.assertEqual(len(cif.read_structure(file_name, hetatm=False)), 1)
+
+    @unittest.skipIf(msgpack is None, "BinaryCIF needs msgpack")
+    def test_binary_cif(self):
+        file_name = os.path.join(self.work, '1ao7.bcif')
+        write_bcif(self.expected, file_name)
+        structure = cif.read_structure(file_name)
+        for name in ('record', 'atom_num', 'atom_id', 'alt_loc', 'atom_comp_id', 'chain_id', 'comp_num', 'atom_type'):
+            np.testing.assert_array_equal(getattr(structure, name), getattr(self.expected, name), err_msg=name)
+        np.testing.assert_allclose(structure.coords, self.expected.coords, atol=1e-3)
+
+    def test_run_length(self):
+        encoding = [{'kind': 'RunLength', 'srcType': 3, 'srcSize': 5}, {'kind': 'ByteArray', 'type': 3}]
+        values = cif.decode(np.array([7, 3, 9, 2], dtype='<i4').tobytes(), encoding)
+        self.assertEqual(values.tolist(), [7, 7, 7, 9, 9])
+
+
+if __name__ == '__main__':
+    unittest.main()
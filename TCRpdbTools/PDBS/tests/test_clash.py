@@ -0,0 +1,49 @@
+import unittest
+
+import numpy as np
+
+import support
+from PDBS import clash
+from PDBS.structure import parse_pdb
+
+
+class CellListTest(unittest.TestCase):
+    def test_pairs_match_brute_force(self):
+        rng = np.random.default_rng(1)
+        points, queries = rng.uniform(0, 20, (400, 3)), rng.uniform(-2, 22, (300, 3))
+        pairs, dist = clash.CellList(points, 2.5).pairs_within(queries)
+        distances = np.linalg.norm(queries[:, None] - points[None], axis=2)
+        expected = set(zip(*np.nonzero(distances < 2.5)))
+        self.assertEqual({(int(i), int(j)) for i, j in pairs}, expected)
+        np.testing.assert_allclose(dist, distances[pairs[:, 0], pairs[:, 1]])
+        self.assertEqual(clash.CellList(points, 2.5).any_within(queries), bool(expected))
+
+    def test_no_atoms(self):
+        self.assertFalse(clash.CellList(np.zeros((0, 3))).any_within(np.zeros((5, 3))))
+
+
+class StructureClashTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        structure = parse_pdb(support.example('1ao7.pdb'), hetatm=False)
+        cls.tcr = structure.select(structure.chain_mask('DE'))
+        cls.pmhc = structure.select(structure.chain_mask('AC'))
+
+    def test_crystal_has_no_clash(self):
+        self.assertFalse(clash.any_clash(self.tcr, self.pmhc))
+        self.assertEqual(clash.find_clashes(self.tcr, self.pmhc)['pairs'], [])
+
+    def test_shifted_partner_clashes(self):
+        # Pull the pMHC onto the TCR, clashing residues are reported on both partners
+        moved = self.pmhc.select(np.ones(len(self.pmhc), dtype=bool))
+        moved.coords = moved.coords + (self.tcr.coords.mean(axis=0) - moved.coords.mean(axis=0))
+        self.assertTrue(clash.any_clash(self.tcr, moved))
+        result = clash.find_clashes(self.tcr, moved)
+        self.assertTrue(result['pairs'])
+        self.assertTrue(all(distance < clash.CLASH_CUTOFF for _, _, distance in result['pairs']))
+        chains = {label.split('_')[-1] for label in result['residues']}
+        self.assertTrue(chains & set('DE') and chains & set('AC'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import support
+from PDBS import cif, complexes
+from PDBS.structure import parse_pdb, Structure
+
+
+class TcrChainsTest(unittest.TestCase):
+    def test_class_one_complex(self):
+        structure = parse_pdb(support.example('1ao7.pdb'), hetatm=False)
+        self.assertEqual(complexes.tcr_chains(structure), {'ALPHA': 'D', 'BETA': 'E'})
+        self.assertEqual(complexes.find_complexes(structure),
+                         [{'ALPHA': 'D', 'BETA': 'E', 'MHC': 'A', 'B2M': 'B', 'PEPTIDE': 'C'}])
+
+    def test_no_tcr(self):
+        # pMHC only, no chain may be reported as alpha or beta
+        self.assertEqual(complexes.tcr_chains(parse_pdb(support.example('3e3q.pdb'), hetatm=False)), {})
+
+    def test_two_complexes(self):
+        assemblies = complexes.find_complexes(parse_pdb(support.example('1d9k.pdb'), hetatm=False))
+        self.assertEqual([(each['ALPHA'], each['BETA']) for each in assemblies], [('A', 'B'), ('E', 'F')])
+
+
+class MultiCharacterChainTest(unittest.TestCase):
+    # mmCIF chain IDs can be longer than one character, ex. 'AA' or 'DD' in large assemblies
+    def setUp(self):
+        self.work = tempfile.mkdtemp()
+        structure = parse_pdb(support.example('1ao7.pdb'), hetatm=False)
+        fields = {name: getattr(structure, name) for name in Structure.FIELDS}
+        fields['chain_id'] = np.char.add(structure.chain_id, structure.chain_id)
+        self.file_name = os.path.join(self.work, '1ao7.cif')
+        support.write_cif(Structure(fields), self.file_name)
+
+    def tearDown(self):
+        shutil.rmtree(self.work)
+
+    def test_complexes_from_cif(self):
+        structure = cif.read_structure(self.file_name, hetatm=False)
+        self.assertEqual(sorted(structure.chain_sequences()), ['AA', 'BB', 'CC', 'DD', 'EE'])
+        self.assertEqual(complexes.tcr_chains(structure), {'ALPHA': 'DD', 'BETA': 'EE'})
+        self.assertEqual(complexes.find_complexes(structure),
+                         [{'ALPHA': 'DD', 'BETA': 'EE', 'MHC': 'AA', 'B2M': 'BB', 'PEPTIDE': 'CC'}])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import support
+from PDBS import clash, docking
+from PDBS.structure import parse_pdb
+
+
+class DockingTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        structure = parse_pdb(support.example('1ao7.pdb'), hetatm=False)
+        structure = structure.select(structure.primary_mask())
+        center, transpose = docking.canonical_frame(structure.coords)
+        structure.coords = (structure.coords - center) @ transpose
+        cls.tcr = structure.select(structure.chain_mask('DE'))
+        cls.pmhc = structure.select(structure.chain_mask('ABC'))
+
+    def setUp(self):
+        self.work = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.work)
+
+    def test_canonical_frame(self):
+        coords = np.random.default_rng(2).normal(size=(200, 3)) * [1.0, 5.0, 2.0]
+        center, transpose = docking.canonical_frame(coords)
+        np.testing.assert_allclose(transpose.T @ transpose, np.eye(3), atol=1e-9)
+        self.assertAlmostEqual(np.linalg.det(transpose), 1.0)
+        moved = (coords - center) @ transpose
+        spread = moved.var(axis=0)
+        self.assertTrue(spread[0] > spread[1] > spread[2])
+        self.assertTrue(moved[-1, 0] >= 0 and moved[-1, 1] >= 0)
+
+    def test_perturbation_sizes(self):
+        rotations, translations = docking.random_perturbations(500, 10.0, 3.0, seed=4)
+        self.assertLessEqual(np.degrees(rotations.magnitude()).max(), 10.0 + 1e-9)
+        self.assertLessEqual(np.linalg.norm(translations, axis=1).max(), 3.0 + 1e-9)
+        again = docking.random_perturbations(500, 10.0, 3.0, seed=4)
+        np.testing.assert_allclose(again[1], translations)
+        rotations, translations = docking.grid_perturbations(800)
+        self.assertEqual(len(translations), 3 ** 6)
+        self.assertEqual(len(rotations), len(translations))
+
+    def test_kept_starts_do_not_clash(self):
+        # The batched check must agree with a clash test of every move on its own
+        rotations, translations = docking.random_perturbations(40, 30.0, 8.0, seed=1)
+        kept = np.concatenate([index for index, _ in docking.iter_starts(self.tcr, self.pmhc, rotations,
+                                                                         translations)])
+        pivot = self.tcr.coords.mean(axis=0)
+        expected = []
+        for pos in range(len(translations)):
+            moved = self.tcr.select(np.ones(len(self.tcr), dtype=bool))
+            moved.coords = rotations[pos].apply(self.tcr.coords - pivot) + pivot + translations[pos]
+            if not clash.any_clash(moved, self.pmhc):
+                expected.append(pos)
+        self.assertEqual(kept.tolist(), expected)
+        self.assertLess(len(kept), len(translations))
+
+    def test_write_models_and_array(self):
+        rotations, translations = docking.random_perturbations(10, 3.0, 1.0, seed=0)
+        models = os.path.join(self.work, 'starts.pdb')
+        count = docking.write_models(models, self.tcr, self.pmhc,
+                                     docking.iter_starts(self.tcr, self.pmhc, rotations, translations))
+        with open(models) as file:
+            text = file.read()
+        self.assertEqual(text.count('ENDMDL'), count)
+        self.assertEqual(text.count('\nATOM  ') + text.startswith('ATOM'), count * (len(self.tcr) + len(self.pmhc)))
+        array = os.path.join(self.work, 'starts.npz')
+        frame = (np.zeros(3), np.eye(3))
+        saved = docking.write_array(array, self.tcr, self.pmhc, rotations, translations,
+                                    docking.iter_starts(self.tcr, self.pmhc, rotations, translations,
+                                                        with_coords=False), frame)
+        self.assertEqual(saved, count)
+        with np.load(array) as data:
+            self.assertEqual(data['quaternions'].shape, (count, 4))
+            self.assertEqual(data['tcr_coords'].shape, self.tcr.coords.shape)
+
+
+if __name__ == '__main__':
+    unittest.main()
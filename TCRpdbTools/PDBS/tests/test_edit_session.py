@@ -0,0 +1,74 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import support
+from PDBS.PDB_Tools_V3 import PdbTools3
+from PDBS.edit_session import EditSession
+from PDBS.structure import parse_pdb
+
+
+class EditSessionTest(unittest.TestCase):
+    def setUp(self):
+        self.work = tempfile.mkdtemp()
+        self.file_name = shutil.copy(support.example('1ao7.pdb'), self.work)
+        with open(self.file_name) as file:
+            self.original = file.read()
+
+    def tearDown(self):
+        shutil.rmtree(self.work)
+
+    def test_no_edits_round_trip(self):
+        self.assertEqual(EditSession(self.file_name).text(), self.original)
+
+    def test_trim_relabel_reorder(self):
+        with PdbTools3(self.file_name).edit() as session:
+            session.trim('D', 117)
+            session.relabel({'D': 'A', 'A': 'D'})
+            session.reorder('DA')
+        structure = parse_pdb(self.file_name, hetatm=False)
+        alpha = structure.comp_num[structure.chain_id == 'A']
+        self.assertLessEqual(alpha.max(), 117)
+        chains = list(dict.fromkeys(structure.chain_id.tolist()))
+        self.assertEqual(chains[:2], ['D', 'A'])
+
+    def test_mute_and_undo(self):
+        session = EditSession(self.file_name)
+        session.mute('chain C')
+        self.assertNotIn('C', set(session.structure().chain_id))
+        self.assertIn('DEATOM', session.text())
+        session.unmute('chain C and resi 1-3')
+        self.assertEqual(len(set(session.structure().comp_num[session.structure().chain_id == 'C'])), 3)
+        session.undo()
+        session.undo()
+        self.assertEqual(session.text(), self.original)
+        with self.assertRaises(ValueError):
+            session.undo()
+
+    def test_role_selection_follows_labels(self):
+        session = PdbTools3(self.file_name).edit()
+        session.relabel({'D': 'X'})
+        session.remove('alpha')
+        self.assertNotIn('X', set(session.structure().chain_id))
+        self.assertIn('E', set(session.structure().chain_id))
+        with self.assertRaises(ValueError):
+            EditSession(self.file_name).select('alpha')  # No context outside PdbTools3
+
+    def test_models_stay_in_place(self):
+        # MODEL/ENDMDL lines keep their place, reordering happens within each model
+        atom = "ATOM  %5d  CA  GLY %s   1       0.000   0.000   0.000  1.00  0.00           C\n"
+        models = os.path.join(self.work, 'models.pdb')
+        with open(models, 'w') as file:
+            for model in (1, 2):
+                file.write("MODEL        %d\n" % model + atom % (1, 'A') + atom % (2, 'B') + "ENDMDL\n")
+            file.write("END\n")
+        session = EditSession(models)
+        session.reorder('BA')
+        lines = [line[:6].strip() + line[21:22].strip() for line in session.lines()]
+        self.assertEqual(lines, ['MODEL', 'ATOMB', 'ATOMA', 'ENDMDL', 'MODEL', 'ATOMB', 'ATOMA', 'ENDMDL', 'END'])
+        self.assertEqual(len(session.structure()), 2)  # First model only
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import support
+from PDBS import germline
+from PDBS.PDB_Tools_V3 import PdbTools3
+
+
+class IndexTest(unittest.TestCase):
+    def test_shipped_index(self):
+        index = germline.load_index()
+        self.assertTrue(str(index['source']).startswith('anarci'))
+        self.assertEqual(set(index['types']), {'TRAV', 'TRBV'})
+        self.assertEqual(set(index['species']), {'Homo sapiens', 'Mus musculus'})
+        self.assertTrue((index['cys'] >= 0).all())
+
+    def test_build_from_fasta(self):
+        # Entries written back from the shipped index give the same germlines and loops
+        index = germline.load_index()
+        work = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, work)
+        fasta, out = os.path.join(work, 'TRAV12.fasta'), os.path.join(work, 'index.npz')
+        rows = [pos for pos, allele in enumerate(index['alleles']) if allele.startswith('TRAV12-2')]
+        with open(fasta, 'w') as file:
+            for pos in rows:
+                # Written without IMGT gaps, only the germlines are compared
+                file.write(">X|%s|%s|F|V-REGION|\n%s\n" % (index['alleles'][pos], index['species'][pos],
+                                                           index['germlines'][pos]))
+        self.assertEqual(germline.build_index([fasta], out), len(rows))
+        with np.load(out) as built:
+            self.assertEqual(list(built['germlines']), list(index['germlines'][rows]))
+            self.assertEqual(str(built['source']), 'TRAV12.fasta')
+
+    def test_gapped_loops(self):
+        gapped = 'QKEVEQNSGPLSVPEGAIASLNCTYSDRG......SQSFFWYRQYSGKSPELIMFIYS....NGDKED.....GRFTAQLNKASQYVSLLIRDSQPSDSATYL' \
+                 'CAVN'
+        seq, loops, cys = germline.gapped_loops(gapped)
+        self.assertEqual(seq[slice(*loops['CDR1'])], 'DRGSQS')
+        self.assertEqual(seq[slice(*loops['CDR2'])], 'IYSNGD')
+        self.assertEqual(seq[cys], 'C')
+
+    def test_gene_family(self):
+        self.assertEqual(germline.gene_family('TRAV12-2*01'), 'TRAV12')
+        self.assertEqual(germline.gene_family('TRAV29/DV5*01'), 'TRAV29')
+        self.assertEqual(germline.gene_family('TRAV14D-2*01'), 'TRAV14')
+        self.assertEqual(germline.gene_family('TRBV13-2*01'), 'TRBV13')
+
+
+class AnnotateTest(unittest.TestCase):
+    def test_annotate_file(self):
+        result = germline.annotate_file(support.example('1ao7.pdb'))
+        self.assertEqual((result['ALPHA']['gene'], result['BETA']['gene']), ('TRAV12-2*01', 'TRBV6-5*01'))
+        self.assertEqual(result['ALPHA']['CDR1'], ['DRGSQS', 26, 31])
+        self.assertEqual(result['BETA']['CDR3'], ['CASRPGLAGGRPEQYF', 92, 108])
+
+    def test_annotate_files_and_check(self):
+        files = [support.example(name) for name in ('1ao7.pdb', '2vlk.pdb', '3e3q.pdb')]
+        results = germline.annotate_files(files, workers=2)
+        self.assertEqual(list(results), files)
+        self.assertEqual(results[files[2]], {'ALPHA': {}, 'BETA': {}})  # No TCR
+        report = germline.check_subgroups(results, os.path.join(support.APP_DIR, 'api',
+                                                                '20221031_0310870_summary.tsv'))
+        self.assertTrue(all(row[-1] for row in report if row[0] != '3e3q'))
+
+    def test_pull_cdr_slots(self):
+        work = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, work)
+        alpha, beta = PdbTools3(shutil.copy(support.example('1ao7.pdb'), work)).pull_cdr()
+        self.assertEqual([loop[0] for loop in alpha], ['DRGSQS', 'IYSNGD', 'NKASQY', 'CAVTTDSWGKLQF'])
+        self.assertEqual(len(beta), 4)
+        # Truncated file: the chain taken as alpha is a constant domain, every slot is kept as None
+        alpha, beta = PdbTools3(shutil.copy(support.example('1g6r.pdb'), work)).pull_cdr()
+        self.assertEqual(alpha, [None, None, None, None])
+        self.assertEqual(len(beta), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import os
+import shutil
+import unittest
+
+import support
+from PDBS import library
+
+
+class TcrSequencesTest(unittest.TestCase):
+    def test_roles(self):
+        result = library.tcr_sequences(support.example('1ao7.pdb'))
+        self.assertEqual((result['pdb'], result['ALPHA'][0], result['BETA'][0]), ('1ao7', 'D', 'E'))
+        self.assertTrue(result['ALPHA'][1].startswith('KEVEQ'))
+
+    def test_no_tcr(self):
+        # pMHC only, reported as an error rather than a KeyError message
+        result = library.tcr_sequences(support.example('3e3q.pdb'))
+        self.assertIn("No TCR alpha/beta pair found", result['error'])
+
+
+class ExportTest(unittest.TestCase):
+    def setUp(self):
+        self.location = support.library('1ao7.pdb', '3e3q.pdb')
+
+    def tearDown(self):
+        shutil.rmtree(self.location)
+
+    def test_export(self):
+        fasta, table = os.path.join(self.location, 'out.fasta'), os.path.join(self.location, 'out.tsv')
+        for _ in range(2):  # Second run reads the cached roles
+            counts = library.export_sequences(self.location, fasta, table, workers=1)
+            self.assertEqual(counts['written'], 1)
+            self.assertEqual([pdb for pdb, _ in counts['errors']], ['3e3q'])
+        with open(fasta) as file:
+            lines = file.read().split('\n')
+        self.assertEqual(lines[0], '>1ao7')
+        self.assertTrue(all(len(line) <= library.FASTA_WIDTH for line in lines))
+        with open(table) as file:
+            rows = [line.split('\t') for line in file.read().split('\n') if line]
+        self.assertEqual([row[:3] for row in rows[1:]], [['1ao7', 'ALPHA', 'D'], ['1ao7', 'BETA', 'E']])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import support
+from PDBS import library_sync
+
+SUMMARY = os.path.join(support.APP_DIR, 'api', '20221031_0310870_summary.tsv')
+
+
+class SyncLibraryTest(unittest.TestCase):
+    def setUp(self):
+        self.location = support.library('1ao7.pdb', '2vlk.pdb')
+        self.work = tempfile.mkdtemp()
+        self.summary = os.path.join(self.work, 'summary.tsv')
+        with open(SUMMARY) as file:
+            self.header = file.readline().rstrip('\n').split('\t')
+            self.rows = [dict(zip(self.header, line.rstrip('\n').split('\t'))) for line in file
+                         if line.split('\t', 1)[0] in ('1ao7', '2vlk')]
+        self.write_summary()
+
+    def tearDown(self):
+        shutil.rmtree(self.location)
+        shutil.rmtree(self.work)
+
+    def write_summary(self):
+        with open(self.summary, 'w') as file:
+            file.write('\t'.join(self.header) + '\n')
+            for row in self.rows:
+                file.write('\t'.join(row[name] for name in self.header) + '\n')
+
+    def sync(self):
+        return library_sync.sync_library(self.location, self.summary, workers=1)
+
+    def test_first_sync(self):
+        counts = self.sync()
+        self.assertEqual((sorted(counts['added']), counts['errors']), (['1ao7', '2vlk'], []))
+        self.assertEqual(counts['catalog']['indexed'], 2)
+        entries = library_sync.load_manifest(self.location)['entries']
+        self.assertEqual(entries['1ao7']['file'], '1ao7.pdb')
+
+    def test_second_sync_is_a_no_op(self):
+        self.sync()
+        counts = self.sync()
+        self.assertEqual((sorted(counts['unchanged']), counts['catalog']), (['1ao7', '2vlk'], None))
+
+    def test_metadata_change_is_not_downloaded(self):
+        self.sync()
+        self.rows[0]['short_header'] = 'IMMUNE SYSTEM (CHANGED)'
+        self.write_summary()
+        with mock.patch.object(library_sync, 'fetch_entry', side_effect=AssertionError("downloaded")):
+            counts = self.sync()
+        self.assertEqual((counts['changed'], counts['errors']), ([self.rows[0]['pdb']], []))
+
+    def test_structure_change_is_downloaded(self):
+        self.sync()
+        self.rows[0]['resolution'] = '1.23'
+        self.write_summary()
+        pdb = self.rows[0]['pdb']
+        with mock.patch.object(library_sync, 'fetch_entry',
+                               side_effect=lambda location, pdb: os.path.join(location, pdb + '.pdb')) as fetch:
+            counts = self.sync()
+        fetch.assert_called_once_with(self.location, pdb)
+        self.assertEqual((counts['changed'], counts['errors']), ([pdb], []))
+
+    def test_removed_entry_is_retired(self):
+        self.sync()
+        self.rows = [row for row in self.rows if row['pdb'] != '2vlk']
+        self.write_summary()
+        counts = self.sync()
+        self.assertEqual((counts['retired'], counts['catalog']['removed']), (['2vlk'], 1))
+        self.assertTrue(os.path.exists(os.path.join(self.location, library_sync.RETIRED, '2vlk.pdb')))
+        self.assertNotIn('2vlk', library_sync.load_manifest(self.location)['entries'])
+
+
+if __name__ == '__main__':
+    unittest.main()
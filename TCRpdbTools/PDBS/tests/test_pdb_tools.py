@@ -0,0 +1,86 @@
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+from unittest import mock
+
+import support
+from PDBS import complexes
+from PDBS.PDB_Tools_V3 import PdbTools3
+from PDBS.structure import parse_pdb
+
+
+class TcrChainsTest(unittest.TestCase):
+    def setUp(self):
+        self.work = tempfile.mkdtemp()
+        self.file_name = shutil.copy(support.example('1ao7.pdb'), self.work)
+
+    def tearDown(self):
+        shutil.rmtree(self.work)
+
+    def test_roles_from_structure_cache(self):
+        PdbTools3(self.file_name).get_tcr_chains()  # Fills the structure cache, as prefetch does
+        with mock.patch.object(complexes, 'tcr_chains', side_effect=AssertionError("roles searched again")):
+            self.assertEqual(PdbTools3(self.file_name).get_tcr_chains(), {'ALPHA': 'D', 'BETA': 'E'})
+
+    def test_no_tcr(self):
+        with self.assertRaises(ValueError):
+            PdbTools3(shutil.copy(support.example('3e3q.pdb'), self.work)).get_tcr_chains()
+
+
+class SplitLinesTest(unittest.TestCase):
+    ATOM = "ATOM  %5d  CA  GLY %s%4d      %6.3f   0.000   0.000  1.00  0.00           C\n"
+
+    def setUp(self):
+        self.work = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.work, 'test.pdb')
+        with open(self.file_name, 'w') as file:
+            file.write(self.ATOM % (1, 'A', 1, 0.0) + self.ATOM % (2, 'A', 2, 3.8) + "TER\n")
+            file.write(self.ATOM % (10, 'D', 1, 7.6) + self.ATOM % (11, 'D', 2, 11.4) + "TER\n")
+            file.write("CONECT   10   11\n" + "CONECT    1    2\n" + "END\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.work)
+
+    def test_bare_ter_and_blank_bonds(self):
+        for renumber, bond in ((True, "CONECT    1    2\n"), (False, "CONECT   10   11\n")):
+            lines = PdbTools3(self.file_name).split_lines({'TCR': 'D'}, renumber)['TCR']
+            self.assertEqual([line for line in lines if line.startswith('CONECT')], [bond])
+            self.assertEqual(sum(line.startswith('TER') for line in lines), 1)
+
+
+class SplitComponentsTest(unittest.TestCase):
+    def setUp(self):
+        self.work = tempfile.mkdtemp()
+        self.pdb = PdbTools3(shutil.copy(support.example('1ao7.pdb'), self.work))
+
+    def tearDown(self):
+        shutil.rmtree(self.work)
+
+    def test_components(self):
+        self.assertEqual(self.pdb.component_chains(), {'TCR': 'DE', 'MHC': 'A', 'PEPTIDE': 'C', 'PMHC': 'AC'})
+        names = self.pdb.split_components()
+        self.assertEqual(os.path.basename(names['PMHC']), '1ao7_pmhc.pdb')
+        whole = parse_pdb(self.pdb.file_name)
+        for component, chains in (('TCR', 'DE'), ('MHC', 'A'), ('PEPTIDE', 'C'), ('PMHC', 'AC')):
+            part = parse_pdb(names[component])
+            expected = whole.select(whole.chain_mask(chains))
+            self.assertEqual(set(part.chain_id), set(chains))
+            self.assertEqual(part.atom_num.tolist(), list(range(1, len(part) + 1)))  # Renumbered
+            self.assertEqual(part.coords.tolist(), expected.coords.tolist())
+
+    def test_archive(self):
+        zip_name = self.pdb.split_archive(components=('TCR', 'PEPTIDE'))
+        with zipfile.ZipFile(zip_name) as archive:
+            self.assertEqual(sorted(archive.namelist()), ['1ao7_peptide.pdb', '1ao7_tcr.pdb'])
+            peptide = archive.read('1ao7_peptide.pdb').decode()
+        self.assertEqual({line[21] for line in peptide.splitlines() if line.startswith('ATOM')}, {'C'})
+
+    def test_missing_component(self):
+        with self.assertRaises(ValueError):
+            PdbTools3(shutil.copy(support.example('3e3q.pdb'), self.work)).component_chains(('TCR',))
+
+
+if __name__ == '__main__':
+    unittest.main()
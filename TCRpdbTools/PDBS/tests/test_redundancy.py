@@ -0,0 +1,54 @@
+import random
+import unittest
+
+import support  # noqa: F401
+from PDBS import redundancy
+
+
+def edit_distance(seq_1, seq_2):
+    previous = list(range(len(seq_2) + 1))
+    for row, first in enumerate(seq_1, 1):
+        current = [row]
+        for col, second in enumerate(seq_2, 1):
+            current.append(min(previous[col] + 1, current[col - 1] + 1, previous[col - 1] + (first != second)))
+        previous = current
+    return previous[-1]
+
+
+class BandedDistanceTest(unittest.TestCase):
+    def test_matches_full_alignment(self):
+        rng = random.Random(1)
+        firsts, seconds = [], []
+        for _ in range(500):
+            seq = [rng.choice('ACDE') for _ in range(rng.randint(0, 15))]
+            edited = list(seq)
+            for _ in range(rng.randint(0, 4)):
+                if edited and rng.random() < 0.5:
+                    del edited[rng.randrange(len(edited))]
+                else:
+                    edited.insert(rng.randint(0, len(edited)), rng.choice('ACDE'))
+            firsts.append(''.join(seq))
+            seconds.append(''.join(edited))
+        for band in (0, 2, 5):
+            expected = [min(edit_distance(a, b), band + 1) for a, b in zip(firsts, seconds)]
+            self.assertEqual(redundancy.banded_distances(firsts, seconds, band).tolist(), expected)
+
+
+class CandidatePairsTest(unittest.TestCase):
+    def test_repeated_kmer(self):
+        # A repeated 5-mer is only counted once by the presence matrix, the pair must still be a candidate
+        rng = random.Random(3)
+        base = ''.join(rng.choice('ACDEFGHIKLMNPQRSTVWY') for _ in range(100))
+        seq_1 = (base[:20] + 'KLMNP' + base[20:60] + 'KLMNP' + base[60:])[:110]
+        seq_2 = seq_1[:90] + ('A' if seq_1[90] != 'A' else 'C') + seq_1[91:]
+        self.assertEqual(redundancy.candidate_pairs([seq_1, seq_2], 0.99).tolist(), [[0, 1]])
+        result = redundancy.chain_identities([seq_1, seq_2], 0.99, workers=1)
+        self.assertAlmostEqual(result[0, 1], 1 - 1 / 110)
+
+    def test_below_identity(self):
+        self.assertEqual(redundancy.pair_identity('ACDEFGHIKL', 'ACDEFGHWWW', 0.9), 0.0)
+        self.assertAlmostEqual(redundancy.pair_identity('ACDEFGHIKL', 'ACDEFGHIKW', 0.9), 0.9)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+
+import numpy as np
+
+import support
+from PDBS import sasa
+from PDBS.structure import parse_pdb
+
+
+class ShrakeRupleyTest(unittest.TestCase):
+    def test_isolated_atoms(self):
+        coords = np.array([[0.0, 0.0, 0.0], [50.0, 0.0, 0.0]])
+        radii = np.array([1.7, 1.52])
+        expected = 4 * np.pi * (radii + sasa.PROBE) ** 2
+        np.testing.assert_allclose(sasa.shrake_rupley(coords, radii), expected)
+
+    def test_buried_atom(self):
+        # An atom inside a tight shell of others has no accessible surface
+        shell = np.vstack([np.eye(3), -np.eye(3)]) * 1.5
+        coords = np.vstack([[0.0, 0.0, 0.0], shell])
+        result = sasa.shrake_rupley(coords, np.full(len(coords), 1.7), probe=0.0)
+        self.assertEqual(result[0], 0.0)
+        self.assertTrue((result[1:] > 0).all())
+
+    def test_subset(self):
+        rng = np.random.default_rng(0)
+        coords = rng.uniform(0, 12, (60, 3))
+        radii = np.full(60, 1.7)
+        subset = np.array([3, 10, 42])
+        np.testing.assert_allclose(sasa.shrake_rupley(coords, radii, subset=subset),
+                                   sasa.shrake_rupley(coords, radii)[subset])
+
+
+class InterfaceTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        structure = parse_pdb(support.example('1ao7.pdb'))
+        cls.structure = structure.select(structure.primary_mask())
+
+    def test_matches_separate_partners(self):
+        # Only atoms near the other partner are recomputed, the result must equal scoring each partner alone
+        result = sasa.interface_sasa(self.structure, 'DE', 'AC', n_points=30)
+        tcr = sasa.structure_sasa(self.structure.select(self.structure.chain_mask('DE')), n_points=30)
+        pmhc = sasa.structure_sasa(self.structure.select(self.structure.chain_mask('AC')), n_points=30)
+        separated = dict(tcr, **pmhc)
+        self.assertEqual(set(result['separated']), set(separated))
+        for label, value in separated.items():
+            self.assertAlmostEqual(result['separated'][label], value, places=6)
+        self.assertAlmostEqual(result['bsa'], sum(result['delta'].values()), places=4)
+
+    def test_buried_surface_area(self):
+        result = sasa.interface_sasa(self.structure, 'DE', 'AC', n_points=30)
+        # 1ao7 buries roughly 1800 square angstroms over both partners
+        self.assertGreater(result['bsa'], 1200)
+        self.assertLess(result['bsa'], 2600)
+        self.assertTrue(all(value >= -1e-6 for value in result['delta'].values()))
+
+
+if __name__ == '__main__':
+    unittest.main()
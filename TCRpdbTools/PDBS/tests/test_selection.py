@@ -0,0 +1,60 @@
+import unittest
+
+import numpy as np
+
+import support
+from PDBS import selection
+from PDBS.selection import Context, select_mask
+from PDBS.structure import parse_pdb
+
+
+class SelectionTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.structure = parse_pdb(support.example('1ao7.pdb'), hetatm=False)
+        cls.context = Context(cls.structure)
+
+    def select(self, text):
+        return select_mask(self.structure, text, self.context)
+
+    def test_fields_and_ranges(self):
+        s = self.structure
+        mask = self.select('chain D and resi 1-10,95- and name CA')
+        residues = ((s.comp_num >= 1) & (s.comp_num <= 10)) | (s.comp_num >= 95)
+        expected = (s.chain_id == 'D') & (s.atom_id == 'CA') & residues
+        np.testing.assert_array_equal(mask, expected)
+        np.testing.assert_array_equal(self.select('name C*'), np.char.startswith(s.atom_id.astype(str), 'C'))
+        np.testing.assert_array_equal(self.select('backbone'), np.isin(s.atom_id, ('N', 'CA', 'C', 'O')))
+
+    def test_precedence(self):
+        # not binds tighter than and, and tighter than or
+        np.testing.assert_array_equal(self.select('chain A or chain B and not name CA'),
+                                      self.select('chain A or (chain B and (not name CA))'))
+        self.assertFalse(self.select('none').any())
+        self.assertTrue(self.select('all').all())
+
+    def test_roles_and_loops(self):
+        np.testing.assert_array_equal(self.select('alpha'), self.structure.chain_id == 'D')
+        np.testing.assert_array_equal(self.select('tcr'), self.structure.chain_mask('DE'))
+        np.testing.assert_array_equal(self.select('peptide'), self.structure.chain_id == 'C')
+        cdr3b = self.select('cdr3b and name CA')
+        self.assertTrue(cdr3b.any())
+        self.assertTrue((self.structure.chain_id[cdr3b] == 'E').all())
+        residues = ''.join(selection.THREE_TO_ONE[name] for name in self.structure.atom_comp_id[cdr3b])
+        self.assertEqual(residues, 'CASRPGLAGGRPEQYF')
+
+    def test_cached_and_read_only(self):
+        mask = self.select('chain E')
+        self.assertIs(self.select('chain E'), mask)
+        self.assertFalse(mask.flags.writeable)
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            select_mask(self.structure, 'alpha')  # Needs a context
+        for text in ('chain', 'chain D and', '(chain D', 'resi x-y', 'colour red'):
+            with self.assertRaises(ValueError, msg=text):
+                selection.compile_selection(text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import support  # noqa: F401
+from PDBS import single_flight
+
+
+class SharedTest(unittest.TestCase):
+    def setUp(self):
+        self.work = tempfile.mkdtemp()
+        self.flights = os.path.join(self.work, 'flights')
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def tearDown(self):
+        shutil.rmtree(self.work)
+
+    def compute(self, text="result"):
+        def run():
+            with self.lock:
+                self.calls += 1
+                name = os.path.join(self.work, 'out%d.txt' % self.calls)
+            time.sleep(0.05)
+            with open(name, 'w') as file:
+                file.write(text)
+            return name
+        return run
+
+    def test_concurrent_callers_share_one_result(self):
+        key = single_flight.flight_key("process", "1ao7", ["center"])
+        with ThreadPoolExecutor(8) as executor:
+            results = list(executor.map(lambda _: single_flight.shared(key, self.compute(), flight_dir=self.flights),
+                                        range(8)))
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(len(set(results)), 1)
+        with open(results[0]) as file:
+            self.assertEqual(file.read(), "result")
+        self.assertEqual(os.path.basename(results[0]), 'out1.txt')
+
+    def test_keys_are_separate(self):
+        self.assertNotEqual(single_flight.flight_key("a", [1]), single_flight.flight_key("a", [2]))
+        single_flight.shared('one', self.compute(), flight_dir=self.flights)
+        single_flight.shared('two', self.compute(), flight_dir=self.flights)
+        self.assertEqual(self.calls, 2)
+
+    def test_failure_stores_nothing(self):
+        def fail():
+            raise RuntimeError("failed")
+        with self.assertRaises(RuntimeError):
+            single_flight.shared('key', fail, flight_dir=self.flights)
+        single_flight.shared('key', self.compute(), flight_dir=self.flights)
+        self.assertEqual(self.calls, 1)
+
+    def test_expired_result_computed_again(self):
+        first = single_flight.shared('key', self.compute(), ttl=0, flight_dir=self.flights)
+        second = single_flight.shared('key', self.compute(), ttl=300, flight_dir=self.flights)
+        self.assertEqual(self.calls, 2)
+        self.assertNotEqual(first, second)
+        single_flight.shared('key', self.compute(), flight_dir=self.flights)
+        self.assertEqual(self.calls, 2)
+
+    def test_prune(self):
+        single_flight.shared('old', self.compute(), ttl=0, flight_dir=self.flights)
+        kept = single_flight.shared('new', self.compute(), ttl=300, flight_dir=self.flights)
+        later = time.time() + single_flight.GRACE + 1
+        with mock.patch.object(single_flight.time, 'time', return_value=later):
+            self.assertEqual(single_flight.prune(self.flights), 1)
+        self.assertFalse(os.path.exists(os.path.join(self.flights, 'old')))
+        self.assertTrue(os.path.exists(kept))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import support
+from PDBS import stcrdat
+
+SUMMARY = os.path.join(support.APP_DIR, 'api', '20221031_0310870_summary.tsv')
+
+
+class SummaryIndexTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.work = tempfile.mkdtemp()
+        cls.summary = shutil.copy(SUMMARY, cls.work)
+        cls.index = stcrdat.load_summary(cls.summary)
+        with open(SUMMARY) as file:
+            header = file.readline().rstrip('\n').split('\t')
+            first = {}
+            for line in file:
+                row = dict(zip(header, line.rstrip('\n').split('\t')))
+                first.setdefault(row['pdb'], row)  # The index describes each ID by its first row
+        cls.rows = list(first.values())
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.work)
+
+    def ids(self, filters=None, search=None):
+        return set(self.index.ids_matching(filters, search))
+
+    def test_snapshot(self):
+        snapshot = stcrdat.snapshot_file(self.summary)
+        self.assertTrue(os.path.exists(snapshot))
+        built = stcrdat.SummaryIndex.from_tsv(self.summary)
+        mapped = stcrdat.read_snapshot(snapshot)
+        self.assertEqual(mapped.ids.tolist(), built.ids.tolist())
+        self.assertEqual(mapped.query(size=5), built.query(size=5))
+
+    def test_filters(self):
+        expected = {row['pdb'] for row in self.rows if row['mhc_type'] == 'MH1'}
+        self.assertEqual(self.ids({'mhc_type': 'mh1'}), expected)
+        self.assertEqual(self.ids({'pdb': '1ao7'}), {'1ao7'})
+        self.assertEqual(self.ids(search='1ao'), {row['pdb'] for row in self.rows if row['pdb'].startswith('1ao')})
+        organisms = {row['pdb'] for row in self.rows if 'homo sapiens' in row['beta_organism'].split(', ')}
+        self.assertEqual(self.ids({'beta_organism': 'Homo Sapiens'}), organisms)
+
+    def test_numeric_and_date_ranges(self):
+        resolution = {row['pdb'] for row in self.rows if 1.5 <= stcrdat.number(row['resolution']) <= 2.0}
+        self.assertEqual(self.ids({'resolution': '1.5:2.0'}), resolution)
+
+        def year(row):
+            return 2000 + int(row['date'].split('/')[2]) if row['date'] not in stcrdat.MISSING else None
+        self.assertEqual(self.ids({'date': '2010'}), {row['pdb'] for row in self.rows if year(row) == 2010})
+        self.assertEqual(self.ids({'date': '2010-03:2012'}),
+                         {row['pdb'] for row in self.rows if year(row) in (2010, 2011, 2012) and
+                          (year(row) > 2010 or int(row['date'].split('/')[0]) >= 3)})
+        for bad in ('2010-3', '10/2010', 'last year'):
+            with self.assertRaises(ValueError, msg=bad):
+                self.index.query({'date': bad})
+        with self.assertRaises(ValueError):
+            self.index.query({'resolution': 'high'})
+
+    def test_sort_and_pages(self):
+        result = self.index.query({'mhc_type': 'MH1'}, sort='-resolution', page=2, size=10,
+                                  fields=['pdb', 'resolution'])
+        self.assertEqual((result['page'], result['size'], len(result['results'])), (2, 10, 10))
+        self.assertEqual(result['pages'], -(-result['count'] // 10))
+        values = [row['resolution'] for row in result['results']]
+        self.assertEqual(values, sorted(values, reverse=True))
+        self.assertEqual(set(result['results'][0]), {'pdb', 'resolution'})
+        with self.assertRaises(ValueError):
+            self.index.query(page=0)
+        with self.assertRaises(ValueError):
+            self.index.query(fields=['colour'])
+
+    def test_etag(self):
+        self.assertEqual(self.index.etag(filters={'a': 1}), self.index.etag(filters={'a': 1}))
+        self.assertNotEqual(self.index.etag(page=1), self.index.etag(page=2))
+        self.assertTrue(np.all(self.index.ids[:-1] <= self.index.ids[1:]))
+
+
+if __name__ == '__main__':
+    unittest.main()
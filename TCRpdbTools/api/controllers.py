@@ -12,7 +12,7 @@ from rest_framework.response import Response
 from rest_framework import status
 #from django.shortcuts import render_to_response
 from django.template import RequestContext
-from django.http import FileResponse
+from django.http import FileResponse, StreamingHttpResponse
 
 from django.shortcuts import *
 
@@ -21,6 +21,7 @@ from django.db import models
 from django.contrib.auth.models import *
 from api.models import *
 from api.serializers import TcrRequestSerializer
+from api import request_log
 
 #REST API
 from rest_framework import viewsets, filters, parsers, renderers
@@ -41,11 +42,23 @@ import json, datetime, pytz
 from django.core import serializers
 import requests
 from django.http import JsonResponse
+from django.db.models import Sum
+from django.utils import timezone
 from PDBS.process_pdb_request import *
+from PDBS import cdr3_search, stcrdat
 
 
 PDB_URL = "1bd2.pdb"
 
+
+def day_start(value, days=0):
+    # Start of a YYYY-MM-DD day (plus some days) in the server time zone, None when no day is given
+    if not value:
+        return None
+    day = datetime.date.fromisoformat(value) + datetime.timedelta(days=days)
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
 class FetchPdb(APIView):
     permission_classes = (AllowAny,)
 
@@ -53,6 +66,12 @@ class FetchPdb(APIView):
         global PDB_URL
         pdb = request.data.get('pdb')
         PDB_URL = pdb
+        # Warm the download and parse caches for the submit that usually follows, ex. "1ao7", "1ao7.pdb" or a URL
+        pdb_id = os.path.basename(str(pdb or '')).split('.')[0]
+        if request.data.get('cancel') in ("true", "True", "1", True):
+            cancel_prefetch(pdb_id or None)
+        else:
+            prefetch(pdb_id)
         return Response("Success", status=status.HTTP_200_OK)
 
 
@@ -69,8 +88,55 @@ class ActionList(APIView):
 class PdbList(APIView):
     permission_classes = (AllowAny,)
 
+    # Query parameters that are not column filters
+    QUERY_PARAMS = ('q', 'sort', 'page', 'size', 'fields', 'format')
+
+    def get(self, request, format=None):
+        # Without parameters every ID, as the dropdown always loaded them. With any, a page of the summary index:
+        # column=value filters, q=ID prefix, sort=[-]column, page, size and fields=comma separated columns
+        params = request.GET
+        if not params:
+            return Response([pdb[0] for pdb in pdb_choices()], status=status.HTTP_200_OK)
+        index = stcrdat.load_summary()
+        query = {
+            'filters': {name: value for name, value in params.items() if name not in self.QUERY_PARAMS},
+            'search': params.get('q') or None,
+            'sort': params.get('sort') or 'pdb',
+            'page': params.get('page') or 1,
+            'size': params.get('size') or stcrdat.PAGE_SIZE,
+            'fields': params.get('fields').split(',') if params.get('fields') else None,
+        }
+        etag = index.etag(**query)
+        matches = [tag.strip().replace('W/', '', 1) for tag in request.META.get('HTTP_IF_NONE_MATCH', '').split(',')]
+        if etag in matches or '*' in matches:
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+            response['ETag'] = etag
+            return response
+        try:
+            result = index.query(**query)
+        except ValueError as error:
+            return Response(str(error), status=status.HTTP_400_BAD_REQUEST)
+        response = Response(result, status=status.HTTP_200_OK)
+        response['ETag'] = etag
+        return response
+
+
+class Cdr3Search(APIView):
+    permission_classes = (AllowAny,)
+
     def get(self, request, format=None):
-        return Response([pdb[0] for pdb in PDB_CHOICES], status=status.HTTP_200_OK)
+        seq = request.GET.get('seq', '')
+        if not seq:
+            return Response("Missing seq", status=status.HTTP_400_BAD_REQUEST)
+        try:
+            top = min(int(request.GET.get('top', 10)), 100)
+            hits = cdr3_search.search(seq, top, request.GET.get('chain_type') or None,
+                                      request.GET.get('metric', 'edit'))
+        except FileNotFoundError as error:
+            return Response(str(error), status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        except ValueError as error:
+            return Response(str(error), status=status.HTTP_400_BAD_REQUEST)
+        return Response(hits, status=status.HTTP_200_OK)
 
 
 class TcrRequestList(APIView):
@@ -78,44 +144,163 @@ class TcrRequestList(APIView):
     parser_classes = (parsers.JSONParser, parsers.FormParser)
     renderer_classes = (renderers.JSONRenderer,)
 
+    PAGE_SIZE = 100
+    MAX_PAGE_SIZE = 1000
+
     def get(self, request, format=None):
-        tcrrequest = TcrRequest.objects.all()
-        json_data = serializers.serialize('json', tcrrequest)
-        content = {'tcrrequest': json_data}
-        return HttpResponse(json_data, content_type='json')
+        # Newest first, one page at a time (keyset on the ID, so deep pages cost the same as the first): size,
+        # before=<ID> as given by the Link header of the previous page, and pdb, action, since and until filters
+        try:
+            size = min(int(request.GET.get('size') or self.PAGE_SIZE), self.MAX_PAGE_SIZE)
+            before = request.GET.get('before')
+            since, until = day_start(request.GET.get('since')), day_start(request.GET.get('until'), 1)
+            tcrrequest = TcrRequest.objects.order_by('-id')
+            if before:
+                tcrrequest = tcrrequest.filter(id__lt=int(before))
+        except ValueError as error:
+            return Response(str(error), status=status.HTTP_400_BAD_REQUEST)
+        if size < 1:
+            return Response("size is 1 to %d" % self.MAX_PAGE_SIZE, status=status.HTTP_400_BAD_REQUEST)
+        if request.GET.get('pdb'):
+            tcrrequest = tcrrequest.filter(pdb=request.GET['pdb'].lower())
+        action = request.GET.get('action')
+        if action:
+            tcrrequest = tcrrequest.filter(models.Q(action1=action) | models.Q(action2=action) |
+                                           models.Q(action3=action))
+        if since:
+            tcrrequest = tcrrequest.filter(created__gte=since)
+        if until:
+            tcrrequest = tcrrequest.filter(created__lt=until)
+        page = list(tcrrequest[:size])
+        json_data = serializers.serialize('json', page)
+        response = HttpResponse(json_data, content_type='json')
+        if len(page) == size:
+            query = request.GET.copy()
+            query['before'] = page[-1].id
+            response['Link'] = '<%s>; rel="next"' % request.build_absolute_uri('?' + query.urlencode())
+        return response
 
     def post(self, request, *args, **kwargs):
-        print("We have received api call")
         pdb = request.data.get('pdb')
         action1 = request.data.get('action1')
         action2 = request.data.get('action2')
         action3 = request.data.get('action3')
 
         newRequest = TcrRequest(
-            pdb=pdb,
+            pdb=pdb.lower() if isinstance(pdb, str) else pdb,
             action1=action1,
             action2=action2,
             action3=action3,
         )
 
-        newRequest.save()
+        request_log.log([newRequest])
 
         # Process PDB request and return pdb
         pdb = request.POST.get('pdb')
         actions = [request.POST.get('action1'), request.POST.get('action2'), request.POST.get('action3')]
-        print("ACTIONS: ", actions)
-        context = {"pdb": pdb, "actions": actions}
+        all_copies = request.POST.get('all_copies') in ("true", "True", "1")
+        context = {"pdb": pdb, "actions": actions, "all_copies": all_copies}
         pdb_path = process_modification(context)
         pdb = pdb_path.split('/')[-1]
-        print('New Event Logged')
         pdb_file = open(pdb_path, "rb")
-        response = FileResponse(pdb_file, content_type="application/text")
+        content_type = "application/zip" if pdb.endswith(".zip") else "application/text"
+        response = FileResponse(pdb_file, content_type=content_type)
         response['Content-Length'] = os.path.getsize(pdb_path)
         response['Content-Disposition'] = 'attachment; filename="%s"' % pdb
         return response
         # return Response({'success': True}, status=status.HTTP_200_OK)
 
 
+class TcrBatch(APIView):
+    permission_classes = (AllowAny,)
+    parser_classes = (parsers.JSONParser, parsers.FormParser)
+
+    def post(self, request, *args, **kwargs):
+        # PDB IDs as a list or comma separated, or summary TSV column filters ({"mhc_type": "MH1"}), one pipeline
+        pdbs = request.data.get('pdbs') or []
+        if isinstance(pdbs, str):
+            pdbs = pdbs.replace(",", " ").split()
+        if not isinstance(pdbs, list) or not all(isinstance(pdb, str) for pdb in pdbs):
+            return Response("pdbs is a list of PDB IDs or a comma separated string", status=status.HTTP_400_BAD_REQUEST)
+        column_filters = request.data.get('filters') or {}
+        try:
+            if isinstance(column_filters, str):
+                column_filters = json.loads(column_filters)
+            if not isinstance(column_filters, dict):
+                raise ValueError("filters is an object of summary column -> value")
+            if column_filters:
+                pdbs = pdbs + filter_ids(column_filters)
+        except ValueError as error:
+            return Response(str(error), status=status.HTTP_400_BAD_REQUEST)
+        pdbs = list(dict.fromkeys(pdb.lower() for pdb in pdbs))
+        bad = [pdb for pdb in pdbs if not PDB_ID.match(pdb)]
+        if bad:
+            return Response("Not PDB IDs: " + ", ".join(bad), status=status.HTTP_400_BAD_REQUEST)
+        if not pdbs:
+            return Response("No PDB IDs given or matched", status=status.HTTP_400_BAD_REQUEST)
+        if len(pdbs) > MAX_BATCH:
+            return Response("At most %d PDB IDs per batch, got %d" % (MAX_BATCH, len(pdbs)),
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        actions = request.data.get('actions')
+        if actions is None:
+            actions = [request.data.get('action%d' % pos) for pos in (1, 2, 3)]
+        elif isinstance(actions, str):
+            actions = actions.replace(",", " ").split()
+        if not isinstance(actions, list) or not all(action is None or isinstance(action, str) for action in actions):
+            return Response("actions is a list of actions or a comma separated string",
+                            status=status.HTTP_400_BAD_REQUEST)
+        actions = [action for action in actions if action and action != "None"]
+        known = [choice[0] for choice in FUNCTION_CHOICES]
+        unknown = [action for action in actions if action not in known]
+        if unknown:
+            return Response("Unknown actions: " + ", ".join(unknown), status=status.HTTP_400_BAD_REQUEST)
+
+        logged = (actions + ["None"] * 3)[:3]
+        request_log.log([TcrRequest(pdb=pdb, action1=logged[0], action2=logged[1], action3=logged[2]) for pdb in pdbs])
+
+        response = StreamingHttpResponse(stream_batch(pdbs, actions), content_type="application/zip")
+        response['Content-Disposition'] = 'attachment; filename="batch_%d.zip"' % len(pdbs)
+        return response
+
+
+class UsageStats(APIView):
+    permission_classes = (IsAdminUser,)
+    GROUPS = ('day', 'pdb', 'action')
+    MAX_TOP = 1000
+
+    def get(self, request, format=None):
+        # Request counts read from the daily aggregates, never the request log: group=day, pdb and/or action
+        # (comma separated), optional pdb, action, since and until (YYYY-MM-DD) filters and top rows returned
+        groups = [group for group in (request.GET.get('group') or 'day').split(',') if group]
+        unknown = [group for group in groups if group not in self.GROUPS]
+        if unknown or not groups:
+            return Response("group is any of " + ", ".join(self.GROUPS), status=status.HTTP_400_BAD_REQUEST)
+        try:
+            top = min(int(request.GET.get('top') or 100), self.MAX_TOP)
+            since, until = request.GET.get('since'), request.GET.get('until')
+            since = datetime.date.fromisoformat(since) if since else None
+            until = datetime.date.fromisoformat(until) if until else None
+        except ValueError as error:
+            return Response(str(error), status=status.HTTP_400_BAD_REQUEST)
+        usage = DailyUsage.objects.all()
+        if request.GET.get('action'):
+            usage = usage.filter(action=request.GET['action'])
+        elif 'action' in groups:
+            usage = usage.exclude(action=ALL_ACTIONS)
+        else:
+            usage = usage.filter(action=ALL_ACTIONS)
+        if request.GET.get('pdb'):
+            usage = usage.filter(pdb=request.GET['pdb'].lower())
+        if since:
+            usage = usage.filter(day__gte=since)
+        if until:
+            usage = usage.filter(day__lte=until)
+        order = ['-day'] if groups == ['day'] else ['-requests'] + groups
+        rows = usage.values(*groups).annotate(requests=Sum('count')).order_by(*order)[:top]
+        return Response(list(rows), status=status.HTTP_200_OK)
+
+
 class TcrRequestDetail(APIView):
     permission_classes = (AllowAny,)
 
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='tcrrequest',
+            name='action1',
+            field=models.CharField(choices=[('None', 'None'), ('center', 'Center'), ('split_tcr', 'Split TCR'), ('clean_docking_count_non_tcr', 'Clean Count'), ('clean_tcr_count_trim', 'Trim TCR'), ('split_mhc', 'Split MHC'), ('split_p', 'Split Peptide'), ('split_pmhc', 'Split pMHC'), ('clean_pdb', 'Full Clean'), ('split_all', 'Split All Components (zip)')], max_length=50),
+        ),
+        migrations.AlterField(
+            model_name='tcrrequest',
+            name='action2',
+            field=models.CharField(choices=[('None', 'None'), ('center', 'Center'), ('split_tcr', 'Split TCR'), ('clean_docking_count_non_tcr', 'Clean Count'), ('clean_tcr_count_trim', 'Trim TCR'), ('split_mhc', 'Split MHC'), ('split_p', 'Split Peptide'), ('split_pmhc', 'Split pMHC'), ('clean_pdb', 'Full Clean'), ('split_all', 'Split All Components (zip)')], max_length=50),
+        ),
+        migrations.AlterField(
+            model_name='tcrrequest',
+            name='action3',
+            field=models.CharField(choices=[('None', 'None'), ('center', 'Center'), ('split_tcr', 'Split TCR'), ('clean_docking_count_non_tcr', 'Clean Count'), ('clean_tcr_count_trim', 'Trim TCR'), ('split_mhc', 'Split MHC'), ('split_p', 'Split Peptide'), ('split_pmhc', 'Split pMHC'), ('clean_pdb', 'Full Clean'), ('split_all', 'Split All Components (zip)')], max_length=50),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:00
+
+import api.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_alter_tcrrequest_actions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='tcrrequest',
+            name='pdb',
+            field=models.CharField(choices=api.models.pdb_choices, max_length=4),
+        ),
+    ]
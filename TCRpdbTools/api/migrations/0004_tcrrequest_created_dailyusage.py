@@ -0,0 +1,69 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:00
+
+from collections import Counter
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def count_logged(apps, schema_editor):
+    # Build the daily usage of the requests logged so far, they all carry the time of this migration
+    TcrRequest = apps.get_model('api', 'TcrRequest')
+    DailyUsage = apps.get_model('api', 'DailyUsage')
+    counts = Counter()
+    for pdb, created, *actions in TcrRequest.objects.values_list('pdb', 'created', 'action1', 'action2', 'action3')\
+            .iterator(chunk_size=10000):
+        day = django.utils.timezone.localdate(created)
+        for action in ['*'] + sorted(set(action for action in actions if action and action != "None")):
+            counts[(day, pdb, action)] += 1
+    DailyUsage.objects.bulk_create([DailyUsage(day=day, pdb=pdb, action=action, count=count)
+                                    for (day, pdb, action), count in counts.items()], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_alter_tcrrequest_pdb'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('pdb', models.CharField(max_length=4)),
+                ('action', models.CharField(max_length=50)),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='tcrrequest',
+            name='created',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='tcrrequest',
+            index=models.Index(fields=['pdb', 'id'], name='tcrrequest_pdb_id'),
+        ),
+        migrations.AddIndex(
+            model_name='tcrrequest',
+            index=models.Index(fields=['action1'], name='tcrrequest_action1'),
+        ),
+        migrations.AddIndex(
+            model_name='tcrrequest',
+            index=models.Index(fields=['action2'], name='tcrrequest_action2'),
+        ),
+        migrations.AddIndex(
+            model_name='tcrrequest',
+            index=models.Index(fields=['action3'], name='tcrrequest_action3'),
+        ),
+        migrations.AddIndex(
+            model_name='dailyusage',
+            index=models.Index(fields=['day', 'action'], name='dailyusage_day_action'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyusage',
+            constraint=models.UniqueConstraint(fields=('day', 'pdb', 'action'), name='dailyusage_key'),
+        ),
+        migrations.RunPython(count_logged, migrations.RunPython.noop),
+    ]
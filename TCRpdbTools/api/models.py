@@ -1,5 +1,8 @@
-from django.db import models
+from collections import Counter
+from django.db import models, transaction, IntegrityError
+from django.db.models import F
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 
 User = get_user_model()
 
@@ -7,26 +10,76 @@ User = get_user_model()
 FUNCTION_CHOICES = [("None", "None"), ("center", "Center"), ("split_tcr", "Split TCR"),
                     ("clean_docking_count_non_tcr", "Clean Count"), ("clean_tcr_count_trim", "Trim TCR"),
                     ("split_mhc", "Split MHC"), ("split_p", "Split Peptide"), ("split_pmhc", "Split pMHC"),
-                    ("clean_pdb", "Full Clean")]
+                    ("clean_pdb", "Full Clean"), ("split_all", "Split All Components (zip)")]
 
-PDB_CHOICES = []
+ALL_ACTIONS = "*"  # Action of the DailyUsage rows counting every request of a PDB
 
-with open("api/20221031_0310870_summary.tsv", "r") as f:
-    for line in f:
-        pdb = line.split("\t")[0]
-        if pdb == "pdb":
-            pass
-        else:
-            PDB_CHOICES.append((pdb, pdb))
 
-PDB_CHOICES = sorted(PDB_CHOICES, key=lambda x: x[0])
+def pdb_choices():
+    # IDs of the newest STCRDat summary, mapped from its compiled snapshot on first use instead of at import
+    from PDBS.stcrdat import load_summary
+    return [(pdb, pdb) for pdb in load_summary().ids.tolist()]
 
 
 class TcrRequest(models.Model):
-    pdb = models.CharField(max_length=4, choices=PDB_CHOICES, blank=False)
+    pdb = models.CharField(max_length=4, choices=pdb_choices, blank=False)
     action1 = models.CharField(max_length=50, choices=FUNCTION_CHOICES, blank=False)
     action2 = models.CharField(max_length=50, choices=FUNCTION_CHOICES, blank=False)
     action3 = models.CharField(max_length=50, choices=FUNCTION_CHOICES, blank=False)
+    created = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['pdb', 'id'], name='tcrrequest_pdb_id'),
+            models.Index(fields=['action1'], name='tcrrequest_action1'),
+            models.Index(fields=['action2'], name='tcrrequest_action2'),
+            models.Index(fields=['action3'], name='tcrrequest_action3'),
+        ]
 
     def __str__(self):
         return self.pdb + " " + self.action1
+
+    def usage_keys(self):
+        # (day, pdb, action) of every DailyUsage row this request counts in: all requests and each distinct action
+        day = timezone.localdate(self.created) if timezone.is_aware(self.created) else self.created.date()
+        actions = sorted(set(action for action in (self.action1, self.action2, self.action3)
+                             if action and action != "None"))
+        return [(day, self.pdb, action) for action in [ALL_ACTIONS] + actions]
+
+
+class DailyUsage(models.Model):
+    # Requests per day, PDB and action, kept up to date as requests are logged so usage statistics never scan the
+    # request log
+    day = models.DateField()
+    pdb = models.CharField(max_length=4)
+    action = models.CharField(max_length=50)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['day', 'pdb', 'action'], name='dailyusage_key')]
+        indexes = [models.Index(fields=['day', 'action'], name='dailyusage_day_action')]
+
+    def __str__(self):
+        return "%s %s %s %d" % (self.day, self.pdb, self.action, self.count)
+
+
+def count_usage(requests):
+    # Add requests to the daily usage, one update (or insert) per day, PDB and action
+    counts = Counter(key for each in requests for key in each.usage_keys())
+    with transaction.atomic():
+        for (day, pdb, action), count in sorted(counts.items()):
+            rows = DailyUsage.objects.filter(day=day, pdb=pdb, action=action)
+            if rows.update(count=F('count') + count):
+                continue
+            try:
+                with transaction.atomic():
+                    DailyUsage.objects.create(day=day, pdb=pdb, action=action, count=count)
+            except IntegrityError:  # Inserted by another worker in the meantime
+                rows.update(count=F('count') + count)
+
+
+def log_requests(requests):
+    # Save TcrRequest rows and count them in the daily usage in one transaction
+    with transaction.atomic():
+        TcrRequest.objects.bulk_create(requests)
+        count_usage(requests)
@@ -0,0 +1,86 @@
+import atexit
+import os
+import threading
+
+from django.db import connection, DatabaseError, IntegrityError
+
+from api.models import log_requests
+
+FLUSH_SIZE = 200  # Buffered requests that wake the writer before FLUSH_INTERVAL is up
+FLUSH_INTERVAL = 2.0  # Seconds between writes of the buffer
+MAX_BUFFER = 100000  # Requests kept while the database can't be written, the oldest are dropped past this
+
+_buffer = []
+_lock = threading.Lock()
+_wake = threading.Event()
+_writer = None  # (process ID, thread), a forked worker starts its own writer
+
+
+def log(requests):
+    # Queue unsaved TcrRequest rows, they are written in bulk by a background thread so a request never waits on
+    # the database. Rows keep the time they were made, not the time they are written
+    with _lock:
+        _buffer.extend(requests)
+        full = len(_buffer) >= FLUSH_SIZE
+    _start_writer()
+    if full:
+        _wake.set()
+
+
+def flush():
+    # Write every buffered request in one transaction (rows and daily usage), put them back when the database is
+    # busy or down. Returns the number written
+    with _lock:
+        batch = _buffer[:]
+        del _buffer[:]
+    if not batch:
+        return 0
+    try:
+        log_requests(batch)
+    except IntegrityError:  # A bad row (ex. no PDB), write the others one by one
+        written = 0
+        for each in batch:
+            each.pk = None
+            try:
+                log_requests([each])
+                written += 1
+            except IntegrityError:
+                pass
+        return written
+    except DatabaseError:
+        for each in batch:
+            each.pk = None
+        with _lock:
+            _buffer[:0] = batch
+            del _buffer[:max(0, len(_buffer) - MAX_BUFFER)]
+        return 0
+    return len(batch)
+
+
+def _write_loop():
+    while True:
+        _wake.wait(FLUSH_INTERVAL)
+        _wake.clear()
+        try:
+            flush()
+        except Exception:  # The writer has to outlive any one batch
+            pass
+        connection.close()  # Connections are per thread, don't hold one between writes
+
+
+def _start_writer():
+    global _writer
+    if _writer is not None and _writer[0] == os.getpid():
+        return
+    with _lock:
+        if _writer is None or _writer[0] != os.getpid():
+            thread = threading.Thread(target=_write_loop, name="request-log", daemon=True)
+            _writer = (os.getpid(), thread)
+            thread.start()
+
+
+@atexit.register
+def _flush_on_exit():
+    # Workers shut down by the server (SIGTERM, max requests) exit normally, write what is left
+    if _buffer and _writer is not None and _writer[0] == os.getpid():
+        flush()
@@ -1,13 +1,17 @@
 from rest_framework import serializers
-from api.models import TcrRequest, PDB_CHOICES, FUNCTION_CHOICES
+from api.models import TcrRequest, pdb_choices, FUNCTION_CHOICES
 
 class TcrRequestSerializer(serializers.Serializer):
     id = serializers.IntegerField(read_only=True)
-    pdb = serializers.ChoiceField(choices=PDB_CHOICES, default="python")
+    pdb = serializers.ChoiceField(choices=[], default="python")  # Filled in __init__, see pdb_choices()
     action1 = serializers.ChoiceField(choices=FUNCTION_CHOICES, default="python")
     action2 = serializers.ChoiceField(choices=FUNCTION_CHOICES, default="python")
     action3 = serializers.ChoiceField(choices=FUNCTION_CHOICES, default="python")
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['pdb'].choices = pdb_choices()
+
     def create(self, validated_data):
         return TcrRequest.objects.create(**validated_data)
 
@@ -1,3 +1,151 @@
+import datetime
+import json
+import os
+import tempfile
+from unittest import mock
+
+from django.contrib.auth import get_user_model
 from django.test import TestCase
+from django.utils import timezone
+
+from api.models import ALL_ACTIONS, DailyUsage, TcrRequest, log_requests
+from PDBS.process_pdb_request import MAX_BATCH
+
+
+class PdbListTest(TestCase):
+    def test_ids_without_parameters(self):
+        response = self.client.get('/api/pdbs')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('1ao7', response.json())
+
+    def test_summary_page(self):
+        response = self.client.get('/api/pdbs', {'q': '1ao', 'size': 2, 'fields': 'pdb,resolution'})
+        self.assertEqual(response.status_code, 200)
+        page = response.json()
+        self.assertEqual((page['page'], page['size']), (1, 2))
+        self.assertLessEqual(len(page['results']), 2)
+        self.assertTrue(all(sorted(row) == ['pdb', 'resolution'] and row['pdb'].startswith('1ao')
+                            for row in page['results']))
+
+    def test_bad_date(self):
+        for date in ('2010-3', 'last year'):
+            self.assertEqual(self.client.get('/api/pdbs', {'date': date}).status_code, 400, date)
+
+    def test_not_modified(self):
+        first = self.client.get('/api/pdbs', {'mhc_type': 'MH1'})
+        again = self.client.get('/api/pdbs', {'mhc_type': 'MH1'}, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual((again.status_code, again['ETag']), (304, first['ETag']))
+
+
+class TcrRequestPagesTest(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        for pos, pdb in enumerate(['1ao7', '2vlk', '1ao7', '1bd2', '1ao7']):
+            TcrRequest.objects.create(pdb=pdb, action1='center', action2='None', action3='None',
+                                      created=now - datetime.timedelta(days=4 - pos))
+
+    def rows(self, response):
+        return json.loads(response.content)  # Served as content type 'json', which the test client does not decode
+
+    def ids(self, response):
+        return [row['pk'] for row in self.rows(response)]
+
+    def test_pages(self):
+        first = self.client.get('/api/tcrrequest', {'size': 2})
+        self.assertEqual(first.status_code, 200)
+        newest = list(TcrRequest.objects.order_by('-id').values_list('id', flat=True))
+        self.assertEqual(self.ids(first), newest[:2])
+        self.assertIn('before=%d' % newest[1], first['Link'])
+        second = self.client.get('/api/tcrrequest', {'size': 2, 'before': newest[1]})
+        self.assertEqual(self.ids(second), newest[2:4])
+        last = self.client.get('/api/tcrrequest', {'size': 2, 'before': newest[3]})
+        self.assertEqual(self.ids(last), newest[4:])
+        self.assertNotIn('Link', last)
+
+    def test_filters(self):
+        response = self.client.get('/api/tcrrequest', {'pdb': '1AO7'})
+        self.assertEqual(len(self.rows(response)), 3)
+        since = timezone.localdate() - datetime.timedelta(days=1)
+        response = self.client.get('/api/tcrrequest', {'since': since.isoformat()})
+        self.assertEqual(len(self.rows(response)), 2)
+
+    def test_bad_parameters(self):
+        for params in ({'since': '10/2010'}, {'size': 0}, {'size': 'many'}, {'before': 'last'}):
+            self.assertEqual(self.client.get('/api/tcrrequest', params).status_code, 400, params)
+
+
+class UsageStatsTest(TestCase):
+    def setUp(self):
+        day = timezone.now() - datetime.timedelta(days=1)
+        log_requests([TcrRequest(pdb='1ao7', action1='center', action2='split_tcr', action3='None', created=day),
+                      TcrRequest(pdb='1ao7', action1='center', action2='None', action3='None', created=day),
+                      TcrRequest(pdb='2vlk', action1='split_tcr', action2='None', action3='None')])
+        admin = get_user_model().objects.create_user('admin', password='unused', is_staff=True)
+        self.client.force_login(admin)
+
+    def test_admin_only(self):
+        self.client.logout()
+        self.assertIn(self.client.get('/api/usage').status_code, (401, 403))
+
+    def test_aggregates(self):
+        self.assertEqual(DailyUsage.objects.get(pdb='1ao7', action=ALL_ACTIONS).count, 2)
+        response = self.client.get('/api/usage', {'group': 'pdb'})
+        self.assertEqual(response.json(), [{'pdb': '1ao7', 'requests': 2}, {'pdb': '2vlk', 'requests': 1}])
+        response = self.client.get('/api/usage', {'group': 'action', 'pdb': '1AO7'})
+        self.assertEqual(response.json(), [{'action': 'center', 'requests': 2}, {'action': 'split_tcr', 'requests': 1}])
+        response = self.client.get('/api/usage', {'group': 'day', 'since': timezone.localdate().isoformat()})
+        self.assertEqual([row['requests'] for row in response.json()], [1])
+
+    def test_bad_parameters(self):
+        for params in ({'group': 'day,week'}, {'group': ','}, {'since': '2010-3'}, {'top': 'all'}):
+            self.assertEqual(self.client.get('/api/usage', params).status_code, 400, params)
+
+
+class TcrBatchTest(TestCase):
+    def post(self, data):
+        return self.client.post('/api/tcrbatch', data, content_type='application/json')
+
+    def test_actions_not_strings(self):
+        for actions in (5, {"center": True}, ["center", 5], [None, ["center"]]):
+            response = self.post({"pdbs": "1ao7", "actions": actions})
+            self.assertEqual(response.status_code, 400, actions)
+
+    def test_unknown_action(self):
+        response = self.post({"pdbs": "1ao7", "actions": "center,fly"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("fly", response.json())
+
+    def test_bad_pdbs(self):
+        self.assertEqual(self.post({"pdbs": ["1ao7", 5]}).status_code, 400)
+        self.assertEqual(self.post({"pdbs": "not-an-id"}).status_code, 400)
+        self.assertEqual(self.post({}).status_code, 400)
+
+    def test_too_many_pdbs(self):
+        pdbs = ["%d%03d" % (1 + pos // 1000, pos % 1000) for pos in range(MAX_BATCH + 1)]
+        self.assertEqual(self.post({"pdbs": pdbs}).status_code, 400)
+
+    def test_bad_filters(self):
+        self.assertEqual(self.post({"filters": ["mhc_type"]}).status_code, 400)
+        self.assertEqual(self.post({"filters": "{not json"}).status_code, 400)
+        self.assertEqual(self.post({"filters": {"date": "10/2010"}}).status_code, 400)
+
+
+class Cdr3SearchTest(TestCase):
+    def test_missing_seq(self):
+        response = self.client.get('/api/cdr3search')
+        self.assertEqual((response.status_code, response.json()), (400, "Missing seq"))
+
 
-# Create your tests here.
+class TcrRequestListTest(TestCase):
+    def test_logged_pdb_lowercase(self):
+        # The log and daily usage are keyed by lowercase PDB IDs, same as batches
+        with tempfile.NamedTemporaryFile(suffix='.pdb', delete=False) as result:
+            result.write(b"END\n")
+        self.addCleanup(os.remove, result.name)
+        with mock.patch('api.controllers.process_modification', return_value=result.name), \
+                mock.patch('api.controllers.request_log.log') as log:
+            response = self.client.post('/api/tcrrequest', 'pdb=1AO7&action1=center',
+                                        content_type='application/x-www-form-urlencoded')
+            response.close()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row.pdb for row in log.call_args[0][0]], ['1ao7'])
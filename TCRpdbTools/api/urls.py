@@ -14,6 +14,9 @@ urlpatterns = [
     re_path(r'^pdbs', csrf_exempt(controllers.PdbList.as_view())),
     re_path(r'^actions', csrf_exempt(controllers.ActionList.as_view())),
     re_path(r'^fetchpdb', csrf_exempt(controllers.FetchPdb.as_view())),
+    re_path(r'^cdr3search', csrf_exempt(controllers.Cdr3Search.as_view())),
+    re_path(r'^usage', csrf_exempt(controllers.UsageStats.as_view())),
+    re_path(r'^tcrbatch', csrf_exempt(controllers.TcrBatch.as_view())),
     re_path(r'^tcrrequest/(?P<pk>[0-9]+)$', csrf_exempt(controllers.TcrRequestDetail.as_view())),
     re_path(r'^tcrrequest', csrf_exempt(controllers.TcrRequestList.as_view())),
     re_path(r'^', include(router.urls)),